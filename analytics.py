@@ -0,0 +1,258 @@
+"""Social-graph analytics report for Warbler.
+
+Streams `users`, `follows`, `messages` and `likes` into flat NumPy arrays
+(see `columnar.py`) and computes everything vectorized: degree
+distributions, mutual-follow ratios, top accounts and per-user like/message
+ratios. Edges are held as int32 pairs, so tens of millions of rows fit in a
+few hundred MB.
+
+Run it like:
+
+    python analytics.py                        # JSON summary to stdout
+    python analytics.py --json report.json --csv per_user.csv
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from columnar import stream_columns, stream_shard_columns
+from models import db, User, Message
+from sharding import follows, get_router, likes
+
+DEFAULT_TOP_N = 20
+PERCENTILES = (50, 90, 99, 99.9)
+RATIO_BINS = 10
+
+
+def _summary(values):
+    return dict(
+        count=int(len(values)),
+        mean=float(values.mean()),
+        max=values.max().item(),
+        percentiles={str(p): float(v) for p, v
+                     in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+    )
+
+
+def distribution(values):
+    """Summarize a per-user count array: mean, percentiles, max, histogram.
+
+    The histogram uses power-of-two buckets ("0", "1", "2-3", "4-7", ...),
+    which is the useful shape for long-tailed social counts. Counts only:
+    for fractions, see `ratio_distribution`.
+    """
+
+    if not len(values):
+        return dict(count=0)
+
+    summary = _summary(values)
+
+    buckets = np.zeros(len(values), dtype=np.int64)
+    nonzero = values > 0
+    buckets[nonzero] = np.floor(np.log2(values[nonzero])).astype(np.int64) + 1
+    histogram = np.bincount(buckets)
+
+    summary['histogram'] = {
+        ('0' if b == 0 else
+         str(2 ** (b - 1)) if b == 1 else
+         f"{2 ** (b - 1)}-{2 ** b - 1}"): int(n)
+        for b, n in enumerate(histogram) if n
+    }
+
+    return summary
+
+
+def ratio_distribution(values, bins=RATIO_BINS):
+    """Like `distribution`, for non-negative ratios.
+
+    The histogram has `bins` equal buckets over [0, 1] ("0.0-0.1", ...,
+    "0.9-1.0", the last one closed) plus ">1" for anything above.
+    """
+
+    if not len(values):
+        return dict(count=0)
+
+    summary = _summary(values)
+
+    above = values > 1
+    counts, edges = np.histogram(values[~above], bins=bins, range=(0, 1))
+    histogram = {f"{lo:.1f}-{hi:.1f}": int(n)
+                 for lo, hi, n in zip(edges, edges[1:], counts) if n}
+    if above.any():
+        histogram['>1'] = int(above.sum())
+
+    summary['histogram'] = histogram
+
+    return summary
+
+
+def find_sorted(sorted_keys, values):
+    """Binary search `values` in `sorted_keys`.
+
+    Returns (positions, found) where `found` marks values actually present.
+    """
+
+    if not len(sorted_keys):
+        return (np.zeros(len(values), dtype=np.int64),
+                np.zeros(len(values), dtype=bool))
+
+    pos = np.searchsorted(sorted_keys, values)
+    pos[pos == len(sorted_keys)] = 0
+
+    return pos, sorted_keys[pos] == values
+
+
+def mutual_follow_mask(followers, followed):
+    """Return a bool array: True where the edge's reverse edge also exists.
+
+    Edges are packed into sorted int64 keys and the reverse keys looked up
+    with one searchsorted, which is cheaper in memory than np.isin.
+    """
+
+    if not len(followers):
+        return np.zeros(0, dtype=bool)
+
+    width = np.int64(max(followers.max(), followed.max())) + 1
+    keys = followers.astype(np.int64) * width + followed
+    keys.sort()
+
+    reverse = followed.astype(np.int64) * width + followers
+    _, found = find_sorted(keys, reverse)
+
+    return found
+
+
+def safe_ratio(numerator, denominator):
+    """Elementwise numerator / denominator, only where denominator > 0."""
+
+    has = denominator > 0
+    return numerator[has] / denominator[has]
+
+
+def build_report(top_n=DEFAULT_TOP_N):
+    """Load the tables and compute the report.
+
+    Returns (summary dict, per-user columns dict). Per-user arrays are
+    aligned with `per_user['user_id']`.
+    """
+
+    [user_ids] = stream_columns(db.session.query(User.id), (np.int32,))
+    router = get_router()
+    followers, followed = stream_shard_columns(
+        router,
+        (follows.c.user_following_id, follows.c.user_being_followed_id),
+        (np.int32, np.int32))
+    message_ids, authors = stream_columns(
+        db.session.query(Message.id, Message.user_id),
+        (np.int64, np.int32))
+    like_users, like_messages = stream_shard_columns(
+        router, (likes.c.user_id, likes.c.message_id), (np.int32, np.int64))
+
+    size = int(user_ids.max()) + 1 if len(user_ids) else 0
+
+    follower_counts = np.bincount(followed, minlength=size)
+    following_counts = np.bincount(followers, minlength=size)
+    message_counts = np.bincount(authors, minlength=size)
+    likes_given = np.bincount(like_users, minlength=size)
+
+    # Message ids aren't dense, so map liked message -> author by sorting
+    # messages once and binary searching, rather than a giant lookup table.
+    order = np.argsort(message_ids)
+    message_ids, authors = message_ids[order], authors[order]
+    pos, found = find_sorted(message_ids, like_messages)
+    likes_received = np.bincount(authors[pos[found]], minlength=size)
+
+    mutual = mutual_follow_mask(followers, followed)
+    mutual_counts = np.bincount(followers[mutual], minlength=size)
+
+    per_user = dict(
+        user_id=user_ids,
+        followers=follower_counts[user_ids],
+        following=following_counts[user_ids],
+        mutual=mutual_counts[user_ids],
+        messages=message_counts[user_ids],
+        likes_given=likes_given[user_ids],
+        likes_received=likes_received[user_ids],
+    )
+
+    top = np.argsort(-per_user['followers'], kind='stable')[:top_n]
+    top_ids = per_user['user_id'][top].tolist()
+    usernames = dict(db.session
+                     .query(User.id, User.username)
+                     .filter(User.id.in_(top_ids)))
+
+    summary = dict(
+        totals=dict(
+            users=int(len(user_ids)),
+            follows=int(len(followers)),
+            messages=int(len(message_ids)),
+            likes=int(len(like_users)),
+        ),
+        followers=distribution(per_user['followers']),
+        following=distribution(per_user['following']),
+        messages=distribution(per_user['messages']),
+        mutual_follow_ratio=(float(mutual.mean()) if len(mutual) else 0.0),
+        per_user_mutual_ratio=ratio_distribution(
+            safe_ratio(per_user['mutual'], per_user['following'])),
+        likes_received_per_message=ratio_distribution(
+            safe_ratio(per_user['likes_received'], per_user['messages'])),
+        likes_given_per_message=ratio_distribution(
+            safe_ratio(per_user['likes_given'], per_user['messages'])),
+        top_accounts=[
+            dict(user_id=int(user_id),
+                 username=usernames.get(user_id),
+                 followers=int(count))
+            for user_id, count in zip(top_ids,
+                                      per_user['followers'][top].tolist())
+        ],
+    )
+
+    return summary, per_user
+
+
+def write_csv(per_user, out, chunk_size=100000):
+    """Write the per-user columns as CSV, one row per user.
+
+    Rows are converted to Python ints a chunk at a time.
+    """
+
+    columns = list(per_user)
+    writer = csv.writer(out)
+    writer.writerow(columns)
+
+    for start in range(0, len(per_user['user_id']), chunk_size):
+        chunk = (per_user[c][start:start + chunk_size].tolist()
+                 for c in columns)
+        writer.writerows(zip(*chunk))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--json', metavar='PATH',
+                        help="write the summary here instead of stdout")
+    parser.add_argument('--csv', metavar='PATH',
+                        help="also write per-user counts as CSV")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_N)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        summary, per_user = build_report(top_n=args.top)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(summary, out, indent=2)
+    else:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as out:
+            write_csv(per_user, out)
@@ -0,0 +1,205 @@
+"""Batched JSON read API.
+
+    GET  /api/messages?ids=1,2,3&fields=id,text,user.username,likes_count
+    POST /api/users  {"ids": [1, 2, 3], "fields": ["username", "followers_count"]}
+
+Each call resolves up to MAX_IDS ids in one round trip. Only the requested
+columns are selected; the users join and the per-id count queries run only
+when a field needs them. Results come back in request order, with unknown
+ids listed under "missing". Message ids are strings in requests and
+responses alike, since they don't fit in a JavaScript number.
+"""
+
+from flask import Blueprint, g, jsonify, request
+
+from models import db, Message, User
+from ratelimit import rate_limit
+from sharding import get_router
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_IDS = 500
+IN_CHUNK = 500
+
+
+class APIError(Exception):
+    """A bad request; rendered as {"error": message} with a 400."""
+
+
+# name -> column, selected straight from the main table
+MESSAGE_COLUMNS = {
+    'id': Message.id,
+    'text': Message.text,
+    'timestamp': Message.timestamp,
+    'user_id': Message.user_id,
+    'original_message_id': Message.original_message_id,
+    'is_repost': Message.is_repost,
+}
+
+# 64-bit snowflake ids: sent as strings, since JavaScript numbers would
+# round them (see snowflake.py)
+MESSAGE_ID_FIELDS = ('id', 'original_message_id')
+
+# name -> column on the author; any of these adds a join to users
+MESSAGE_USER_COLUMNS = {
+    'user.username': User.username,
+    'user.image_url': User.image_url,
+}
+
+USER_COLUMNS = {
+    'id': User.id,
+    'username': User.username,
+    'image_url': User.image_url,
+    'header_image_url': User.header_image_url,
+    'bio': User.bio,
+    'location': User.location,
+}
+
+
+def _count_by(column, ids, *criteria):
+    """{id: count} for rows whose `column` is in `ids` (one grouped query)."""
+
+    return dict(db.session
+                .query(column, db.func.count())
+                .filter(column.in_(ids), *criteria)
+                .group_by(column))
+
+
+# name -> function(ids) returning {id: value}; one query per requested field
+# (per shard, for the follow/like counts: see sharding.py)
+MESSAGE_COUNTS = {
+    'likes_count': lambda ids: get_router().like_counts(ids),
+    'reposts_count': lambda ids: _count_by(Message.original_message_id, ids,
+                                           Message.is_repost),
+}
+
+USER_COUNTS = {
+    'followers_count': lambda ids: get_router().follower_counts(ids),
+    'following_count': lambda ids: get_router().following_counts(ids),
+    'messages_count': lambda ids: _count_by(Message.user_id, ids),
+}
+
+
+def _arguments():
+    """Read `ids` and `fields` from a JSON body or the querystring."""
+
+    if request.is_json:
+        body = request.get_json()
+        if not isinstance(body, dict):
+            raise APIError("body must be a JSON object")
+        ids, fields = body.get('ids', []), body.get('fields', [])
+
+        # message ids are sent as strings (they don't fit a JS number)
+        if not isinstance(ids, list) or not all(
+                isinstance(i, (int, str)) and not isinstance(i, bool)
+                for i in ids):
+            raise APIError("ids must be a list of integers")
+        if not isinstance(fields, list) or not all(
+                isinstance(f, str) for f in fields):
+            raise APIError("fields must be a list of strings")
+    else:
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        raise APIError("ids must be integers")
+
+    if not ids:
+        raise APIError("no ids given")
+    if len(ids) > MAX_IDS:
+        raise APIError(f"at most {MAX_IDS} ids per request")
+
+    return list(dict.fromkeys(ids)), fields
+
+
+def _resolve(ids, fields, columns, joined, counts, default_fields, load):
+    """Fetch `fields` for `ids`; shared by the messages and users endpoints.
+
+    `load(selected_columns, join_needed, chunk)` runs the batched query.
+    Returns (rows in request order, missing ids).
+    """
+
+    # id always comes back, so clients can key the results
+    fields = ['id'] + [f for f in (fields or default_fields) if f != 'id']
+    unknown = [f for f in fields
+               if f not in columns and f not in joined and f not in counts]
+    if unknown:
+        raise APIError(f"unknown fields: {', '.join(unknown)}")
+
+    selected = [f for f in fields if f in columns or f in joined]
+    select_columns = [columns.get(f, joined.get(f)) for f in selected]
+    join_needed = any(f in joined for f in selected)
+
+    found = {}
+    for start in range(0, len(ids), IN_CHUNK):
+        chunk = ids[start:start + IN_CHUNK]
+        for row in load(select_columns, join_needed, chunk):
+            found[row[0]] = dict(zip(selected, row))
+
+    present = list(found)
+    for name in fields:
+        if name in counts:
+            values = counts[name](present) if present else {}
+            for id_, item in found.items():
+                item[name] = values.get(id_, 0)
+
+    rows = [{f: found[id_][f] for f in fields} for id_ in ids if id_ in found]
+    missing = [id_ for id_ in ids if id_ not in found]
+    return rows, missing
+
+
+def _load_messages(select_columns, join_needed, chunk):
+    query = db.session.query(*select_columns).filter(Message.id.in_(chunk))
+    if join_needed:
+        query = query.join(User, User.id == Message.user_id)
+    return query
+
+
+def _load_users(select_columns, join_needed, chunk):
+    return db.session.query(*select_columns).filter(User.id.in_(chunk))
+
+
+@api.errorhandler(APIError)
+def bad_request(err):
+    return jsonify(error=str(err)), 400
+
+
+@api.before_request
+def require_login():
+    if not g.user:
+        return jsonify(error="login required"), 401
+
+
+@api.route('/messages', methods=['GET', 'POST'])
+@rate_limit('api')
+def messages():
+    """Fields for a batch of messages."""
+
+    ids, fields = _arguments()
+    rows, missing = _resolve(
+        ids, fields, MESSAGE_COLUMNS, MESSAGE_USER_COLUMNS, MESSAGE_COUNTS,
+        default_fields=['id', 'text', 'timestamp', 'user_id'],
+        load=_load_messages)
+
+    for row in rows:
+        for name in MESSAGE_ID_FIELDS:
+            if row.get(name) is not None:
+                row[name] = str(row[name])
+
+    return jsonify(messages=rows, missing=[str(id_) for id_ in missing])
+
+
+@api.route('/users', methods=['GET', 'POST'])
+@rate_limit('api')
+def users():
+    """Fields for a batch of users."""
+
+    ids, fields = _arguments()
+    rows, missing = _resolve(
+        ids, fields, USER_COLUMNS, {}, USER_COUNTS,
+        default_fields=['id', 'username', 'image_url'],
+        load=_load_users)
+
+    return jsonify(users=rows, missing=missing)
@@ -1,36 +1,104 @@
 import os
-import pdb
+from datetime import datetime, timedelta
 
-from flask import Flask, render_template, request, flash, redirect, session, g, url_for, request
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import Blueprint, Flask, current_app, jsonify, render_template, request, flash, redirect, session, g, url_for, request, Response, send_file, abort, stream_with_context
 from sqlalchemy.exc import IntegrityError
-
+from sqlalchemy.orm import configure_mappers
+
+from api import api
+from assets import init_assets
+from bloom import get_taken_names
+from config import get_config
+from events import event_stream, publish_message, publish_like_count
+from exports import content_type, export_chunks, export_user_command, parse_export_name
+from notifications import notifications_page, notify_follow, notify_like, retract_follow, retract_like
+from partitions import archived_message, partitions_command
+from images import VARIANTS, IMMUTABLE, ImageSourceError, best_format, source_from_token, variant_path, variant_url
 from forms import UserAddForm, LoginForm, MessageForm, UserEditForm
-from models import db, connect_db, User, Message, Likes
+from threads import load_thread
+from readmodels import message_card, message_cards, message_query, user_card, user_cards, user_cards_by_ids, user_profile
+from ratelimit import init_rate_limiting, rate_limit
+from templating import configure_templates, warm_templates
+from models import db, connect_db, User, Message, FollowSuggestion
+from sharding import get_router
+from snowflake import id_floor, timestamp_of
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+TIMELINE_PAGE = 100
+
+bp = Blueprint('warbler', __name__)
+
+
+def create_app(config=None):
+    """Create and configure a Warbler app.
+
+    `config` is a profile name from config.py ('development', 'production',
+    'testing') or a config class; by default it comes from the environment.
+    Nothing touches the database here: connections open on first query.
+    """
+
+    config = get_config(config)
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config.update(config.from_env())
+
+    if not app.config['IMAGE_CACHE_DIR']:
+        app.config['IMAGE_CACHE_DIR'] = os.path.join(app.instance_path,
+                                                     'image-cache')
+
+    if not app.config['ARCHIVE_DIR']:
+        app.config['ARCHIVE_DIR'] = os.path.join(app.instance_path, 'archive')
+
+    if not app.config['ASSETS_DIST_DIR']:
+        app.config['ASSETS_DIST_DIR'] = os.path.join(app.static_folder, 'dist')
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgresql:///warbler'))
+    if app.config['TEMPLATE_BYTECODE_DIR'] is None:
+        app.config['TEMPLATE_BYTECODE_DIR'] = os.path.join(app.instance_path,
+                                                           'jinja-bytecode')
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
+    if app.config['DEBUG_TOOLBAR']:
+        # debug-only: keep the toolbar (and its imports) out of production
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
 
-connect_db(app)
+    # before anything builds app.jinja_env
+    configure_templates(app)
+
+    connect_db(app)
+    app.add_template_filter(variant_url, 'variant')
+    init_assets(app)
+    # before the blueprint, so load shedding runs ahead of its DB hooks
+    init_rate_limiting(app)
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+    app.cli.add_command(export_user_command)
+    app.cli.add_command(partitions_command)
+
+    return app
+
+
+def warm_up(app):
+    """Do the lazy first-request work now: mappers and templates.
+
+    Templates are compiled (or read from the bytecode cache) and rendered
+    once; see templating.warm_templates.
+
+    Call this before forking workers (gunicorn --preload) so every worker
+    starts with the work already done, in copy-on-write memory. It doesn't
+    open any database connections, which mustn't be shared across a fork.
+    """
+
+    configure_mappers()
+    warm_templates(app)
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@bp.before_app_request
 def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
@@ -54,7 +122,8 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@bp.route('/signup', methods=["GET", "POST"])
+@rate_limit('signup')
 def signup():
     """Handle user signup.
 
@@ -69,6 +138,12 @@ def signup():
     form = UserAddForm()
 
     if form.validate_on_submit():
+        # before bcrypt: most duplicates never cost a hash
+        taken = get_taken_names().taken(form.username.data, form.email.data)
+        if taken:
+            flash(taken_message(taken), 'danger')
+            return render_template('users/signup.html', form=form)
+
         try:
             user = User.signup(
                 username=form.username.data,
@@ -79,9 +154,11 @@ def signup():
             db.session.commit()
 
         except IntegrityError:
+            db.session.rollback()
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
+        get_taken_names().add(user.username, user.email)
         do_login(user)
 
         return redirect("/")
@@ -90,7 +167,35 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/users/available')
+@rate_limit('availability')
+def availability():
+    """JSON: is the `username` in the querystring free?
+
+    For live checks on the signup and profile forms. Answers from the
+    Bloom filters when they can, so most calls don't touch the database.
+    Emails are never answered here, even for logged-in users: that would
+    tell anyone with an account which addresses have one too. They're only
+    checked on submit.
+    """
+
+    username = request.args.get('username')
+    if not username:
+        return jsonify({})
+
+    taken = get_taken_names().taken(
+        username, exclude_user_id=g.user.id if g.user else None)
+    return jsonify(username='username' not in taken)
+
+
+def taken_message(taken):
+    """"Username already taken", "Email and username already taken", ..."""
+
+    return f"{' and '.join(sorted(taken)).capitalize()} already taken"
+
+
+@bp.route('/login', methods=["GET", "POST"])
+@rate_limit('login')
 def login():
     """Handle user login."""
 
@@ -110,7 +215,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Handle logout of user."""
 
@@ -125,7 +230,7 @@ def logout():
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+@bp.route('/users')
 def list_users():
     """Page with listing of users.
 
@@ -135,31 +240,37 @@ def list_users():
     search = request.args.get('q')
 
     if not search:
-        users = User.query.all()
+        users = user_cards()
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        users = user_cards(User.username.like(f"%{search}%"))
 
     return render_template('users/index.html', users=users)
 
 
-@app.route('/users/<int:user_id>')
+@bp.route('/users/<int:user_id>')
 def users_show(user_id):
     """Show user profile."""
 
-    user = User.query.get_or_404(user_id)
+    user = user_profile(user_id)
+    if user is None:
+        abort(404)
 
     # snagging messages in order from the database;
     # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    return render_template('users/show.html', user=user, messages=messages)
-
-
-@app.route('/users/<int:user_id>/following')
+    rows, next_before = timeline_page(
+        message_query(Message.user_id == user_id),
+        before=request.args.get('before', type=int))
+    messages = message_cards(rows)
+    router = get_router()
+    liked_ids = set(router.liked_message_ids(user_id))
+    # reposts show (and like) the original
+    like_counts = router.like_counts({msg.content.id for msg in messages})
+    return render_template('users/show.html', user=user, messages=messages,
+                           next_before=next_before, liked_ids=liked_ids,
+                           like_counts=like_counts)
+
+
+@bp.route('/users/<int:user_id>/following')
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -167,11 +278,15 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    user = user_profile(user_id)
+    if user is None:
+        abort(404)
 
+    following = user_cards_by_ids(get_router().following_ids(user_id))
+    return render_template('users/following.html', user=user, following=following)
 
-@app.route('/users/<int:user_id>/followers')
+
+@bp.route('/users/<int:user_id>/followers')
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -179,11 +294,15 @@ def users_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    user = user_profile(user_id)
+    if user is None:
+        abort(404)
+
+    followers = user_cards_by_ids(get_router().follower_ids(user_id))
+    return render_template('users/followers.html', user=user, followers=followers)
 
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+@bp.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -192,13 +311,13 @@ def add_follow(follow_id):
         return redirect("/")
 
     followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
-    db.session.commit()
+    if get_router().follow(g.user.id, followed_user.id):
+        notify_follow(g.user, followed_user)
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@bp.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -206,14 +325,14 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
-    db.session.commit()
+    followed_user = User.query.get_or_404(follow_id)
+    if get_router().unfollow(g.user.id, followed_user.id):
+        retract_follow(g.user, followed_user)
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@bp.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -228,11 +347,17 @@ def profile():
     warbles_count = user.warbles_count
     
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data,
+        # password first, so the taken check can't be used to probe names
+        user = User.authenticate(g.user.username,
                                  form.password.data)
 
         if user:
-        
+            taken = get_taken_names().taken(form.username.data, form.email.data,
+                                            exclude_user_id=g.user.id)
+            if taken:
+                flash(taken_message(taken), 'danger')
+                return render_template('users/edit.html', form=form, warbles_count=warbles_count)
+
             user.username = form.username.data
             user.email = form.email.data
             user.image_url = form.image_url.data
@@ -240,6 +365,7 @@ def profile():
             user.bio = form.bio.data
 
             db.session.commit()
+            get_taken_names().add(user.username, user.email)
             flash('Profile updated!', 'success')
             return redirect(f"/users/{g.user.id}")
         else:
@@ -248,7 +374,8 @@ def profile():
     return render_template('users/edit.html', form=form, warbles_count=warbles_count)
     
 
-@app.route('/users/add_like/<int:message_id>', methods=["POST"])
+@bp.route('/users/add_like/<int:message_id>', methods=["POST"])
+@rate_limit('likes')
 def add_like(message_id):
     """Add a like to a message."""
 
@@ -266,34 +393,83 @@ def add_like(message_id):
         flash("You can't like your own message.", "danger")
         return redirect(request.referrer)
 
-    like = Likes.query.filter_by(user_id=g.user.id, message_id=msg.id).first()
+    shards = get_router()
 
-    if like:
-        g.user.likes.remove(msg)
-        like.increment_liked()  # Call increment_liked method
-        db.session.commit()
+    if shards.unlike(g.user.id, msg.id):
+        retract_like(g.user, msg)
         flash('Message unliked.', 'danger')
     else:
-        g.user.likes.append(msg)
-        like = Likes(user_id=g.user.id, message_id=msg.id)
-        like.increment_likes(g.user)  # Call increment_likes method
-        db.session.commit()
+        if shards.like(g.user.id, msg.id):
+            notify_like(g.user, msg)
         flash('Message liked!', 'success')
 
+    publish_like_count(msg)
+
     return redirect(request.referrer)
 
 
-@app.route('/users/<int:user_id>/liked')
+@bp.route('/users/<int:user_id>/liked')
 def liked(user_id):
     """Show liked messages for a specific user."""
 
-    liked_user = User.query.get(user_id)
-    liked_messages = liked_user.likes
+    liked_user = user_card(user_id)
+    if liked_user is None:
+        abort(404)
+
+    liked_messages = message_cards(
+        message_query(Message.id.in_(get_router().liked_message_ids(user_id)))
+        .order_by(Message.id.desc()))
 
     return render_template('messages/liked.html', liked_messages=liked_messages, liked_user=liked_user, message=Message)
 
 
-@app.route('/users/delete', methods=["POST"])
+@bp.route('/notifications')
+def notifications():
+    """Show likes and follows for the current user, newest first.
+
+    Takes a 'before' param in querystring: the cursor of the previous page.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/login")
+
+    rollups, next_before = notifications_page(
+        g.user.id, before=request.args.get('before'))
+
+    return render_template('users/notifications.html',
+                           notifications=rollups, next_before=next_before)
+
+
+@bp.route('/users/export/<filename>')
+@rate_limit('export')
+def export_data(filename):
+    """Download the current user's messages, likes or follows.
+
+    `filename` is <kind>.<format>[.gz], e.g. messages.ndjson or likes.csv.gz.
+    The file is streamed straight from a server-side cursor.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/login")
+
+    parsed = parse_export_name(filename)
+
+    if parsed is None:
+        abort(404)
+
+    kind, fmt, compress = parsed
+    chunks = export_chunks(g.user.id, kind, fmt, compress)
+
+    headers = {'Content-Disposition': f'attachment; filename="warbler-{kind}.{fmt}{".gz" if compress else ""}"'}
+
+    return Response(stream_with_context(chunks),
+                    mimetype='application/gzip' if compress else content_type(fmt),
+                    headers=headers)
+
+
+@bp.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -303,18 +479,26 @@ def delete_user():
 
     do_logout()
 
-    Message.query.filter_by(user_id=g.user.id).delete()
+    user_id = g.user.id
+    message_ids = [id_ for (id_,) in
+                   db.session.query(Message.id).filter_by(user_id=user_id)]
+
+    Message.query.filter_by(user_id=user_id).delete()
 
     db.session.delete(g.user)
     db.session.commit()
 
+    # edges on the shards have no foreign keys to cascade from users
+    get_router().purge_user(user_id, message_ids)
+
     return redirect("/")
 
 
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
+@rate_limit('messages_add')
 def messages_add():
     """Add a message:
 
@@ -332,6 +516,8 @@ def messages_add():
         g.user.messages.append(msg)
         db.session.commit()
 
+        publish_message(msg)
+
         return redirect(f'/users/{g.user.id}')
     
     g.user.increment_warbles_count()
@@ -339,7 +525,7 @@ def messages_add():
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+@bp.route('/messages/<int:message_id>', methods=["GET"])
 def messages_show(message_id):
     """Show a message."""
 
@@ -347,24 +533,109 @@ def messages_show(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
-    msg = Message.query.get(message_id)
+    msg = message_card(message_id)
 
-    liked = False
+    if not msg:
+        # old months live in cold storage; see partitions.py
+        msg = archived_message(message_id)
+        if not msg:
+            return render_template('404.html'), 404
 
-    if g.user:
-        liked = g.user.has_liked_message(msg)
+    if msg.is_repost:
+        return redirect(url_for('warbler.messages_show', message_id=msg.original_message_id))
 
-    if not msg:
-        return render_template('404.html'), 404
-    
-    like_count = len(msg.likes)
+    archived = getattr(msg, 'archived', False)
+
+    if archived:
+        liked = g.user.id in msg.liked_by
+        like_count = len(msg.liked_by)
+    else:
+        liked = g.user.has_liked_message(msg)
+        like_count = get_router().like_counts([msg.id])[msg.id]
 
     user = msg.user
 
-    return render_template('messages/show.html', message=msg, liked=liked, like_count=like_count, user=user)
+    return render_template('messages/show.html', message=msg, liked=liked, like_count=like_count, user=user,
+                           archived=archived)
+
+
+@bp.route('/messages/<int:message_id>/thread')
+def messages_thread(message_id):
+    """Show a message with a page of its reply tree.
 
+    Takes an 'after' param in querystring: the last top-level reply id of
+    the previous page.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/login")
 
-@app.route('/messages/<int:message_id>/like', methods=["POST"])
+    msg = message_card(message_id)
+    if msg is None:
+        abort(404)
+
+    if msg.is_repost:
+        return redirect(url_for('warbler.messages_thread', message_id=msg.original_message_id))
+
+    after = request.args.get('after', 0, type=int)
+    page = load_thread(msg.id, after=after)
+
+    return render_template('messages/thread.html', message=msg, page=page, form=MessageForm())
+
+
+@bp.route('/messages/<int:message_id>/reply', methods=["POST"])
+@rate_limit('messages_add')
+def messages_reply(message_id):
+    """Reply to a message."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/login")
+
+    parent = Message.query.get_or_404(message_id)
+    parent = parent.content
+
+    form = MessageForm()
+
+    if form.validate_on_submit():
+        reply = Message(text=form.text.data, original_message_id=parent.id)
+        g.user.messages.append(reply)
+        db.session.commit()
+
+        publish_message(reply)
+    else:
+        flash("Your reply can't be empty.", 'danger')
+
+    return redirect(url_for('warbler.messages_thread', message_id=parent.id))
+
+
+@bp.route('/messages/<int:message_id>/repost', methods=["POST"])
+@rate_limit('messages_add')
+def messages_repost(message_id):
+    """Repost a message to the current user's followers."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/login")
+
+    msg = Message.query.get_or_404(message_id)
+
+    if msg.content.user_id == g.user.id:
+        flash("You can't repost your own message.", "danger")
+        return redirect(request.referrer or '/')
+
+    repost = Message.repost(g.user, msg)
+    db.session.commit()
+
+    publish_message(repost)
+    flash('Reposted!', 'success')
+
+    return redirect(request.referrer or '/')
+
+
+@bp.route('/messages/<int:message_id>/like', methods=["POST"])
+@rate_limit('likes')
 def messages_like(message_id):
     """Like or unlike a message."""
 
@@ -382,36 +653,38 @@ def messages_like(message_id):
         flash("You can't like your own message.", "danger")
         return redirect(f'/messages/{message_id}')
 
-    if msg in g.user.likes:
-        g.user.likes.remove(msg)
-        db.session.commit()
+    shards = get_router()
+
+    if shards.unlike(g.user.id, msg.id):
+        retract_like(g.user, msg)
         flash('Message unliked.', 'danger')
     else:
-        g.user.likes.append(msg)
-        db.session.commit()
+        if shards.like(g.user.id, msg.id):
+            notify_like(g.user, msg)
         flash('Message liked!', 'success')
 
-    likes = g.user.likes
-    user = User.query.get(g.user.id)
-    message = Message.query.get(message_id)
-    
-    return render_template('messages/likes.html', likes=likes, user=user, message=message, User=User)
+    publish_like_count(msg)
+
+    users = user_cards_by_ids(shards.liker_ids(msg.id))
+
+    return render_template('messages/likes.html', users=users, message=msg)
 
-@app.route('/messages/<int:message_id>/likes')
+@bp.route('/messages/<int:message_id>/likes')
 def message_likes(message_id):
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/login")
 
-    message = Message.query.get(message_id)
-    likes = message.likes
-    user_ids = [like.user_id for like in likes]
-    users = User.query.filter(User.id.in_(user_ids)).all()
+    message = message_card(message_id)
+    if message is None:
+        abort(404)
 
-    return render_template('messages/likes.html', message=message, likes=likes, users=users)
+    users = user_cards_by_ids(get_router().liker_ids(message.id))
 
+    return render_template('messages/likes.html', message=message, users=users)
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+
+@bp.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -420,20 +693,72 @@ def messages_destroy(message_id):
         return redirect("/")
 
     msg = Message.query.get(message_id)
-    
+
+    if msg is None or msg.user_id != g.user.id:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
     db.session.delete(msg)
+    g.user.decrement_warbles_count()
     db.session.commit()
 
-    user.decrement_warbles_count()
+    get_router().purge_message(message_id)
 
     return redirect(f'/users/{g.user.id}')
 
 
 
+##############################################################################
+# Live updates
+
+@bp.route('/stream')
+def stream():
+    """Server-Sent Events stream of new messages and like counts.
+
+    The DB session is released before streaming starts, so an idle stream
+    holds no connection from the pool.
+    """
+
+    if not g.user:
+        return Response(status=401)
+
+    user_id = g.user.id
+    db.session.remove()
+
+    return Response(event_stream(user_id),
+                    mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+##############################################################################
+# Image variants
+
+@bp.route('/images/<variant>/<token>')
+def image_variant(variant, token):
+    """Serve a resized avatar/header image, rendering it on first request."""
+
+    source = source_from_token(token)
+
+    if variant not in VARIANTS or source is None:
+        abort(404)
+
+    fmt = best_format(request.headers.get('Accept'))
+
+    try:
+        path = variant_path(source, variant, fmt)
+    except ImageSourceError:
+        abort(404)
+
+    resp = send_file(path, mimetype=f'image/{fmt}', conditional=True)
+    resp.headers['Cache-Control'] = IMMUTABLE
+    resp.headers['Vary'] = 'Accept'
+    return resp
+
+
 ##############################################################################
 # Warble Likes?
 
-@app.route('/warble_like', methods=["POST"])
+@bp.route('/warble_like', methods=["POST"])
 def like_warble():
     user_id = request.form.get('user_id')
     warble_id = request.form.get('warble_id')
@@ -448,7 +773,7 @@ def like_warble():
 
     return 'Warble Liked'
 
-@app.route('/unlike_warble', methods=['POST'])
+@bp.route('/unlike_warble', methods=['POST'])
 def unlike_warble():
     user_id = request.form.get('user_id')
     warble_id = request.form.get('warble_id')
@@ -468,30 +793,93 @@ def unlike_warble():
 # Homepage and error pages
 
 
-@app.route('/')
+@bp.route('/')
 def homepage():
     """Show homepage:dc1sx
 
     - anon users: no messages
     - logged in: 100 most recent messages of followed_users
+
+    Takes a 'before' param in querystring: the last message id of the
+    previous page.
     """
 
     if g.user:
-        messages = (Message
-                    .query
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        rows, next_before = timeline_page(
+            message_query(), before=request.args.get('before', type=int))
+        messages = message_cards(rows)
 
-        liked_messages = [msg.id for msg in g.user.likes]
+        liked_messages = set(get_router().liked_message_ids(g.user.id))
 
-        return render_template('home.html', messages=messages, liked_messages=liked_messages)
+        suggestions = follow_suggestions(g.user.id)
+
+        return render_template('home.html', messages=messages, liked_messages=liked_messages,
+                               suggestions=suggestions, next_before=next_before)
 
     else:
         return render_template('home-anon.html')
 
 
-@app.errorhandler(404)
+def timeline_page(query, before=None, per_page=TIMELINE_PAGE):
+    """One page of `query`'s messages, newest first.
+
+    Message ids are time-ordered, so this is a primary key range scan with
+    `before` (exclusive) as the cursor. Returns (messages, next_before),
+    with next_before None on the last page.
+
+    The first try only looks TIMELINE_WINDOW_DAYS back from the cursor, an
+    id range Postgres can prune to the newest partitions; only a short page
+    goes on to read older ones.
+    """
+
+    if before:
+        query = query.filter(Message.id < before)
+
+    newest = timestamp_of(before) if before else datetime.utcnow()
+    floor = id_floor(newest - timedelta(
+        days=current_app.config['TIMELINE_WINDOW_DAYS']))
+
+    messages = (query
+                .filter(Message.id >= floor)
+                .order_by(Message.id.desc())
+                .limit(per_page)
+                .all())
+
+    if len(messages) < per_page:
+        messages += (query
+                     .filter(Message.id < floor)
+                     .order_by(Message.id.desc())
+                     .limit(per_page - len(messages))
+                     .all())
+
+    next_before = messages[-1].id if len(messages) == per_page else None
+
+    return messages, next_before
+
+
+def follow_suggestions(user_id):
+    """Precomputed "who to follow" rows for the homepage sidebar.
+
+    Reads `follow_suggestions` by its primary key; anyone followed since the
+    batch job last ran is filtered out here.
+    """
+
+    rows = (db.session
+            .query(User.id, User.username, User.image_url,
+                   FollowSuggestion.mutual_count)
+            .join(FollowSuggestion, FollowSuggestion.suggested_user_id == User.id)
+            .filter(FollowSuggestion.user_id == user_id)
+            .order_by(FollowSuggestion.rank)
+            .all())
+
+    if not rows:
+        return rows
+
+    already_following = set(get_router().following_ids(user_id))
+    return [row for row in rows if row.id not in already_following]
+
+
+@bp.app_errorhandler(404)
 def page_not_found(e):
     """Show 404 NOT FOUND page."""
 
@@ -504,10 +892,14 @@ def page_not_found(e):
 #
 # https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
 
-@app.after_request
+@bp.after_app_request
 def add_header(req):
     """Add non-caching headers on every request."""
 
+    # content-addressed responses (image variants) keep their long-lived caching
+    if 'immutable' in req.headers.get('Cache-Control', ''):
+        return req
+
     req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     req.headers["Pragma"] = "no-cache"
     req.headers["Expires"] = "0"
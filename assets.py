@@ -0,0 +1,198 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies every file under static/ into static/dist/
+with a content hash in its name (style.css -> style.3f9a1c0b2d4e.css),
+plus .gz and, when the optional `brotli` package is installed, .br copies
+of anything that compresses. url("/static/...") references inside
+stylesheets are rewritten to the hashed names first, so a changed image
+changes the hash of the CSS that uses it. The mapping goes in
+static/dist/manifest.json.
+
+At startup `init_assets` reads the manifest once. Templates call
+`asset_url('stylesheets/style.css')`, which returns /assets/<hashed name>;
+that route serves the best precompressed copy the client accepts, marked
+immutable for a year, since a new build means new names. Without a
+manifest (development) `asset_url` falls back to plain /static/ URLs.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+from flask.cli import with_appcontext
+
+from images import IMMUTABLE
+
+HASH_LENGTH = 12
+
+# already-compressed formats aren't worth a second copy
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.json', '.html')
+
+# preference order when the client accepts several
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)/static/([^'")]+)\1\s*\)''')
+
+
+def _brotli():
+    try:
+        import brotli  # optional dependency
+    except ImportError:
+        return None
+    return brotli
+
+
+def source_files(static_dir, dist_dir):
+    """Relative paths of everything under `static_dir` except the build."""
+
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs
+                         if os.path.join(root, d) != dist_dir)
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), static_dir)
+
+
+def hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+def compressed_copies(content, ext):
+    """{encoding: bytes} for the encodings that make `content` smaller."""
+
+    if ext not in COMPRESSIBLE:
+        return {}
+
+    copies = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    brotli = _brotli()
+    if brotli is not None:
+        copies['br'] = brotli.compress(content, quality=11)
+
+    return {encoding: data for encoding, data in copies.items()
+            if len(data) < len(content)}
+
+
+def build(static_dir, dist_dir):
+    """Write fingerprinted and compressed copies; return the manifest.
+
+    Stylesheets go last, so their url() references can be rewritten to
+    names that already exist.
+    """
+
+    paths = sorted(source_files(static_dir, dist_dir),
+                   key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    for path in paths:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+
+        if path.endswith('.css'):
+            def rewrite(match):
+                entry = manifest.get(match.group(2))
+                if entry is None:
+                    return match.group(0)
+                return f"url({match.group(1)}/assets/{entry['path']}{match.group(1)})"
+
+            content = CSS_URL.sub(rewrite, content.decode()).encode()
+
+        name = hashed_name(path, content)
+        target = os.path.join(dist_dir, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+
+        copies = compressed_copies(content, os.path.splitext(path)[1])
+        for encoding, suffix in ENCODINGS:
+            if encoding in copies:
+                with open(target + suffix, 'wb') as f:
+                    f.write(copies[encoding])
+
+        manifest[path] = dict(path=name, encodings=sorted(copies))
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest(dist_dir):
+    """The manifest from the last build, or None if there hasn't been one."""
+
+    try:
+        with open(os.path.join(dist_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def asset_url(path):
+    """URL for static file `path`: hashed when built, plain otherwise."""
+
+    assets = current_app.extensions['assets']
+    entry = assets['manifest'].get(path)
+    if entry is None:
+        return url_for('static', filename=path)
+    return url_for('serve_asset', filename=entry['path'])
+
+
+def init_assets(app):
+    """Load the manifest and register `asset_url` and the /assets route."""
+
+    dist_dir = app.config['ASSETS_DIST_DIR']
+    manifest = load_manifest(dist_dir) or {}
+
+    # hashed name -> (content type, encodings available)
+    served = {
+        entry['path']: (mimetypes.guess_type(path)[0]
+                        or 'application/octet-stream',
+                        entry['encodings'])
+        for path, entry in manifest.items()
+    }
+
+    app.extensions['assets'] = dict(manifest=manifest, served=served)
+    app.add_template_global(asset_url)
+    app.cli.add_command(build_assets_command)
+
+    @app.route('/assets/<path:filename>')
+    def serve_asset(filename):
+        if filename not in served:
+            abort(404)
+
+        mimetype, encodings = served[filename]
+        accepted = request.accept_encodings
+
+        path, encoding = filename, None
+        for name, suffix in ENCODINGS:
+            if name in encodings and accepted[name]:
+                path, encoding = filename + suffix, name
+                break
+
+        resp = send_file(os.path.join(dist_dir, path), mimetype=mimetype,
+                         conditional=True)
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        resp.headers['Vary'] = 'Accept-Encoding'
+        resp.headers['Cache-Control'] = IMMUTABLE
+        return resp
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress static files into ASSETS_DIST_DIR."""
+
+    manifest = build(current_app.static_folder,
+                     current_app.config['ASSETS_DIST_DIR'])
+    for path, entry in sorted(manifest.items()):
+        encodings = ', '.join(entry['encodings']) or '-'
+        click.echo(f"{path} -> {entry['path']}  ({encodings})")
+
+    if _brotli() is None:
+        click.echo("brotli not installed: wrote gzip copies only")
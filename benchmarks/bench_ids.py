@@ -0,0 +1,167 @@
+"""Message id benchmark: serial ids + timestamp indexes vs snowflake ids.
+
+Builds two scratch tables shaped like `messages`:
+
+- serial:    SERIAL id, timelines ordered by timestamp, so it needs
+             (timestamp) and (user_id, timestamp) indexes
+- snowflake: BIGINT id from snowflake.py, timelines ordered by id, so the
+             primary key and (user_id, id) are enough
+
+and times bulk inserts, then the timeline reads: newest page, a user's
+newest page, and walking back PAGES pages with a cursor. On Postgres it
+also reports table + index sizes.
+
+Run it like:
+
+    python benchmarks/bench_ids.py
+    python benchmarks/bench_ids.py --rows 1000000 --url postgresql:///warbler-bench
+
+The tables are dropped afterwards.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import (BigInteger, Column, DateTime, Index, Integer,
+                        MetaData, String, Table, create_engine, select, text)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snowflake  # noqa: E402
+
+PAGE = 100
+PAGES = 20
+USERS = 1000
+BATCH = 5000
+
+metadata = MetaData()
+
+serial = Table(
+    'bench_messages_serial', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('text', String(140), nullable=False),
+    Column('timestamp', DateTime, nullable=False),
+    Column('user_id', Integer, nullable=False),
+    Index('ix_bench_serial_user_id_timestamp', 'user_id', 'timestamp'),
+    Index('ix_bench_serial_timestamp', 'timestamp'),
+)
+
+flake = Table(
+    'bench_messages_snowflake', metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=False),
+    Column('text', String(140), nullable=False),
+    Column('timestamp', DateTime, nullable=False),
+    Column('user_id', Integer, nullable=False),
+    Index('ix_bench_snowflake_user_id_id', 'user_id', 'id'),
+)
+
+
+def timed(fn, runs=1):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def insert_rows(engine, table, rows, with_ids):
+    generator = snowflake.SnowflakeGenerator(worker_id=1)
+    now = datetime.utcnow()
+
+    def run():
+        for start in range(0, rows, BATCH):
+            batch = []
+            for n in range(start, min(rows, start + BATCH)):
+                row = dict(text="warble", user_id=random.randint(1, USERS),
+                           timestamp=now + timedelta(milliseconds=n))
+                if with_ids:
+                    row['id'] = generator.next_id()
+                batch.append(row)
+            with engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+
+    return timed(run)
+
+
+def newest(engine, table, order_column, user_id=None):
+    query = select([table.c.id]).order_by(order_column.desc()).limit(PAGE)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+
+    with engine.connect() as conn:
+        return conn.execute(query).fetchall()
+
+
+def walk_pages(engine, table, cursor_column):
+    """Page back PAGES pages, keyed on `cursor_column` alone."""
+
+    with engine.connect() as conn:
+        before = None
+        for _ in range(PAGES):
+            query = (select([table.c.id, cursor_column])
+                     .order_by(cursor_column.desc()).limit(PAGE))
+            if before is not None:
+                query = query.where(cursor_column < before)
+            rows = conn.execute(query).fetchall()
+            if not rows:
+                break
+            before = rows[-1][1]
+
+
+def relation_size(engine, table):
+    if engine.dialect.name != 'postgresql':
+        return None
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT pg_total_relation_size(:name)"),
+                            name=table.name).scalar()
+
+
+def run(url, rows, runs):
+    engine = create_engine(url)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    try:
+        results = {}
+        for name, table, order_column, with_ids in (
+                ('serial', serial, serial.c.timestamp, False),
+                ('snowflake', flake, flake.c.id, True)):
+            results[name] = dict(
+                insert=insert_rows(engine, table, rows, with_ids),
+                home=timed(lambda: newest(engine, table, order_column), runs),
+                user=timed(lambda: newest(engine, table, order_column,
+                                          user_id=USERS // 2), runs),
+                pages=timed(lambda: walk_pages(engine, table, order_column),
+                            runs),
+                size=relation_size(engine, table),
+            )
+
+        ids = timed(lambda: [snowflake.next_id() for _ in range(100000)])
+    finally:
+        metadata.drop_all(engine)
+
+    print(f"{rows} rows, median of {runs} runs for reads")
+    print(f"{'':10} {'insert s':>10} {'home ms':>9} {'user ms':>9} "
+          f"{'pages ms':>9} {'size MB':>8}")
+    for name, r in results.items():
+        size = f"{r['size'] / 1e6:8.1f}" if r['size'] is not None else f"{'-':>8}"
+        print(f"{name:10} {r['insert']:10.2f} {r['home'] * 1e3:9.2f} "
+              f"{r['user'] * 1e3:9.2f} {r['pages'] * 1e3:9.2f} {size}")
+    print(f"id generation: {ids / 100000 * 1e9:.0f} ns per id")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default=os.environ.get(
+        'DATABASE_URL', 'postgresql:///warbler-bench'))
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    run(args.url, args.rows, args.runs)
@@ -0,0 +1,330 @@
+"""Model-layer microbenchmarks with checked-in budgets.
+
+Runs the hot model operations -- login, follow/like checks, timelines,
+follow toggles -- against a seeded dataset and reports, per call: median
+wall time, peak memory allocated (tracemalloc) and the number of SQL
+statements sent. Each number is checked against benchmarks/budgets.json;
+any operation over budget makes the run exit non-zero, so a change that
+makes a model operation scale with table size fails here before it shows
+up in HTTP latency.
+
+Datasets (messages; likes and follows are the same size, users 1/100th):
+
+    small    1,000
+    medium   100,000
+    large    1,000,000
+
+Run it like:
+
+    python benchmarks/bench_models.py --size small
+    python benchmarks/bench_models.py --size large --runs 50
+    python benchmarks/bench_models.py --size medium --write-budgets
+
+The dataset is seeded into DATABASE_URL (default
+postgresql:///warbler-bench), which must be a dedicated benchmark database:
+the run refuses any database without "bench" in its name, since seeding
+deletes every user, message, follow and like. An empty database is seeded
+automatically; one holding a different dataset is only replaced with
+--reseed. Query counts and allocations are what the budgets are really
+about; time budgets are loose, since machines differ.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATABASE_URL', 'postgresql:///warbler-bench')
+
+from flask import current_app  # noqa: E402
+from flask_bcrypt import generate_password_hash  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+from app import create_app, timeline_page  # noqa: E402
+from models import db, Follows, Likes, Message, User  # noqa: E402
+from readmodels import message_cards, message_query  # noqa: E402
+from sharding import get_router  # noqa: E402
+from snowflake import next_id  # noqa: E402
+
+SIZES = {
+    'small': 1000,
+    'medium': 100000,
+    'large': 1000000,
+}
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'budgets.json')
+
+BATCH = 10000
+PASSWORD = 'benchmark'
+
+
+##############################################################################
+# Dataset
+
+
+def dataset_counts(rows):
+    return dict(users=max(100, rows // 100), messages=rows, follows=rows,
+                likes=rows)
+
+
+def is_seeded(counts):
+    return (User.query.count() == counts['users'] and
+            Message.query.count() == counts['messages'] and
+            Follows.query.count() == counts['follows'] and
+            Likes.query.count() == counts['likes'])
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(model.__table__.insert(), rows[start:start + BATCH])
+    db.session.commit()
+
+
+def seed(counts):
+    """Replace everything with a dataset of `counts` rows."""
+
+    for model in (Likes, Follows, Message, User):
+        model.query.delete()
+    db.session.commit()
+
+    rng = random.Random(0)
+    users = counts['users']
+    # cheap hash: we're measuring the lookup around bcrypt, not bcrypt
+    password = generate_password_hash(PASSWORD, rounds=4).decode()
+
+    _insert(User, [
+        dict(id=i, username=f"user{i}", email=f"user{i}@bench.test",
+             password=password, location="bench")
+        for i in range(1, users + 1)
+    ])
+
+    message_ids = [next_id() for _ in range(counts['messages'])]
+    _insert(Message, [
+        dict(id=id_, text="warble", user_id=rng.randint(1, users),
+             is_repost=False)
+        for id_ in message_ids
+    ])
+
+    edges = set()
+    while len(edges) < counts['follows']:
+        a, b = rng.randint(1, users), rng.randint(1, users)
+        if a != b:
+            edges.add((a, b))
+    _insert(Follows, [dict(user_following_id=a, user_being_followed_id=b)
+                      for a, b in edges])
+
+    likes = set()
+    while len(likes) < counts['likes']:
+        likes.add((rng.randint(1, users), rng.choice(message_ids)))
+    _insert(Likes, [dict(user_id=u, message_id=m, likes_count=0,
+                         liked_count=0)
+                    for u, m in likes])
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute("ANALYZE")
+        db.session.commit()
+
+
+def check_bench_database(app):
+    """Exit unless the app points at a dedicated benchmark database."""
+
+    name = db.engine.url.database or ''
+    if 'bench' not in os.path.basename(name):
+        sys.exit(f"refusing to benchmark against {db.engine.url!r}: seeding "
+                 f"wipes it. Point DATABASE_URL at a database with 'bench' "
+                 f"in its name.")
+
+    # edges would be seeded into the main database, not the shards
+    if app.config['SHARD_DATABASE_URLS']:
+        sys.exit("refusing to benchmark with SHARD_DATABASE_URLS set")
+
+
+def is_empty():
+    return User.query.first() is None and Message.query.first() is None
+
+
+def prepare(rows, reseed):
+    check_bench_database(current_app)
+
+    if db.engine.dialect.name == 'postgresql':
+        from migrate import apply_migrations
+        from partitions import ensure_partitions
+        apply_migrations()
+        ensure_partitions()
+    else:
+        db.create_all()
+
+    counts = dataset_counts(rows)
+    if not reseed and not is_empty():
+        if is_seeded(counts):
+            return
+        sys.exit(f"{db.engine.url!r} holds a different dataset; "
+                 f"pass --reseed to replace it")
+
+    print(f"seeding {counts}...", file=sys.stderr)
+    seed(counts)
+
+
+##############################################################################
+# Measuring
+
+
+class QueryCounter:
+    """Counts statements sent on any engine while `active`."""
+
+    def __init__(self):
+        self.count = 0
+        self.active = False
+        event.listen(Engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        if self.active:
+            self.count += 1
+
+    @contextmanager
+    def counting(self):
+        self.count = 0
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+
+def measure(fn, runs, counter):
+    """(median ms, peak KiB allocated, queries) per call of `fn`."""
+
+    fn()  # warm caches and connections
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        with counter.counting():
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(ms=round(statistics.median(times), 3),
+                peak_kib=round(peak / 1024, 1),
+                queries=counter.count)
+
+
+##############################################################################
+# Operations
+
+
+def operations():
+    """name -> zero-argument callable, on sample rows of the dataset."""
+
+    # Detached copies, so nothing a commit expires has to be reloaded
+    # (those helpers only read ids); `like` is live, since it's updated.
+    first = User.query.order_by(User.id).first()
+    user = User(id=first.id, username=first.username)
+    other = User(id=User.query.order_by(User.id.desc()).first().id)
+    message = Message(text='')
+    message.id = Message.query.filter(Message.user_id != user.id).first().id
+    like = Likes.query.first()
+    router = get_router()
+
+    def home_timeline():
+        rows, _ = timeline_page(message_query())
+        message_cards(rows)
+
+    def user_timeline():
+        rows, _ = timeline_page(message_query(Message.user_id == user.id))
+        message_cards(rows)
+
+    def follow_toggle():
+        router.follow(user.id, other.id)
+        router.unfollow(user.id, other.id)
+
+    def like_toggle():
+        router.like(user.id, message.id)
+        router.unlike(user.id, message.id)
+
+    return {
+        'authenticate': lambda: User.authenticate(user.username, PASSWORD),
+        'is_following': lambda: user.is_following(other),
+        'is_followed_by': lambda: user.is_followed_by(other),
+        'has_liked_message': lambda: user.has_liked_message(message),
+        'increment_likes': lambda: like.increment_likes(user),
+        'home_timeline': home_timeline,
+        'user_timeline': user_timeline,
+        'follow_toggle': follow_toggle,
+        'like_toggle': like_toggle,
+        'profile_counts': lambda: (user.following_count, user.followers_count,
+                                   user.likes_count),
+    }
+
+
+def over_budget(result, budget):
+    """Names of the metrics in `result` above `budget`."""
+
+    return [key for key, limit in budget.items() if result[key] > limit]
+
+
+def run(size, runs, reseed, budgets_path, write_budgets):
+    app = create_app('production')
+
+    with app.app_context():
+        prepare(SIZES[size], reseed)
+        counter = QueryCounter()
+        results = {name: measure(fn, runs, counter)
+                   for name, fn in operations().items()}
+
+    with open(budgets_path) as f:
+        budgets = json.load(f)
+
+    if write_budgets:
+        # 3x headroom on time and memory; query counts are exact
+        budgets[size] = {
+            name: dict(ms=max(1.0, round(r['ms'] * 3, 1)),
+                       peak_kib=max(64.0, round(r['peak_kib'] * 3)),
+                       queries=r['queries'])
+            for name, r in results.items()
+        }
+        with open(budgets_path, 'w') as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    failures = 0
+    print(f"{size} ({SIZES[size]} rows), median of {runs} runs")
+    print(f"{'operation':<20} {'ms':>9} {'peak KiB':>9} {'queries':>8}")
+    for name, result in results.items():
+        over = over_budget(result, budgets.get(size, {}).get(name, {}))
+        failures += bool(over)
+        flag = f"  OVER BUDGET: {', '.join(over)}" if over else ''
+        print(f"{name:<20} {result['ms']:9.2f} {result['peak_kib']:9.1f} "
+              f"{result['queries']:8}{flag}")
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--reseed', action='store_true',
+                        help="rebuild the dataset even if it looks seeded")
+    parser.add_argument('--budgets', default=BUDGETS_PATH)
+    parser.add_argument('--write-budgets', action='store_true',
+                        help="record this run (with headroom) as the budget")
+    args = parser.parse_args()
+
+    sys.exit(1 if run(args.size, args.runs, args.reseed, args.budgets,
+                      args.write_budgets) else 0)
@@ -0,0 +1,130 @@
+"""ORM objects vs read-model cards for 100-card pages.
+
+Loads the same page both ways -- the full `Message`/`User` instances the
+views used to render, and the column-projected cards from readmodels.py --
+reads the fields the templates read, and reports per page: median wall
+time, peak memory allocated (tracemalloc) and SQL statements sent.
+
+Run it like:
+
+    python benchmarks/bench_readmodels.py --size small
+    python benchmarks/bench_readmodels.py --size medium --runs 50
+
+It uses the same dataset as bench_models.py, with the same rules: a
+DATABASE_URL (default postgresql:///warbler-bench) with "bench" in its
+name, seeded when empty or with --reseed.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import TIMELINE_PAGE, create_app, timeline_page  # noqa: E402
+from bench_models import SIZES, QueryCounter, measure, prepare  # noqa: E402
+from models import db, Message, User  # noqa: E402
+from readmodels import message_cards, message_query, user_cards_by_ids  # noqa: E402
+
+
+def render_messages(messages):
+    """Touch what home.html reads from each message."""
+
+    for msg in messages:
+        shown = msg.content
+        (msg.id, msg.is_repost, msg.user.username, shown.id, shown.text,
+         shown.timestamp, shown.user.id, shown.user.username,
+         shown.user.image_url)
+
+
+def render_users(users):
+    """Touch what the user card templates read."""
+
+    for user in users:
+        (user.id, user.username, user.image_url, user.header_image_url,
+         user.bio)
+
+
+def pages():
+    """name -> (ORM version, card version); each ends its session."""
+
+    user_id = (db.session.query(Message.user_id)
+               .group_by(Message.user_id)
+               .order_by(db.func.count().desc())
+               .limit(1)
+               .scalar())
+    user_ids = [id_ for (id_,) in db.session.query(User.id)
+                .order_by(User.id.desc()).limit(TIMELINE_PAGE)]
+
+    def orm_home():
+        messages, _ = timeline_page(
+            Message.query.options(joinedload(Message.original)
+                                  .joinedload(Message.user)))
+        render_messages(messages)
+        db.session.remove()
+
+    def cards_home():
+        rows, _ = timeline_page(message_query())
+        render_messages(message_cards(rows))
+        db.session.remove()
+
+    def orm_profile():
+        messages, _ = timeline_page(
+            Message.query.filter(Message.user_id == user_id)
+            .options(joinedload(Message.original).joinedload(Message.user)))
+        render_messages(messages)
+        db.session.remove()
+
+    def cards_profile():
+        rows, _ = timeline_page(message_query(Message.user_id == user_id))
+        render_messages(message_cards(rows))
+        db.session.remove()
+
+    def orm_users():
+        render_users(User.query.filter(User.id.in_(user_ids)).all())
+        db.session.remove()
+
+    def cards_users():
+        render_users(user_cards_by_ids(user_ids))
+        db.session.remove()
+
+    return {
+        'home_timeline': (orm_home, cards_home),
+        'user_timeline': (orm_profile, cards_profile),
+        'user_list': (orm_users, cards_users),
+    }
+
+
+def run(size, runs, reseed):
+    app = create_app('production')
+
+    with app.app_context():
+        prepare(SIZES[size], reseed)
+        counter = QueryCounter()
+        results = {name: (measure(orm, runs, counter),
+                          measure(cards, runs, counter))
+                   for name, (orm, cards) in pages().items()}
+
+    print(f"{size} ({SIZES[size]} rows), {TIMELINE_PAGE}-card pages, "
+          f"median of {runs} runs")
+    print(f"{'page':<15} {'':>6} {'ms':>9} {'peak KiB':>9} {'queries':>8}")
+    for name, (orm, cards) in results.items():
+        for label, result in (('orm', orm), ('cards', cards)):
+            print(f"{name if label == 'orm' else '':<15} {label:>6} "
+                  f"{result['ms']:9.2f} {result['peak_kib']:9.1f} "
+                  f"{result['queries']:8}")
+        print(f"{'':<15} {'ratio':>6} {cards['ms'] / orm['ms']:9.2f} "
+              f"{cards['peak_kib'] / orm['peak_kib']:9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--reseed', action='store_true',
+                        help="rebuild the dataset even if it looks seeded")
+    args = parser.parse_args()
+
+    run(args.size, args.runs, args.reseed)
@@ -0,0 +1,98 @@
+"""Worker startup benchmark.
+
+Measures, in fresh interpreters, how long it takes to import the app module,
+build the app with `create_app('production')`, and serve the first request
+in a forked worker -- once as a plain prefork server would (cold) and once
+with `warm_up` run in the master before forking (preload).
+
+Run it like:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --importtime
+
+No database is needed: the first request is GET /login, which doesn't query.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, sys, time
+
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+app = app_module.create_app('production')
+t2 = time.perf_counter()
+if sys.argv[1] == 'preload':
+    app_module.warm_up(app)
+t3 = time.perf_counter()
+
+r, w = os.pipe()
+if os.fork() == 0:
+    start = time.perf_counter()
+    app.test_client().get('/login')
+    os.write(w, str(time.perf_counter() - start).encode())
+    os._exit(0)
+
+os.close(w)
+first_request = float(os.read(r, 64))
+os.wait()
+
+print(json.dumps(dict(import_app=t1 - t0, create_app=t2 - t1,
+                      warm_up=t3 - t2, first_request=first_request)))
+"""
+
+
+def run_once(mode):
+    out = subprocess.check_output([sys.executable, '-c', CHILD, mode],
+                                  cwd=ROOT)
+    return json.loads(out)
+
+
+def report(mode, runs):
+    samples = [run_once(mode) for _ in range(runs)]
+    print(f"{mode}:")
+    for key in samples[0]:
+        values = [sample[key] * 1000 for sample in samples]
+        print(f"  {key:<14} median {statistics.median(values):8.2f} ms"
+              f"   min {min(values):8.2f} ms")
+
+
+def importtime(top):
+    """Print the slowest modules pulled in by `import app`."""
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import app'],
+                            cwd=ROOT, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines()[1:]:
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+
+    print("slowest imports (cumulative us, self us):")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us:>9} {self_us:>9}  {name}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true',
+                        help="also show the slowest imports")
+    args = parser.parse_args()
+
+    report('cold', args.runs)
+    report('preload', args.runs)
+
+    if args.importtime:
+        importtime(top=20)
@@ -0,0 +1,184 @@
+"""Bloom filters of taken usernames and emails.
+
+Signup used to hash the password with bcrypt and only learn from the
+unique constraint, on commit, that the name was taken. Now it asks
+`TakenNames` first:
+
+- not in the filter: certainly free (as of this process's last look), so
+  go ahead;
+- in the filter: maybe taken (about 1% of free names say so too), so one
+  indexed query settles it before any hashing.
+
+Each process builds its filters from `users` on first use, then picks up
+newer users by id every REFRESH_SECONDS. Renames don't show up that way
+(the id is old), so the filters are also rebuilt from scratch every
+REBUILD_SECONDS. Names taken by another process since then read as free
+until that refresh or rebuild, so the unique constraint stays the
+authority and signup still handles its IntegrityError. Renamed users' old
+names stay in the filter until the rebuild; that only costs a query.
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import or_
+
+from models import db, User
+
+ERROR_RATE = 0.01
+# room to grow before the false positive rate climbs past ERROR_RATE
+MIN_CAPACITY = 10000
+GROWTH = 2
+REFRESH_SECONDS = 60
+REBUILD_SECONDS = 10 * 60
+BATCH = 10000
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives.
+
+    Sized for `capacity` items at `error_rate`; positions come from one
+    blake2b digest split in two (double hashing).
+    """
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate)
+                                     / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        # |= on a bytearray isn't atomic: an unlucky interleaving could
+        # drop a bit, and a dropped bit is a false negative
+        with self._lock:
+            for pos in positions:
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(item))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+class TakenNames:
+    """Bloom filters over `users.username` and `users.email`."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        """Build fresh filters from every user."""
+
+        capacity = max(MIN_CAPACITY, User.query.count() * GROWTH)
+        usernames, emails = BloomFilter(capacity), BloomFilter(capacity)
+
+        last_id = 0
+        for id_, username, email in (db.session
+                                     .query(User.id, User.username, User.email)
+                                     .order_by(User.id)
+                                     .yield_per(BATCH)):
+            usernames.add(username)
+            emails.add(email)
+            last_id = id_
+
+        with self._lock:
+            self.usernames, self.emails = usernames, emails
+            self.last_id = last_id
+            self.refreshed = self.rebuilt = self.clock()
+
+    def refresh(self):
+        """Add users created since the last look, if it's been a while.
+
+        Rebuilds instead when the filters are full, or every
+        REBUILD_SECONDS to pick up renames made in other processes.
+        """
+
+        now = self.clock()
+        if now - self.refreshed < REFRESH_SECONDS:
+            return
+
+        if self.usernames.full or now - self.rebuilt >= REBUILD_SECONDS:
+            self.rebuild()
+            return
+
+        with self._lock:
+            last_id, self.refreshed = self.last_id, self.clock()
+
+        for id_, username, email in (db.session
+                                     .query(User.id, User.username, User.email)
+                                     .filter(User.id > last_id)
+                                     .order_by(User.id)):
+            self.add(username, email)
+            last_id = id_
+
+        with self._lock:
+            self.last_id = max(self.last_id, last_id)
+
+    def add(self, username, email):
+        self.usernames.add(username)
+        self.emails.add(email)
+
+    def taken(self, username=None, email=None, exclude_user_id=None):
+        """The subset of {'username', 'email'} already in use.
+
+        Only names the filters can't rule out cost a query.
+        """
+
+        self.refresh()
+
+        maybe = {}
+        if username and username in self.usernames:
+            maybe['username'] = (User.username, username)
+        if email and email in self.emails:
+            maybe['email'] = (User.email, email)
+        if not maybe:
+            return set()
+
+        query = (db.session
+                 .query(User.username, User.email)
+                 .filter(or_(*[column == value
+                               for column, value in maybe.values()])))
+        if exclude_user_id is not None:
+            query = query.filter(User.id != exclude_user_id)
+
+        found = set()
+        for row in query:
+            for field, (column, value) in maybe.items():
+                if getattr(row, field) == value:
+                    found.add(field)
+        return found
+
+
+_lock = threading.Lock()
+
+
+def get_taken_names(app=None):
+    """The app's filters, built on first use (so after any fork)."""
+
+    app = app or current_app
+    names = app.extensions.get('taken_names')
+    if names is None:
+        with _lock:
+            names = app.extensions.get('taken_names')
+            if names is None:
+                names = app.extensions['taken_names'] = TakenNames()
+    return names
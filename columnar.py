@@ -0,0 +1,70 @@
+"""Stream query results into NumPy column arrays.
+
+Batch jobs (suggestions, analytics) need whole tables as flat arrays, not as
+ORM objects. These helpers pull rows through a server-side cursor and copy
+them chunk by chunk into preallocated arrays, so peak memory is the arrays
+themselves plus one chunk of tuples.
+"""
+
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import func, select
+
+STREAM_CHUNK = 50000
+
+
+def stream_columns(query, dtypes, chunk_size=STREAM_CHUNK):
+    """Run `query` and return one array per selected column.
+
+    `dtypes` lists a NumPy dtype per column, in select order. Rows inserted
+    after the initial count are ignored; the next run will see them.
+    """
+
+    total = query.order_by(None).count()
+    rows = (query
+            .execution_options(stream_results=True)
+            .yield_per(chunk_size))
+
+    return _fill(rows, total, dtypes, chunk_size)
+
+
+def stream_shard_columns(router, columns, dtypes, chunk_size=STREAM_CHUNK):
+    """`stream_columns` for Core `columns` of an edge table, on every shard.
+
+    Follows and likes live on the shard router's databases (sharding.py),
+    not necessarily the main one. Each shard is streamed in turn and the
+    arrays concatenated.
+    """
+
+    query = select(list(columns))
+    count = select([func.count()]).select_from(query.alias())
+
+    parts = []
+    for engine in router.engines:
+        with engine.connect() as conn:
+            total = conn.execute(count).scalar()
+            rows = conn.execution_options(stream_results=True).execute(query)
+            parts.append(_fill(rows, total, dtypes, chunk_size))
+
+    return [np.concatenate(arrays) for arrays in zip(*parts)]
+
+
+def _fill(rows, total, dtypes, chunk_size):
+    """Copy up to `total` rows into one preallocated array per column."""
+
+    arrays = [np.empty(total, dtype=dtype) for dtype in dtypes]
+    rows = iter(rows)
+
+    n = 0
+    while n < total:
+        chunk = list(islice(rows, min(chunk_size, total - n)))
+        if not chunk:
+            break
+
+        end = n + len(chunk)
+        for array, column in zip(arrays, zip(*chunk)):
+            array[n:end] = column
+        n = end
+
+    return [array[:n] for array in arrays]
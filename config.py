@@ -0,0 +1,138 @@
+"""Configuration profiles for Warbler.
+
+Pick one with `create_app('production')`, or set WARBLER_CONFIG (falling
+back to FLASK_ENV, then 'development'). Deployment-specific values always
+come from the environment; see `Config.from_env`.
+"""
+
+import os
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    SQLALCHEMY_DATABASE_URI = 'postgresql:///warbler'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SECRET_KEY = "it's a secret"
+
+    # None means "<instance path>/image-cache"
+    IMAGE_CACHE_DIR = None
+    IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+    # remote hosts variants may be fetched from (besides our own /static);
+    # the defaults are where the seed data's avatars and headers live
+    IMAGE_SOURCE_HOSTS = ('randomuser.me', 'splashbase.s3.amazonaws.com')
+
+    # None means "<instance path>/jinja-bytecode"; 'off' turns the cache off
+    # (TEMPLATE_BYTECODE_DIR=off: an empty variable counts as unset)
+    TEMPLATE_BYTECODE_DIR = None
+    # output of `flask compile-templates`; unset means compile at runtime
+    TEMPLATES_COMPILED_DIR = None
+
+    # None means "<instance path>/archive"; where `flask partitions archive`
+    # puts old months of messages
+    ARCHIVE_DIR = None
+    # timelines look this far back first, so only recent partitions are read
+    TIMELINE_WINDOW_DAYS = 30
+
+    # databases holding follows/likes (see sharding.py); empty means the
+    # main database. Order matters: edges are placed by index.
+    SHARD_DATABASE_URLS = ()
+
+    # likes/follows within one bucket roll up into one notification
+    NOTIFICATION_BUCKET_HOURS = 24
+
+    # None means "<static folder>/dist"; output of `flask build-assets`
+    # (see assets.py). Without a manifest there, assets are served unhashed.
+    ASSETS_DIST_DIR = None
+
+    # per-route token buckets, merged over ratelimit.DEFAULT_RATE_LIMITS:
+    # {name: (tokens per second, burst, methods)}
+    RATE_LIMITS = {}
+    # 'memory' (per process) or a redis:// URL shared by all workers
+    RATE_LIMIT_BACKEND = 'memory'
+    # reverse proxies in front of the app (see ratelimit.py); 0 trusts no
+    # X-Forwarded-For, so every client behind a proxy shares its address
+    TRUSTED_PROXIES = 0
+    # bearer token for /metrics; unset means /metrics is a 404
+    METRICS_TOKEN = None
+    # requests in flight per process; SQLAlchemy's default pool is 5 + 10
+    MAX_CONCURRENT_REQUESTS = 15
+    CONCURRENCY_EXEMPT_PREFIXES = ('/static/', '/assets/', '/images/', '/stream',
+                                   '/metrics')
+
+    # Flask-DebugToolbar is only imported when this is on.
+    DEBUG_TOOLBAR = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    @staticmethod
+    def from_env():
+        """Overrides read from the environment when the app is created."""
+
+        env = {
+            'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL'),
+            'SECRET_KEY': os.environ.get('SECRET_KEY'),
+            'IMAGE_CACHE_DIR': os.environ.get('IMAGE_CACHE_DIR'),
+            'IMAGE_CACHE_MAX_BYTES': os.environ.get('IMAGE_CACHE_MAX_BYTES'),
+            'ARCHIVE_DIR': os.environ.get('ARCHIVE_DIR'),
+            'ASSETS_DIST_DIR': os.environ.get('ASSETS_DIST_DIR'),
+            'TEMPLATE_BYTECODE_DIR': os.environ.get('TEMPLATE_BYTECODE_DIR'),
+            'TEMPLATES_COMPILED_DIR': os.environ.get('TEMPLATES_COMPILED_DIR'),
+            'RATE_LIMIT_BACKEND': os.environ.get('RATE_LIMIT_BACKEND'),
+            'MAX_CONCURRENT_REQUESTS': os.environ.get('MAX_CONCURRENT_REQUESTS'),
+            'TRUSTED_PROXIES': os.environ.get('TRUSTED_PROXIES'),
+            'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+        }
+        for key in ('IMAGE_CACHE_MAX_BYTES', 'MAX_CONCURRENT_REQUESTS',
+                    'TRUSTED_PROXIES'):
+            if env[key]:
+                env[key] = int(env[key])
+
+        source_hosts = os.environ.get('IMAGE_SOURCE_HOSTS')
+        if source_hosts:
+            env['IMAGE_SOURCE_HOSTS'] = tuple(
+                host.strip().lower() for host in source_hosts.split(',')
+                if host.strip())
+
+        # comma-separated, in shard order
+        shard_urls = os.environ.get('SHARD_DATABASE_URLS')
+        if shard_urls:
+            env['SHARD_DATABASE_URLS'] = tuple(
+                url.strip() for url in shard_urls.split(',') if url.strip())
+
+        return {key: value for key, value in env.items() if value}
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    DEBUG_TOOLBAR = True
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'postgresql:///warbler-test'
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(config=None):
+    """Resolve a profile name (or pass through a config class)."""
+
+    if config is None:
+        config = (os.environ.get('WARBLER_CONFIG')
+                  or os.environ.get('FLASK_ENV')
+                  or 'development')
+
+    if isinstance(config, str):
+        return CONFIGS[config]
+
+    return config
@@ -0,0 +1,168 @@
+"""In-process pub/sub for live timeline updates.
+
+Each connected browser holds one `Subscription` (a small bounded queue)
+registered under its user id. Request handlers publish events after they
+commit; the `/stream` endpoint drains the queue as Server-Sent Events.
+
+An idle connection is one blocked queue read and no database connection, so
+under the gevent workers gunicorn.conf.py sets up, thousands of them cost
+little. (Under sync workers each one would hold a whole worker.)
+The dispatcher is per process: events only reach clients connected to the
+worker that handled the write.
+"""
+
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from images import variant_url
+from sharding import get_router
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One connected client's event queue."""
+
+    def __init__(self, user_id, maxsize=QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        """Queue an event; drop it if this client has fallen far behind."""
+
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            pass
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout`."""
+
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Dispatcher:
+    """Fan events out to the subscriptions of a set of users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def connected_user_ids(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, user_ids, event, data):
+        """Send `event` with JSON-able `data` to every client of `user_ids`."""
+
+        payload = (event, json.dumps(data))
+
+        with self._lock:
+            targets = [subscription
+                       for user_id in user_ids
+                       for subscription in self._subscribers.get(user_id, ())]
+
+        for subscription in targets:
+            subscription.put(payload)
+
+
+dispatcher = Dispatcher()
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Event."""
+
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def event_stream(user_id, heartbeat=HEARTBEAT_SECONDS):
+    """Generate the SSE body for one client until it disconnects.
+
+    The subscription is made here, on the first iteration, so the
+    `finally` covers all of it: a client gone before the body starts never
+    subscribes at all.
+    """
+
+    subscription = dispatcher.subscribe(user_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            item = subscription.get(timeout=heartbeat)
+            if item is None:
+                # comment line; keeps proxies from closing the connection
+                yield ": keep-alive\n\n"
+            else:
+                yield format_sse(*item)
+    finally:
+        dispatcher.unsubscribe(subscription)
+
+
+def connected_followers(author_id):
+    """Users with an open stream who follow `author_id`, plus the author.
+
+    Only connected users are looked up (on their own shards, via the follows
+    primary key), so posting as a popular account doesn't read every
+    follower.
+    """
+
+    connected = dispatcher.connected_user_ids()
+    if not connected:
+        return []
+
+    recipients = {author_id} & set(connected)
+    recipients.update(get_router().followers_among(author_id, connected))
+
+    return recipients
+
+
+def publish_message(msg):
+    """Push a newly committed message to its author's connected followers."""
+
+    recipients = connected_followers(msg.user_id)
+    if not recipients:
+        return
+
+    # reposts are pushed as the original, with who reposted it
+    shown = msg.content
+
+    # message ids are 64-bit: as JSON numbers JavaScript would round them
+    dispatcher.publish(recipients, 'message', dict(
+        id=str(msg.id),
+        text=shown.text,
+        timestamp=shown.timestamp.strftime('%d %B %Y'),
+        user=dict(id=shown.user.id,
+                  username=shown.user.username,
+                  image_url=variant_url(shown.user.image_url, 'thumb')),
+        reposted_by=msg.user.username if msg.is_repost else None,
+    ))
+
+
+def publish_like_count(msg):
+    """Push a message's new like count after a like or unlike."""
+
+    recipients = connected_followers(msg.user_id)
+    if not recipients:
+        return
+
+    count = get_router().like_counts([msg.id])[msg.id]
+    dispatcher.publish(recipients, 'likes', dict(id=str(msg.id), likes=count))
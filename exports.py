@@ -0,0 +1,177 @@
+"""Streaming exports of a user's warbles, likes and follows.
+
+Rows are read through a server-side cursor (`yield_per` + stream_results)
+as plain column tuples, serialized to NDJSON or CSV a batch at a time and,
+optionally, gzip-compressed on the fly. Nothing ever holds more than one
+batch, so memory stays flat no matter how big the account is. (Likes and
+follows come from the shard router as bare ids, paged by keyset from each
+shard and merged in id order; the messages and users they point at are
+then read BATCH_SIZE ids at a time.)
+
+Used by the /users/export/<file> view and the `flask export-user` command.
+"""
+
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, Message, User
+from sharding import get_router
+
+BATCH_SIZE = 1000
+FLUSH_BYTES = 64 * 1024
+
+FORMATS = ('ndjson', 'csv')
+
+
+def _stream(query):
+    return query.execution_options(stream_results=True).yield_per(BATCH_SIZE)
+
+
+def messages_rows(user_id):
+    return _stream(db.session
+                   .query(Message.id, Message.text, Message.timestamp,
+                          Message.original_message_id, Message.is_repost)
+                   .filter(Message.user_id == user_id)
+                   .order_by(Message.id))
+
+
+def _batches(ids):
+    """Lists of up to BATCH_SIZE ids, pulled from the iterator `ids`."""
+
+    ids = iter(ids)
+    while True:
+        batch = list(islice(ids, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def likes_rows(user_id):
+    # archived or deleted messages drop out, as they did from the join
+    ids = get_router().iter_liked_message_ids(user_id, page=BATCH_SIZE)
+    for batch in _batches(ids):
+        yield from (db.session
+                    .query(Message.id, Message.user_id, Message.text,
+                           Message.timestamp)
+                    .filter(Message.id.in_(batch))
+                    .order_by(Message.id))
+
+
+def follows_rows(user_id):
+    router = get_router()
+
+    for direction, ids in (
+            ('following', router.iter_following_ids(user_id, page=BATCH_SIZE)),
+            ('follower', router.iter_follower_ids(user_id, page=BATCH_SIZE))):
+        for batch in _batches(ids):
+            for row in (db.session
+                        .query(User.id, User.username)
+                        .filter(User.id.in_(batch))
+                        .order_by(User.id)):
+                yield (direction,) + tuple(row)
+
+
+# kind -> (column names, row source)
+KINDS = {
+    'messages': (('id', 'text', 'timestamp', 'original_message_id',
+                  'is_repost'), messages_rows),
+    'likes': (('message_id', 'author_id', 'text', 'timestamp'), likes_rows),
+    'follows': (('direction', 'user_id', 'username'), follows_rows),
+}
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def ndjson_chunks(columns, rows):
+    """Serialize rows as newline-delimited JSON, in ~FLUSH_BYTES chunks."""
+
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(json.dumps(dict(zip(columns, map(_plain, row)))))
+        buf.write('\n')
+        if buf.tell() >= FLUSH_BYTES:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def csv_chunks(columns, rows):
+    """Serialize rows as CSV with a header, in ~FLUSH_BYTES chunks."""
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        if buf.tell() >= FLUSH_BYTES:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of byte chunks incrementally."""
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(user_id, kind, fmt, compress=False):
+    """Byte chunks of user `user_id`'s `kind` export in format `fmt`."""
+
+    columns, source = KINDS[kind]
+    serialize = ndjson_chunks if fmt == 'ndjson' else csv_chunks
+
+    chunks = serialize(columns, source(user_id))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def parse_export_name(filename):
+    """'messages.csv.gz' -> ('messages', 'csv', True); None if unknown."""
+
+    parts = filename.split('.')
+    compress = parts[-1] == 'gz'
+    if compress:
+        parts = parts[:-1]
+
+    if len(parts) != 2 or parts[0] not in KINDS or parts[1] not in FORMATS:
+        return None
+
+    return parts[0], parts[1], compress
+
+
+def content_type(fmt):
+    return 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+
+
+@click.command('export-user')
+@click.argument('user_id', type=int)
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='ndjson')
+@click.option('--gzip', 'compress', is_flag=True, help="gzip the output")
+@click.option('--output', '-o', type=click.File('wb'), default='-')
+@with_appcontext
+def export_user_command(user_id, kind, fmt, compress, output):
+    """Stream one user's messages, likes or follows to a file or stdout."""
+
+    for chunk in export_chunks(user_id, kind, fmt, compress):
+        output.write(chunk)
@@ -0,0 +1,54 @@
+"""gunicorn settings for Warbler (see wsgi.py).
+
+Workers are gevent by default. Every open tab holds a /stream request for
+as long as it's open, and a sync worker serves one request at a time, so
+with sync workers a few tabs would leave nothing for page views. Under
+gevent an idle stream is one parked greenlet. psycopg2 is made cooperative
+(psycogreen), so a slow query doesn't block the worker's other requests.
+
+WORKER_CLASS=sync is for debugging only: /stream then pins a worker per
+tab.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+worker_class = os.environ.get('WORKER_CLASS', 'gevent')
+# concurrent requests (open streams included) per gevent worker
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+if worker_class == 'gevent':
+    # before preload_app imports the app: threading, queue and socket must
+    # be the cooperative versions everywhere, master included
+    from gevent import monkey
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+# Import and warm the app in the master, then fork: workers start with
+# templates compiled and mappers configured, and share those pages.
+preload_app = True
+
+# First snowflake worker id on this host; hosts need ranges `workers` apart.
+snowflake_base = int(os.environ.get('SNOWFLAKE_WORKER_ID', 0))
+
+
+def pre_fork(server, worker):
+    """Give the new worker the lowest slot no live worker is using."""
+
+    taken = {w.snowflake_slot for w in server.WORKERS.values()}
+    worker.snowflake_slot = min(set(range(len(taken) + 1)) - taken)
+
+
+def post_fork(server, worker):
+    """Drop any DB connections inherited from the master; pick an id range."""
+
+    from models import db
+    db.get_engine().dispose()
+
+    import snowflake
+    snowflake.configure(snowflake_base + worker.snowflake_slot)
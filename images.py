@@ -0,0 +1,285 @@
+"""Resized, recompressed image variants for avatars and header images.
+
+Templates ask for `{{ user.image_url | variant('thumb') }}` instead of the
+original URL. The first request for a (source, variant, format) decodes the
+original once, resizes it and writes the result to a bounded on-disk cache;
+after that it's a plain file send with a year-long immutable Cache-Control.
+
+Sources are either our own `/static/...` files or http(s) URLs on a host in
+IMAGE_SOURCE_HOSTS; any other URL is left for the browser to load as is.
+The source is signed into the variant URL with SECRET_KEY, so only URLs our
+templates produced are fetched (no open proxy). Remote fetches connect only
+to public addresses (checked after resolving, then pinned so DNS can't
+change its answer), don't follow redirects and stop at MAX_SOURCE_BYTES.
+"""
+
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import urllib.parse
+
+from flask import current_app, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from PIL import Image, ImageOps, features
+
+# name -> (width, height, crop); crop=False keeps aspect ratio within the box
+VARIANTS = {
+    'thumb': (96, 96, True),
+    'card': (400, 400, True),
+    'hero': (1200, 400, False),
+}
+
+QUALITY = 80
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+# decoded size limit; a small file can still be a huge (bomb) image
+MAX_SOURCE_PIXELS = 40 * 1000 * 1000
+FETCH_TIMEOUT = 5
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class ImageSourceError(Exception):
+    """The original image couldn't be found, fetched or decoded."""
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'],
+                             salt='image-variant')
+
+
+def remote_host_allowed(source):
+    """Whether `source` is an http(s) URL on a host in IMAGE_SOURCE_HOSTS."""
+
+    parts = urllib.parse.urlsplit(source)
+    return (parts.scheme in ('http', 'https') and
+            (parts.hostname or '') in current_app.config['IMAGE_SOURCE_HOSTS'])
+
+
+def variant_url(source, variant):
+    """URL of the `variant` of image `source` (template filter `variant`)."""
+
+    if not source or variant not in VARIANTS:
+        return source
+
+    static_url = current_app.static_url_path + '/'
+    if not source.startswith(static_url) and not remote_host_allowed(source):
+        return source
+
+    return url_for('warbler.image_variant', variant=variant,
+                   token=_serializer().dumps(source))
+
+
+def source_from_token(token):
+    """Recover the original URL from a signed token, or None if forged."""
+
+    try:
+        return _serializer().loads(token)
+    except BadSignature:
+        return None
+
+
+def best_format(accept):
+    """Pick WebP when the browser accepts it and Pillow can write it."""
+
+    if 'image/webp' in (accept or '') and features.check('webp'):
+        return 'webp'
+    return 'jpeg'
+
+
+def read_source(source):
+    """Return the raw bytes of the original image."""
+
+    static_url = current_app.static_url_path + '/'
+
+    if source.startswith(static_url):
+        root = os.path.realpath(current_app.static_folder)
+        path = os.path.realpath(os.path.join(root, source[len(static_url):]))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            raise ImageSourceError(source)
+        with open(path, 'rb') as f:
+            return f.read(MAX_SOURCE_BYTES + 1)
+
+    if remote_host_allowed(source):
+        try:
+            return fetch(source)
+        except (OSError, ValueError, http.client.HTTPException) as exc:
+            raise ImageSourceError(source) from exc
+
+    raise ImageSourceError(source)
+
+
+def public_address(host, port):
+    """Resolve `host`; refuse it if any address isn't publicly routable.
+
+    Catches private, loopback, link-local (cloud metadata) and reserved
+    ranges, including IPv4 mapped into IPv6.
+    """
+
+    addresses = []
+    for *_, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"{host} resolves to {address}")
+        addresses.append(str(address))
+
+    if not addresses:
+        raise ValueError(f"{host} doesn't resolve")
+    return addresses[0]
+
+
+def fetch(url):
+    """GET an allowed remote image: public address, no redirects, capped."""
+
+    parts = urllib.parse.urlsplit(url)
+    https = parts.scheme == 'https'
+    port = parts.port or (443 if https else 80)
+
+    # connect to the address we checked, not whatever a second lookup says
+    sock = socket.create_connection((public_address(parts.hostname, port), port),
+                                    timeout=FETCH_TIMEOUT)
+    if https:
+        conn = http.client.HTTPSConnection(parts.hostname, port,
+                                           timeout=FETCH_TIMEOUT)
+        sock = ssl.create_default_context().wrap_socket(
+            sock, server_hostname=parts.hostname)
+    else:
+        conn = http.client.HTTPConnection(parts.hostname, port,
+                                          timeout=FETCH_TIMEOUT)
+    conn.sock = sock
+
+    try:
+        path = parts.path or '/'
+        conn.request('GET', f"{path}?{parts.query}" if parts.query else path)
+        resp = conn.getresponse()
+
+        # a redirect is a failure: its target hasn't been checked
+        if resp.status != 200:
+            raise ValueError(f"{url}: HTTP {resp.status}")
+        if int(resp.getheader('Content-Length') or 0) > MAX_SOURCE_BYTES:
+            raise ValueError(f"{url}: too large")
+
+        data = resp.read(MAX_SOURCE_BYTES + 1)
+        if len(data) > MAX_SOURCE_BYTES:
+            raise ValueError(f"{url}: too large")
+        return data
+    finally:
+        conn.close()
+
+
+def render_variant(data, variant, fmt):
+    """Resize and re-encode original image bytes; returns the new bytes."""
+
+    width, height, crop = VARIANTS[variant]
+
+    try:
+        img = Image.open(io.BytesIO(data))  # reads the header only
+        if img.width * img.height > MAX_SOURCE_PIXELS:
+            raise ValueError(f"{img.width}x{img.height} is too large")
+        img.draft('RGB', (width, height))  # cheap JPEG downscale on decode
+        img = img.convert('RGB')
+    except (OSError, ValueError) as exc:
+        raise ImageSourceError(variant) from exc
+
+    if crop:
+        img = ImageOps.fit(img, (width, height), Image.LANCZOS)
+    else:
+        img.thumbnail((width, height), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if fmt == 'webp':
+        img.save(out, 'WEBP', quality=QUALITY, method=4)
+    else:
+        img.save(out, 'JPEG', quality=QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class VariantCache:
+    """Directory of rendered variants, trimmed oldest-first past `max_bytes`.
+
+    File mtimes are bumped on every hit, so trimming is roughly LRU. The
+    running size is tracked in memory and only re-scanned when trimming.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def path_for(self, source, variant, fmt):
+        key = hashlib.sha256(f"{source}\0{variant}\0{fmt}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def get(self, path):
+        """Return `path` if cached (marking it recently used), else None."""
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, path, data):
+        """Atomically write a variant, then trim the cache if it's too big."""
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._trim()
+
+    def _trim(self):
+        """Delete least recently used files down to 90% of the limit."""
+
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+
+        for path, _, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+
+
+def get_cache(app):
+    """The app's VariantCache, created on first use."""
+
+    cache = app.extensions.get('image_variants')
+    if cache is None:
+        cache = app.extensions['image_variants'] = VariantCache(
+            app.config['IMAGE_CACHE_DIR'], app.config['IMAGE_CACHE_MAX_BYTES'])
+    return cache
+
+
+def variant_path(source, variant, fmt):
+    """Path of the rendered variant on disk, rendering it if needed."""
+
+    cache = get_cache(current_app)
+    path = cache.path_for(source, variant, fmt)
+
+    if cache.get(path) is None:
+        cache.put(path, render_variant(read_source(source), variant, fmt))
+
+    return path
@@ -0,0 +1,92 @@
+"""Apply schema migrations to the Warbler database.
+
+New tables come from the models via `db.create_all()` (which never touches
+existing tables); everything else that changes an existing table lives in
+numbered SQL files in `migrations/`. Each file runs once, in its own
+transaction, and is recorded in `schema_migrations`.
+
+Run it like:
+
+    python migrate.py           # apply anything pending
+    python migrate.py --list    # show applied/pending
+"""
+
+import argparse
+import os
+
+from models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+
+def available_migrations():
+    """List (version, path) for every migration file, in order."""
+
+    return [(name[:-len('.sql')], os.path.join(MIGRATIONS_DIR, name))
+            for name in sorted(os.listdir(MIGRATIONS_DIR))
+            if name.endswith('.sql')]
+
+
+def applied_migrations(conn):
+    """Return the set of versions already recorded as applied."""
+
+    conn.execute(db.text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version TEXT PRIMARY KEY,"
+        " applied_at TIMESTAMP NOT NULL DEFAULT now())"))
+
+    return {row[0] for row
+            in conn.execute(db.text("SELECT version FROM schema_migrations"))}
+
+
+def apply_migrations():
+    """Create missing tables, then run every pending SQL migration.
+
+    Returns the list of versions applied.
+    """
+
+    db.create_all()
+
+    with db.engine.begin() as conn:
+        done = applied_migrations(conn)
+
+    applied = []
+    for version, path in available_migrations():
+        if version in done:
+            continue
+
+        with open(path) as f:
+            sql = f.read()
+
+        with db.engine.begin() as conn:
+            # straight to the DBAPI cursor, so the SQL isn't parsed for binds
+            conn.connection.cursor().execute(sql)
+            conn.execute(db.text(
+                "INSERT INTO schema_migrations (version) VALUES (:version)"),
+                version=version)
+
+        applied.append(version)
+
+    return applied
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--list', action='store_true',
+                        help="show migration status without applying")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        if args.list:
+            with db.engine.begin() as conn:
+                done = applied_migrations(conn)
+            for version, _ in available_migrations():
+                print(f"{'applied' if version in done else 'pending'}  {version}")
+        else:
+            for version in apply_migrations():
+                print(f"applied  {version}")
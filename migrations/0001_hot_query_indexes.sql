@@ -0,0 +1,34 @@
+-- Indexes for the hot queries: user timelines, the global timeline,
+-- like lookups and "who does X follow". Without these every one of them
+-- is a sequential scan.
+
+CREATE INDEX IF NOT EXISTS ix_messages_user_id_timestamp
+    ON messages (user_id, timestamp);
+
+CREATE INDEX IF NOT EXISTS ix_messages_timestamp
+    ON messages (timestamp);
+
+CREATE INDEX IF NOT EXISTS ix_messages_original_message_id
+    ON messages (original_message_id);
+
+CREATE INDEX IF NOT EXISTS ix_follows_user_following_id
+    ON follows (user_following_id, user_being_followed_id);
+
+-- A user can only like a message once. Older code could insert duplicate
+-- likes, so keep the earliest and drop the rest before adding the
+-- constraint.
+DELETE FROM likes a
+    USING likes b
+    WHERE a.user_id = b.user_id
+      AND a.message_id = b.message_id
+      AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_likes_user_id_message_id
+    ON likes (user_id, message_id);
+
+CREATE INDEX IF NOT EXISTS ix_likes_message_id
+    ON likes (message_id);
+
+ANALYZE messages;
+ANALYZE follows;
+ANALYZE likes;
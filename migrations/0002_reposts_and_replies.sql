@@ -0,0 +1,11 @@
+-- Reposts and reply threads on top of messages.original_message_id.
+
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS is_repost BOOLEAN NOT NULL DEFAULT false;
+
+-- Thread loading walks replies of a message in id order, so extend the
+-- plain original_message_id index from 0001 with id.
+DROP INDEX IF EXISTS ix_messages_original_message_id;
+
+CREATE INDEX IF NOT EXISTS ix_messages_original_message_id_id
+    ON messages (original_message_id, id);
@@ -0,0 +1,70 @@
+-- Time-ordered 64-bit message ids (see snowflake.py).
+--
+-- Existing messages get new ids built from their timestamps with the
+-- reserved backfill worker id (1023), numbered in old id order so the
+-- existing order is kept. Rows landing on the same millisecond take
+-- successive sequence numbers and spill into later milliseconds past 4096;
+-- snowflake.backfill_ids does the same numbering in Python. Run this with
+-- the app stopped: every message id and every reference to one changes.
+
+CREATE TEMP TABLE message_id_map ON COMMIT DROP AS
+SELECT old_id,
+       ((slot / 4096) << 22) | (1023 << 12) | (slot % 4096) AS new_id
+FROM (
+    SELECT id AS old_id,
+           n + max(ms * 4096 - n) OVER (ORDER BY id
+                                        ROWS UNBOUNDED PRECEDING) AS slot
+    FROM (
+        SELECT id,
+               greatest(0, (extract(epoch FROM timestamp) * 1000)::bigint
+                           - 1420070400000) AS ms,
+               row_number() OVER (ORDER BY id) - 1 AS n
+        FROM messages
+    ) numbered
+) slotted;
+
+CREATE UNIQUE INDEX ON message_id_map (old_id);
+
+ALTER TABLE likes DROP CONSTRAINT IF EXISTS likes_message_id_fkey;
+ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_original_message_id_fkey;
+
+ALTER TABLE messages ALTER COLUMN id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS messages_id_seq;
+
+ALTER TABLE messages
+    ALTER COLUMN id TYPE BIGINT,
+    ALTER COLUMN original_message_id TYPE BIGINT;
+ALTER TABLE likes ALTER COLUMN message_id TYPE BIGINT;
+
+UPDATE likes l
+    SET message_id = map.new_id
+    FROM message_id_map map
+    WHERE l.message_id = map.old_id;
+
+UPDATE messages m
+    SET original_message_id = map.new_id
+    FROM message_id_map map
+    WHERE m.original_message_id = map.old_id;
+
+UPDATE messages m
+    SET id = map.new_id
+    FROM message_id_map map
+    WHERE m.id = map.old_id;
+
+ALTER TABLE likes
+    ADD CONSTRAINT likes_message_id_fkey FOREIGN KEY (message_id)
+    REFERENCES messages (id) ON DELETE CASCADE;
+ALTER TABLE messages
+    ADD CONSTRAINT messages_original_message_id_fkey
+    FOREIGN KEY (original_message_id)
+    REFERENCES messages (id) ON DELETE CASCADE;
+
+-- Timelines order by id now, not timestamp.
+DROP INDEX IF EXISTS ix_messages_user_id_timestamp;
+DROP INDEX IF EXISTS ix_messages_timestamp;
+
+CREATE INDEX IF NOT EXISTS ix_messages_user_id_id
+    ON messages (user_id, id);
+
+ANALYZE messages;
+ANALYZE likes;
@@ -0,0 +1,113 @@
+-- Partition messages and likes by month, on snowflake id ranges.
+--
+-- Message ids are time-ordered (0003), so a month of messages is an id
+-- range, and likes are partitioned on message_id with the same ranges:
+-- a month's likes live next to its messages and can be archived with them
+-- (see partitions.py). Needs PostgreSQL 12+ (foreign keys to partitioned
+-- tables). Run with the app stopped; both tables are copied.
+--
+-- messages.original_message_id loses its foreign key: a reply or repost
+-- may point at a message whose partition has been archived.
+
+-- Creates the month's messages and likes partitions if missing; returns
+-- the suffix, e.g. '2019_03'. partitions.py calls this too.
+CREATE OR REPLACE FUNCTION warbler_month_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    first_day TIMESTAMP := greatest(date_trunc('month', month::TIMESTAMP),
+                                    '2015-01-01');
+    lo BIGINT := ((extract(epoch FROM first_day) * 1000)::BIGINT
+                  - 1420070400000) << 22;
+    hi BIGINT := ((extract(epoch FROM first_day + INTERVAL '1 month') * 1000)::BIGINT
+                  - 1420070400000) << 22;
+    suffix TEXT := to_char(first_day, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages '
+        'FOR VALUES FROM (%s) TO (%s)', 'messages_p' || suffix, lo, hi);
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF likes '
+        'FOR VALUES FROM (%s) TO (%s)', 'likes_p' || suffix, lo, hi);
+    RETURN suffix;
+END
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE likes DROP CONSTRAINT IF EXISTS likes_message_id_fkey;
+ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_original_message_id_fkey;
+
+ALTER TABLE messages RENAME TO messages_unpartitioned;
+ALTER TABLE likes RENAME TO likes_unpartitioned;
+
+-- keep the likes id sequence when the old table goes
+ALTER SEQUENCE likes_id_seq OWNED BY NONE;
+
+ALTER INDEX IF EXISTS messages_pkey RENAME TO messages_unpartitioned_pkey;
+ALTER INDEX IF EXISTS likes_pkey RENAME TO likes_unpartitioned_pkey;
+DROP INDEX IF EXISTS ix_messages_user_id_id;
+DROP INDEX IF EXISTS ix_messages_original_message_id_id;
+DROP INDEX IF EXISTS uq_likes_user_id_message_id;
+DROP INDEX IF EXISTS ix_likes_message_id;
+
+CREATE TABLE messages (
+    id BIGINT NOT NULL,
+    text VARCHAR(140) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    original_message_id BIGINT,
+    is_repost BOOLEAN NOT NULL DEFAULT false,
+    CONSTRAINT messages_pkey PRIMARY KEY (id)
+) PARTITION BY RANGE (id);
+
+-- the partition key has to be part of the primary key
+CREATE TABLE likes (
+    id INTEGER NOT NULL DEFAULT nextval('likes_id_seq'),
+    user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+    message_id BIGINT NOT NULL,
+    likes_count INTEGER,
+    liked_count INTEGER,
+    CONSTRAINT likes_pkey PRIMARY KEY (message_id, id),
+    CONSTRAINT likes_message_id_fkey FOREIGN KEY (message_id)
+        REFERENCES messages (id) ON DELETE CASCADE
+) PARTITION BY RANGE (message_id);
+
+ALTER SEQUENCE likes_id_seq OWNED BY likes.id;
+
+-- every month that has messages, through two months from now
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    SELECT date_trunc('month', to_timestamp(
+               ((min(id) >> 22) + 1420070400000) / 1000.0) AT TIME ZONE 'UTC')
+        INTO month
+        FROM messages_unpartitioned;
+
+    month := coalesce(month, date_trunc('month', now() AT TIME ZONE 'UTC'));
+
+    WHILE month <= (now() AT TIME ZONE 'UTC') + INTERVAL '2 months' LOOP
+        PERFORM warbler_month_partition(month);
+        month := month + INTERVAL '1 month';
+    END LOOP;
+END
+$$;
+
+INSERT INTO messages (id, text, timestamp, user_id, original_message_id, is_repost)
+    SELECT id, text, timestamp, user_id, original_message_id, is_repost
+    FROM messages_unpartitioned;
+
+-- likes with no message (older code could write those) have nowhere to go
+INSERT INTO likes (id, user_id, message_id, likes_count, liked_count)
+    SELECT l.id, l.user_id, l.message_id, l.likes_count, l.liked_count
+    FROM likes_unpartitioned l
+    JOIN messages m ON m.id = l.message_id;
+
+DROP TABLE likes_unpartitioned;
+DROP TABLE messages_unpartitioned;
+
+CREATE INDEX ix_messages_user_id_id ON messages (user_id, id);
+CREATE INDEX ix_messages_original_message_id_id
+    ON messages (original_message_id, id);
+CREATE UNIQUE INDEX uq_likes_user_id_message_id ON likes (user_id, message_id);
+CREATE INDEX ix_likes_message_id ON likes (message_id);
+
+ANALYZE messages;
+ANALYZE likes;
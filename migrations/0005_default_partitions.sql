@@ -0,0 +1,59 @@
+-- Catch-all partitions for messages and likes.
+--
+-- Without them an insert past the newest monthly partition fails, so a
+-- lapsed `flask partitions ensure` cron would stop all posting at the
+-- month boundary. Rows that land here are moved into their month's
+-- partition when it's created (warbler_month_partition below, which
+-- `ensure` calls); `flask partitions check` alerts on both.
+
+CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;
+CREATE TABLE IF NOT EXISTS likes_default PARTITION OF likes DEFAULT;
+
+-- A month can no longer simply be created as a partition: Postgres refuses
+-- while the default partition holds rows in its range. So the month is
+-- built as a plain table, the default partition's rows for it are moved
+-- across (likes first, or deleting the messages would cascade to them),
+-- and then it's attached.
+CREATE OR REPLACE FUNCTION warbler_month_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    first_day TIMESTAMP := greatest(date_trunc('month', month::TIMESTAMP),
+                                    '2015-01-01');
+    lo BIGINT := ((extract(epoch FROM first_day) * 1000)::BIGINT
+                  - 1420070400000) << 22;
+    hi BIGINT := ((extract(epoch FROM first_day + INTERVAL '1 month') * 1000)::BIGINT
+                  - 1420070400000) << 22;
+    suffix TEXT := to_char(first_day, 'YYYY_MM');
+    messages_part TEXT := 'messages_p' || suffix;
+    likes_part TEXT := 'likes_p' || suffix;
+BEGIN
+    IF to_regclass(messages_part) IS NOT NULL THEN
+        RETURN suffix;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE messages INCLUDING DEFAULTS)',
+                   messages_part);
+    EXECUTE format('CREATE TABLE %I (LIKE likes INCLUDING DEFAULTS)',
+                   likes_part);
+
+    EXECUTE format(
+        'INSERT INTO %I SELECT * FROM messages_default'
+        ' WHERE id >= %s AND id < %s', messages_part, lo, hi);
+    EXECUTE format(
+        'INSERT INTO %I SELECT * FROM likes_default'
+        ' WHERE message_id >= %s AND message_id < %s', likes_part, lo, hi);
+    EXECUTE format(
+        'DELETE FROM likes_default WHERE message_id >= %s AND message_id < %s',
+        lo, hi);
+    EXECUTE format(
+        'DELETE FROM messages_default WHERE id >= %s AND id < %s', lo, hi);
+
+    EXECUTE format(
+        'ALTER TABLE messages ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+        messages_part, lo, hi);
+    EXECUTE format(
+        'ALTER TABLE likes ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+        likes_part, lo, hi);
+
+    RETURN suffix;
+END
+$$ LANGUAGE plpgsql;
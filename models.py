@@ -5,6 +5,9 @@ from datetime import datetime
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
 
+import snowflake
+from sharding import get_router
+
 bcrypt = Bcrypt()
 db = SQLAlchemy()
 
@@ -14,6 +17,12 @@ class Follows(db.Model):
 
     __tablename__ = 'follows'
 
+    # The primary key covers "who follows X"; this covers "who does X follow".
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
     user_being_followed_id = db.Column(
         db.Integer,
         db.ForeignKey('users.id', ondelete="cascade"),
@@ -32,6 +41,12 @@ class Likes(db.Model):
 
     __tablename__ = 'likes'
 
+    __table_args__ = (
+        db.Index('uq_likes_user_id_message_id',
+                 'user_id', 'message_id', unique=True),
+        db.Index('ix_likes_message_id', 'message_id'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True
@@ -43,17 +58,22 @@ class Likes(db.Model):
     )
 
     message_id = db.Column(
-        db.Integer,
+        db.BigInteger,
         db.ForeignKey('messages.id', ondelete='cascade')
     )
 
     likes_count = db.Column(db.Integer, default=0)
     liked_count = db.Column(db.Integer, default=0)
 
+    message = db.relationship('Message')
+
     def __init__(self, user_id=None, message_id=None, message=None):
         self.user_id = user_id
         self.message_id = message_id
-        self.message = message
+        # assigning None here would null message_id at flush, and likes are
+        # partitioned on message_id
+        if message is not None:
+            self.message = message
         self.liked_count = 0
         self.likes_count = 0
 
@@ -63,11 +83,10 @@ class Likes(db.Model):
             if user.id == self.message.user_id:
                 return
 
+        # (messages have no like counter column; counts come from the likes
+        # themselves, see sharding.ShardRouter.like_counts)
         self.likes_count += 1
 
-        if self.message:
-            self.message.likes_count += 1
-
         db.session.commit()
 
 
@@ -125,47 +144,36 @@ class User(db.Model):
 
     messages = db.relationship('Message')
 
-    followers = db.relationship(
-        "User",
-        secondary="follows",
-        primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
-    )
-
-    following = db.relationship(
-        "User",
-        secondary="follows",
-        primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
-    )
-
-    likes = db.relationship(
-        'Message',
-        secondary="likes"
-    )
-
-    liked = db.relationship(
-        'Message',
-        secondary="likes",
-        backref=db.backref('liked_by')
-    )
-
     warbles_count = db.Column(db.Integer, default=0)
 
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
+    # Follows and likes are read through the shard router (sharding.py),
+    # not relationships: with more than one shard they aren't in this
+    # database.
+
     def is_followed_by(self, other_user):
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return get_router().is_following(other_user.id, self.id)
 
     def is_following(self, other_user):
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return get_router().is_following(self.id, other_user.id)
 
     def has_liked_message(self, message):
-        return Likes.query.filter_by(user_id=self.id, message_id=message.id).first() is not None
+        return get_router().has_liked(self.id, message.id)
+
+    @property
+    def following_count(self):
+        return get_router().following_counts([self.id])[self.id]
+
+    @property
+    def followers_count(self):
+        return get_router().follower_counts([self.id])[self.id]
+
+    @property
+    def likes_count(self):
+        return get_router().likes_counts([self.id])[self.id]
 
     def update_warbles_count(self):
         self.warbles_count = Message.query.filter_by(user_id=self.id).count()
@@ -224,9 +232,20 @@ class Message(db.Model):
 
     __tablename__ = 'messages'
 
+    # ids are time-ordered (see snowflake.py), so the primary key already
+    # serves "newest first"; per-user timelines need (user_id, id).
+    __table_args__ = (
+        db.Index('ix_messages_user_id_id', 'user_id', 'id'),
+        # replies to a message, oldest first (thread loading)
+        db.Index('ix_messages_original_message_id_id',
+                 'original_message_id', 'id'),
+    )
+
     id = db.Column(
-        db.Integer,
+        db.BigInteger,
         primary_key=True,
+        autoincrement=False,
+        default=snowflake.next_id,
     )
 
     text = db.Column(
@@ -237,7 +256,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -246,20 +265,179 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # Only declared for the `original` relationship: the database drops this
+    # foreign key (migrations/0004), since originals can be archived.
     original_message_id = db.Column(
-        db.Integer,
+        db.BigInteger,
         db.ForeignKey('messages.id', ondelete='CASCADE'),
         nullable=True
     )
 
+    # A repost is an empty row pointing at the original; a reply is a
+    # normal message with original_message_id set.
+    is_repost = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default=db.false(),
+    )
+
 
     user = db.relationship('User')
 
-    likes = db.relationship('Likes', backref='message')
+    original = db.relationship('Message', remote_side=[id])
 
-    def __init__(self, text):
+    def __init__(self, text, original_message_id=None, is_repost=False):
         self.text = text
-    
+        self.original_message_id = original_message_id
+        self.is_repost = is_repost
+
+    @property
+    def content(self):
+        """The message whose text should be shown (the original, for reposts)."""
+
+        if self.is_repost and self.original is not None:
+            return self.original
+        # not a repost, or the original's month has been archived
+        return self
+
+    @classmethod
+    def repost(cls, user, message):
+        """Repost `message` as `user`; reposting a repost reposts its original.
+
+        Returns the existing repost if `user` already reposted it.
+        """
+
+        original_id = (message.original_message_id if message.is_repost
+                       else message.id)
+
+        existing = cls.query.filter_by(user_id=user.id,
+                                       original_message_id=original_id,
+                                       is_repost=True).first()
+        if existing:
+            return existing
+
+        repost = cls(text='', original_message_id=original_id, is_repost=True)
+        user.messages.append(repost)
+        return repost
+
+
+class FollowSuggestion(db.Model):
+    """Precomputed "who to follow" suggestion for a user.
+
+    Rows are written in bulk by `suggestions.py`; the homepage only ever reads
+    them by primary key, (user_id, rank), so it's a single indexed lookup.
+    """
+
+    __tablename__ = 'follow_suggestions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    rank = db.Column(
+        db.SmallInteger,
+        primary_key=True,
+    )
+
+    suggested_user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    mutual_count = db.Column(db.Integer, nullable=False)
+
+    score = db.Column(db.Float, nullable=False)
+
+    computed_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+
+class Notification(db.Model):
+    """A rollup of like or follow events for one user.
+
+    One row per (recipient, kind, subject, time bucket) -- "12 people liked
+    your warble" -- upserted by `notifications.py` as events happen, with
+    what the feed shows copied in, so reading the feed is one index scan
+    on (recipient_id, updated_at, id) with no joins.
+    """
+
+    __tablename__ = 'notifications'
+
+    __table_args__ = (
+        db.UniqueConstraint('recipient_id', 'kind', 'subject_id', 'bucket',
+                            name='uq_notifications_rollup'),
+        db.Index('ix_notifications_recipient_id_updated_at_id',
+                 'recipient_id', 'updated_at', 'id'),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    recipient_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    # 'like' or 'follow'
+    kind = db.Column(db.String(16), nullable=False)
+
+    # the liked message's id; 0 for follows (the subject is the recipient)
+    subject_id = db.Column(db.BigInteger, nullable=False)
+
+    # start of the time bucket the events fell in
+    bucket = db.Column(db.DateTime, nullable=False)
+
+    actor_count = db.Column(db.Integer, nullable=False)
+
+    # cleared if that actor takes it back
+    last_actor_id = db.Column(db.Integer)
+
+    last_actor_username = db.Column(db.Text)
+
+    # start of the liked message's text; empty for follows
+    excerpt = db.Column(db.String(140), nullable=False, default='')
+
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+class NotificationActor(db.Model):
+    """Which bucket's rollup an actor is counted in.
+
+    One row per actor per (recipient, kind, subject), so an unlike or
+    unfollow takes the actor off the rollup their like or follow went
+    into, even if the bucket has moved on since.
+    """
+
+    __tablename__ = 'notification_actors'
+
+    recipient_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    kind = db.Column(db.String(16), primary_key=True)
+
+    subject_id = db.Column(db.BigInteger, primary_key=True)
+
+    actor_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    bucket = db.Column(db.DateTime, nullable=False)
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
@@ -0,0 +1,213 @@
+"""Like and follow notifications, rolled up as they happen.
+
+Each like or follow upserts one `notifications` row per (recipient, kind,
+subject, time bucket): the actor count goes up by one and the last actor's
+name (and, for likes, the start of the message) is copied in. So the feed
+reads "@alice and 11 others liked your warble" straight off the row, with
+no join against likes, messages or users at read time, and a page of the
+feed is one range scan of (recipient_id, updated_at, id).
+
+`notification_actors` remembers which bucket each actor was counted in.
+An unlike or unfollow takes one off that bucket's rollup, even if it's an
+earlier one (and un-names the actor if they were the one shown), and drops
+it at zero, so toggling doesn't inflate the count.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Notification, NotificationActor
+
+EPOCH = datetime(1970, 1, 1)
+EXCERPT_LENGTH = 80
+PER_PAGE = 30
+
+LIKE = 'like'
+FOLLOW = 'follow'
+
+
+def bucket_start(when, hours):
+    """Start of the `hours`-long bucket `when` falls in."""
+
+    step = timedelta(hours=hours)
+    return EPOCH + (when - EPOCH) // step * step
+
+
+def _rollup_key(recipient_id, kind, subject_id, bucket):
+    table = Notification.__table__
+    return table, dict(recipient_id=recipient_id, kind=kind,
+                       subject_id=subject_id, bucket=bucket)
+
+
+def _match(table, key):
+    return and_(*[table.c[name] == value for name, value in key.items()])
+
+
+def _count_in(key, actor_id):
+    """Note that `actor_id` is counted in `key`'s rollup.
+
+    False if they're already counted in one for this subject, in which case
+    they mustn't be counted again.
+    """
+
+    actors = NotificationActor.__table__
+    row = dict(key, actor_id=actor_id)
+
+    if db.engine.dialect.name == 'postgresql':
+        insert = pg_insert(actors).values(**row).on_conflict_do_nothing()
+        return bool(db.session.execute(insert).rowcount)
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(actors.insert().values(**row))
+    except IntegrityError:
+        return False
+    return True
+
+
+def _uncount(recipient_id, kind, subject_id, actor_id):
+    """The bucket `actor_id` was counted in, forgetting it; None if none."""
+
+    actors = NotificationActor.__table__
+    who = _match(actors, dict(recipient_id=recipient_id, kind=kind,
+                              subject_id=subject_id, actor_id=actor_id))
+
+    bucket = db.session.execute(select([actors.c.bucket]).where(who)).scalar()
+    if bucket is None:
+        return None
+
+    # whoever deletes the row does the decrement, so it happens once
+    if not db.session.execute(actors.delete().where(who)).rowcount:
+        return None
+    return bucket
+
+
+def _record(recipient_id, kind, subject_id, actor, excerpt=''):
+    """Count `actor` into the current rollup, creating it if need be."""
+
+    if recipient_id == actor.id:
+        return
+
+    now = datetime.utcnow()
+    bucket = bucket_start(now, current_app.config['NOTIFICATION_BUCKET_HOURS'])
+    table, key = _rollup_key(recipient_id, kind, subject_id, bucket)
+
+    if not _count_in(key, actor.id):
+        db.session.commit()
+        return
+
+    latest = dict(last_actor_id=actor.id, last_actor_username=actor.username,
+                  excerpt=excerpt, updated_at=now)
+
+    if db.engine.dialect.name == 'postgresql':
+        insert = pg_insert(table).values(actor_count=1, **key, **latest)
+        db.session.execute(insert.on_conflict_do_update(
+            constraint='uq_notifications_rollup',
+            set_=dict(actor_count=table.c.actor_count + 1, **latest)))
+    else:
+        # no ON CONFLICT: update, else insert, else someone just inserted it
+        bump = (table.update().where(_match(table, key))
+                .values(actor_count=table.c.actor_count + 1, **latest))
+        if not db.session.execute(bump).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(
+                        actor_count=1, **key, **latest))
+            except IntegrityError:
+                db.session.execute(bump)
+
+    db.session.commit()
+
+
+def _retract(recipient_id, kind, subject_id, actor):
+    """Take `actor` off the rollup they were counted in; delete it if empty."""
+
+    if recipient_id == actor.id:
+        return
+
+    bucket = _uncount(recipient_id, kind, subject_id, actor.id)
+    if bucket is None:
+        db.session.commit()
+        return
+
+    table, key = _rollup_key(recipient_id, kind, subject_id, bucket)
+
+    # if they were the one named, name nobody rather than the wrong person
+    was_last = table.c.last_actor_id == actor.id
+    db.session.execute(table.update().where(_match(table, key)).values(
+        actor_count=table.c.actor_count - 1,
+        last_actor_id=case([(was_last, None)], else_=table.c.last_actor_id),
+        last_actor_username=case([(was_last, None)],
+                                 else_=table.c.last_actor_username)))
+    db.session.execute(table.delete().where(
+        and_(_match(table, key), table.c.actor_count <= 0)))
+    db.session.commit()
+
+
+def notify_like(actor, message):
+    _record(message.user_id, LIKE, message.id, actor,
+            excerpt=message.content.text[:EXCERPT_LENGTH])
+
+
+def retract_like(actor, message):
+    _retract(message.user_id, LIKE, message.id, actor)
+
+
+def notify_follow(actor, followed):
+    _record(followed.id, FOLLOW, 0, actor)
+
+
+def retract_follow(actor, followed):
+    _retract(followed.id, FOLLOW, 0, actor)
+
+
+##############################################################################
+# Reading
+
+
+def encode_cursor(notification):
+    """Opaque 'before' value for the page after `notification`."""
+
+    micros = (notification.updated_at - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}.{notification.id}"
+
+
+def decode_cursor(cursor):
+    """(updated_at, id) from `encode_cursor`, or None if it's malformed."""
+
+    try:
+        micros, id_ = (int(part) for part in cursor.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return EPOCH + timedelta(microseconds=micros), id_
+
+
+def notifications_page(user_id, before=None, per_page=PER_PAGE):
+    """One page of `user_id`'s rollups, most recently updated first.
+
+    Keyset pagination on (updated_at, id), matching the index; `before` is
+    a cursor from `encode_cursor`. Returns (notifications, next_before),
+    with next_before None on the last page.
+    """
+
+    query = Notification.query.filter(Notification.recipient_id == user_id)
+
+    position = decode_cursor(before) if before else None
+    if position:
+        query = query.filter(tuple_(Notification.updated_at, Notification.id)
+                             < tuple_(*position))
+
+    notifications = (query
+                     .order_by(Notification.updated_at.desc(),
+                               Notification.id.desc())
+                     .limit(per_page)
+                     .all())
+
+    next_before = (encode_cursor(notifications[-1])
+                   if len(notifications) == per_page else None)
+
+    return notifications, next_before
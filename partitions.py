@@ -0,0 +1,389 @@
+"""Monthly partitions of messages/likes, and archival of cold months.
+
+`messages` is range-partitioned on its (time-ordered) id, one partition per
+month, and `likes` on message_id with the same ranges (migrations/0004).
+Almost every read is for the last few days, so only the newest partitions
+need to stay in RAM:
+
+- `ensure_partitions` creates the next few months ahead of time (run it
+  from cron). Inserts past the last month land in the DEFAULT partitions
+  (migrations/0005) instead of failing, and are moved into their month
+  when it's created; `check_partitions` alerts when that happens or the
+  horizon gets close.
+- `archive_partition` writes an old month to ARCHIVE_DIR as gzip NDJSON,
+  one row per message with its likers, then drops both partitions. The
+  file is a series of independently gzipped blocks of BLOCK_ROWS messages,
+  with a small JSON index of each block's first id and offset, so reading
+  one archived message decompresses one block.
+- `archived_message` is that read; the message view falls back to it.
+
+    flask partitions list
+    flask partitions ensure --ahead 2
+    flask partitions check --ahead 1
+    flask partitions archive --keep 6
+"""
+
+import bisect
+import gzip
+import json
+import os
+import re
+import zlib
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db, User
+from sharding import get_router
+from snowflake import id_floor, timestamp_of
+
+BLOCK_ROWS = 1000
+
+PARTITION_NAME = re.compile(r'^messages_p(\d{4})_(\d{2})$')
+
+
+def add_months(month, n):
+    """First day of the month `n` months after `month`."""
+
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(message_id):
+    """First day of the month whose partition holds `message_id`."""
+
+    created = timestamp_of(message_id)
+    return date(created.year, created.month, 1)
+
+
+def month_range(month):
+    """The [low, high) id range of `month`'s partitions."""
+
+    following = add_months(month, 1)
+    return (id_floor(datetime(month.year, month.month, 1)),
+            id_floor(datetime(following.year, following.month, 1)))
+
+
+def partition_months():
+    """Months that have a live messages partition, oldest first."""
+
+    rows = db.session.execute(db.text(
+        "SELECT c.relname FROM pg_inherits i"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = 'messages'::regclass"))
+
+    months = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def ensure_partitions(ahead=2, today=None):
+    """Create partitions from this month through `ahead` months from now."""
+
+    today = today or datetime.utcnow().date()
+    month = date(today.year, today.month, 1)
+
+    created = []
+    for n in range(ahead + 1):
+        created.append(db.session.execute(
+            db.text("SELECT warbler_month_partition(:month)"),
+            dict(month=add_months(month, n))).scalar())
+    db.session.commit()
+
+    return created
+
+
+def default_rows():
+    """Messages sitting in the DEFAULT partition (their month is missing)."""
+
+    return db.session.execute(db.text(
+        "SELECT count(*) FROM messages_default")).scalar()
+
+
+def check_partitions(ahead=1, today=None):
+    """Problems that need `ensure` run: [] when all is well.
+
+    There should be partitions through `ahead` months from now, and nothing
+    in the DEFAULT partition.
+    """
+
+    today = today or datetime.utcnow().date()
+    wanted = add_months(date(today.year, today.month, 1), ahead)
+
+    problems = []
+    months = partition_months()
+    if not months or months[-1] < wanted:
+        newest = f"{months[-1]:%Y-%m}" if months else "none"
+        problems.append(f"partitions end at {newest}, "
+                        f"need through {wanted:%Y-%m}")
+
+    stray = default_rows()
+    if stray:
+        problems.append(f"{stray} messages in messages_default")
+
+    return problems
+
+
+##############################################################################
+# Archival
+
+
+def archive_paths(month):
+    """(data file, index file) for `month` under ARCHIVE_DIR."""
+
+    base = os.path.join(current_app.config['ARCHIVE_DIR'],
+                        f"messages_p{month:%Y_%m}")
+    return base + '.ndjson.gz', base + '.idx.json'
+
+
+def _archive_rows(month, batch_size=BLOCK_ROWS):
+    """Messages of `month` in id order, each with the ids of its likers.
+
+    Read in keyset batches of `batch_size` messages, each with just its own
+    likers, so memory is bounded by a batch rather than the month.
+    """
+
+    low, high = month_range(month)
+    after = low - 1
+
+    while True:
+        rows = db.session.execute(db.text(
+            "SELECT id, text, timestamp, user_id, original_message_id,"
+            " is_repost FROM messages"
+            " WHERE id > :after AND id < :high ORDER BY id LIMIT :limit"),
+            dict(after=after, high=high, limit=batch_size)).fetchall()
+        if not rows:
+            return
+
+        likers = get_router().likers_of(row.id for row in rows)
+
+        for row in rows:
+            yield dict(id=row.id, text=row.text,
+                       timestamp=row.timestamp.isoformat(),
+                       user_id=row.user_id,
+                       original_message_id=row.original_message_id,
+                       is_repost=row.is_repost,
+                       liked_by=likers.get(row.id, []))
+
+        after = rows[-1].id
+
+
+def write_archive(rows, data_path, index_path):
+    """Write `rows` as gzip blocks of BLOCK_ROWS lines, plus the index.
+
+    Returns the number of rows written.
+    """
+
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+    index = []
+    count = 0
+    block = []
+
+    with open(data_path + '.tmp', 'wb') as out:
+        def flush():
+            index.append([block[0]['id'], out.tell()])
+            out.write(gzip.compress(
+                ''.join(json.dumps(row) + '\n' for row in block).encode()))
+            block.clear()
+
+        for row in rows:
+            block.append(row)
+            count += 1
+            if len(block) == BLOCK_ROWS:
+                flush()
+        if block:
+            flush()
+
+        index.append([None, out.tell()])
+        out.flush()
+        os.fsync(out.fileno())
+
+    with open(index_path + '.tmp', 'w') as out:
+        json.dump(index, out)
+
+    os.replace(data_path + '.tmp', data_path)
+    os.replace(index_path + '.tmp', index_path)
+
+    return count
+
+
+def archive_partition(month):
+    """Move `month`'s messages and likes to cold storage.
+
+    The archive is written and read back before anything is dropped.
+    Returns the number of messages archived.
+    """
+
+    data_path, index_path = archive_paths(month)
+    count = write_archive(_archive_rows(month), data_path, index_path)
+
+    with gzip.open(data_path, 'rt') as archived:
+        if sum(1 for _ in archived) != count:
+            raise RuntimeError(f"archive {data_path} is incomplete")
+
+    # likes first: they reference the messages partition
+    for parent in ('likes', 'messages'):
+        table = f"{parent}_p{month:%Y_%m}"
+        db.session.execute(f"ALTER TABLE {parent} DETACH PARTITION {table}")
+        db.session.execute(f"DROP TABLE {table}")
+    db.session.commit()
+
+    # with shard databases, the likes are there (unpartitioned)
+    get_router().purge_messages_between(*month_range(month))
+
+    _index_cache.clear()
+    return count
+
+
+def archive_old_partitions(keep=6, today=None):
+    """Archive every month older than the newest `keep` months.
+
+    Returns [(month, messages archived)].
+    """
+
+    today = today or datetime.utcnow().date()
+    cutoff = add_months(date(today.year, today.month, 1), -keep)
+
+    return [(month, archive_partition(month))
+            for month in partition_months() if month < cutoff]
+
+
+##############################################################################
+# Reading archived messages
+
+
+class ArchivedMessage:
+    """A message read back from cold storage.
+
+    Quacks enough like `Message` for the message view; read-only.
+    """
+
+    archived = True
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.text = row['text']
+        self.timestamp = datetime.fromisoformat(row['timestamp'])
+        self.user_id = row['user_id']
+        self.original_message_id = row['original_message_id']
+        self.is_repost = row['is_repost']
+        self.liked_by = row['liked_by']
+
+    @property
+    def user(self):
+        return User.query.get(self.user_id)
+
+    @property
+    def content(self):
+        return self
+
+
+_index_cache = {}
+
+
+def _read_index(index_path):
+    """Block index for an archive, cached by path and mtime."""
+
+    mtime = os.path.getmtime(index_path)
+    cached = _index_cache.get(index_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(index_path) as f:
+        index = json.load(f)
+    _index_cache[index_path] = (mtime, index)
+    return index
+
+
+def archived_message(message_id):
+    """The archived message with `message_id`, or None."""
+
+    data_path, index_path = archive_paths(month_of(message_id))
+    if not os.path.exists(index_path):
+        return None
+
+    index = _read_index(index_path)
+    first_ids = [first_id for first_id, _ in index[:-1]]
+    block = bisect.bisect_right(first_ids, message_id) - 1
+    if block < 0:
+        return None
+
+    start, end = index[block][1], index[block + 1][1]
+    with open(data_path, 'rb') as f:
+        f.seek(start)
+        raw = f.read(end - start)
+
+    for line in zlib.decompress(raw, 16 + zlib.MAX_WBITS).splitlines():
+        row = json.loads(line)
+        if row['id'] == message_id:
+            return ArchivedMessage(row)
+
+    return None
+
+
+##############################################################################
+# CLI
+
+
+@click.group('partitions')
+def partitions_command():
+    """Manage monthly message partitions."""
+
+
+@partitions_command.command('list')
+@with_appcontext
+def list_command():
+    """Show live partitions and archived months."""
+
+    for month in partition_months():
+        click.echo(f"live      {month:%Y-%m}")
+    click.echo(f"default   {default_rows()} messages")
+
+    archive_dir = current_app.config['ARCHIVE_DIR']
+    if os.path.isdir(archive_dir):
+        for name in sorted(os.listdir(archive_dir)):
+            if name.endswith('.ndjson.gz'):
+                click.echo(f"archived  {name}")
+
+
+@partitions_command.command('ensure')
+@click.option('--ahead', default=2, show_default=True,
+              help="months to create beyond the current one")
+@with_appcontext
+def ensure_command(ahead):
+    """Create upcoming monthly partitions."""
+
+    for suffix in ensure_partitions(ahead):
+        click.echo(f"ok        {suffix}")
+
+
+@partitions_command.command('check')
+@click.option('--ahead', default=1, show_default=True,
+              help="months beyond the current one that must exist")
+@with_appcontext
+def check_command(ahead):
+    """Exit non-zero if partitions need attention (for monitoring)."""
+
+    problems = check_partitions(ahead)
+    for problem in problems:
+        click.echo(f"problem   {problem}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo("ok")
+
+
+@partitions_command.command('archive')
+@click.option('--keep', default=6, show_default=True,
+              help="newest months to keep in the database")
+@with_appcontext
+def archive_command(keep):
+    """Move months older than --keep to ARCHIVE_DIR."""
+
+    for month, count in archive_old_partitions(keep):
+        click.echo(f"archived  {month:%Y-%m}  {count} messages")
@@ -0,0 +1,309 @@
+"""Rate limiting and load shedding for expensive endpoints.
+
+Two independent guards:
+
+- Per-route token buckets (`@rate_limit('login')`), keyed by client IP and,
+  when logged in, user id. Budgets come from RATE_LIMITS. Buckets live in a
+  backend: `MemoryBackend` keeps them in-process (one budget per worker;
+  also the stand-in for tests and local dev), `RedisBackend` shares them
+  across workers and hosts. Over budget -> 429 with Retry-After.
+
+- A global concurrency limiter: at most MAX_CONCURRENT_REQUESTS requests
+  per process run at once, sized to the DB pool so requests are turned away
+  with a 503 before they queue on pool checkout.
+
+Counters for both are exported in Prometheus text format at /metrics, for
+scrapers that send `Authorization: Bearer <METRICS_TOKEN>` (404 otherwise,
+and always when no token is configured).
+
+Client IPs come from REMOTE_ADDR, so behind reverse proxies set
+TRUSTED_PROXIES to how many there are: X-Forwarded-For is then trusted that
+many hops back. Never set it higher, or clients can pick their own key.
+"""
+
+import hmac
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import Response, abort, current_app, g, request
+
+try:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+except ImportError:  # Werkzeug < 0.15
+    from werkzeug.contrib.fixers import ProxyFix
+
+DEFAULT_RATE_LIMITS = {
+    # name: (tokens per second, burst, methods)
+    'login': (5 / 60, 10, ('POST',)),
+    'signup': (2 / 60, 5, ('POST',)),
+    'availability': (1, 20, ('GET',)),
+    'messages_add': (1, 10, ('POST',)),
+    'likes': (2, 30, ('POST',)),
+    'export': (1 / 60, 5, ('GET',)),
+    'api': (20, 100, ('GET', 'POST')),
+}
+
+
+class MemoryBackend:
+    """Token buckets in a dict, guarded by a lock.
+
+    A full bucket is the same as no bucket, so every `sweep_seconds` the
+    ones that have refilled are dropped; otherwise every IP ever seen would
+    stay in memory. `clock` is injectable so tests can move time by hand.
+    """
+
+    def __init__(self, clock=time.monotonic, sweep_seconds=60):
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (tokens, updated, full_at)
+        self._buckets = {}
+        self._sweep_seconds = sweep_seconds
+        self._next_sweep = clock() + sweep_seconds
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, rate, burst, cost=1):
+        """Take `cost` tokens from bucket `key`.
+
+        Returns (allowed, retry_after_seconds).
+        """
+
+        now = self._clock()
+
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                self._buckets[key] = (tokens, now,
+                                      now + (burst - tokens) / rate)
+                return True, 0.0
+
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return False, (cost - tokens) / rate
+
+    def _sweep(self, now):
+        """Drop buckets that have refilled since they were last used."""
+
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[2] > now}
+        self._next_sweep = now + self._sweep_seconds
+
+
+class RedisBackend:
+    """Token buckets shared through Redis, updated atomically in Lua."""
+
+    SCRIPT = """
+    local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]),
+                                   tonumber(ARGV[3]), tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        import redis  # optional dependency, only needed for this backend
+
+        self._redis = redis.StrictRedis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    def consume(self, key, rate, burst, cost=1):
+        allowed, tokens = self._script(
+            keys=[f"ratelimit:{key}"], args=[rate, burst, cost, time.time()])
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - float(tokens)) / rate
+
+
+class ConcurrencyLimiter:
+    """Cap on requests in flight in this process."""
+
+    def __init__(self, limit, wait=0.05):
+        self.limit = limit
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def acquire(self):
+        """Take a slot, waiting at most `wait` seconds. False if full."""
+
+        if not self._slots.acquire(timeout=self.wait):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+
+class RateLimiter:
+    """Per-app state: backend, budgets, concurrency limiter and counters."""
+
+    def __init__(self, backend, budgets, concurrency):
+        self.backend = backend
+        self.budgets = budgets
+        self.concurrency = concurrency
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, *labels):
+        with self._lock:
+            self.counters[labels] += 1
+
+    def check(self, name, keys):
+        """Charge one request to every key. Returns retry-after or None."""
+
+        rate, burst, _ = self.budgets[name]
+        retry_after = 0.0
+
+        for key in keys:
+            allowed, wait = self.backend.consume(f"{name}:{key}", rate, burst)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+
+        if retry_after:
+            self.count('limited', name)
+            return retry_after
+
+        self.count('allowed', name)
+        return None
+
+    def metrics(self):
+        """Prometheus text exposition of the counters."""
+
+        lines = [
+            "# TYPE warbler_ratelimit_requests_total counter",
+        ]
+        with self._lock:
+            counters = sorted(self.counters.items())
+
+        for labels, value in counters:
+            if labels[0] in ('allowed', 'limited'):
+                lines.append(
+                    f'warbler_ratelimit_requests_total'
+                    f'{{route="{labels[1]}",result="{labels[0]}"}} {value}')
+
+        lines += [
+            "# TYPE warbler_requests_shed_total counter",
+            f"warbler_requests_shed_total {self.counters[('shed',)]}",
+            "# TYPE warbler_requests_in_flight gauge",
+            f"warbler_requests_in_flight {self.concurrency.in_flight}",
+            "# TYPE warbler_requests_concurrency_limit gauge",
+            f"warbler_requests_concurrency_limit {self.concurrency.limit}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def make_backend(url):
+    """'memory' (default) or a redis:// URL."""
+
+    if not url or url == 'memory':
+        return MemoryBackend()
+    return RedisBackend(url)
+
+
+def init_rate_limiting(app):
+    """Set up the limiter and the load-shedding hooks on `app`.
+
+    Register this before the blueprint so shedding runs before any other
+    before_request hook touches the database.
+    """
+
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = trust_proxies(app.wsgi_app,
+                                     app.config['TRUSTED_PROXIES'])
+
+    budgets = dict(DEFAULT_RATE_LIMITS, **app.config['RATE_LIMITS'])
+    limiter = app.extensions['ratelimit'] = RateLimiter(
+        backend=make_backend(app.config['RATE_LIMIT_BACKEND']),
+        budgets=budgets,
+        concurrency=ConcurrencyLimiter(app.config['MAX_CONCURRENT_REQUESTS']))
+
+    exempt = tuple(app.config['CONCURRENCY_EXEMPT_PREFIXES'])
+
+    @app.before_request
+    def shed_load():
+        if request.path.startswith(exempt):
+            return None
+
+        if not limiter.concurrency.acquire():
+            limiter.count('shed')
+            return Response("Server busy, try again shortly.", status=503,
+                            headers={'Retry-After': '1'})
+
+        g._concurrency_slot = True
+        return None
+
+    @app.teardown_request
+    def release_slot(exc):
+        if g.pop('_concurrency_slot', False):
+            limiter.concurrency.release()
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        sent = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(sent, f"Bearer {token}"):
+            abort(404)
+        return Response(limiter.metrics(), mimetype='text/plain')
+
+
+def trust_proxies(wsgi_app, count):
+    """Take the client address from the last `count` X-Forwarded-For hops."""
+
+    try:
+        return ProxyFix(wsgi_app, x_for=count)
+    except TypeError:  # Werkzeug < 0.15
+        return ProxyFix(wsgi_app, num_proxies=count)
+
+
+def client_keys():
+    """Bucket keys for this request: the client IP, plus the user if any."""
+
+    keys = [f"ip:{request.remote_addr}"]
+    user = g.get('user')
+    if user is not None:
+        keys.append(f"user:{user.id}")
+    return keys
+
+
+def rate_limit(name):
+    """Decorate a view so requests are charged to budget `name`."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            limiter = current_app.extensions['ratelimit']
+            _, _, methods = limiter.budgets[name]
+
+            if request.method in methods:
+                retry_after = limiter.check(name, client_keys())
+                if retry_after is not None:
+                    return Response(
+                        "Too many requests, slow down.", status=429,
+                        headers={'Retry-After': str(int(retry_after) + 1)})
+
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
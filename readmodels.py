@@ -0,0 +1,206 @@
+"""Read-only cards for rendering pages.
+
+Timelines and user lists used to hand full `User`/`Message` instances to
+templates that read three or four fields: every row built a tracked ORM
+object, with its identity-map entry, lazy-load hooks and every Text
+column. The views here select just the columns the templates use and copy
+them into `__slots__` objects, so nothing is tracked and a page of 100
+cards is a list of small objects.
+
+Cards quack like the models for what templates read (`msg.content`,
+`shown.user.username`, `user.header_image_url`, ...). They're read-only
+snapshots: anything that writes still loads the model.
+
+    python benchmarks/bench_readmodels.py --size medium
+"""
+
+from sqlalchemy import func
+
+from models import db, Message, User
+from sharding import get_router
+
+IN_CHUNK = 500
+
+
+class Author:
+    """The user shown on a message card."""
+
+    __slots__ = ('id', 'username', 'image_url')
+
+    def __init__(self, id, username, image_url):
+        self.id = id
+        self.username = username
+        self.image_url = image_url
+
+
+class MessageCard:
+    """A message as timelines show it."""
+
+    __slots__ = ('id', 'text', 'timestamp', 'user_id', 'original_message_id',
+                 'is_repost', 'user', 'original')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.text = row.text
+        self.timestamp = row.timestamp
+        self.user_id = row.user_id
+        self.original_message_id = row.original_message_id
+        self.is_repost = row.is_repost
+        self.user = Author(row.author_id, row.author_username,
+                           row.author_image_url)
+        self.original = None
+
+    @property
+    def content(self):
+        """The card whose text should be shown (see `Message.content`)."""
+
+        if self.is_repost and self.original is not None:
+            return self.original
+        return self
+
+
+class UserCard:
+    """A user as user lists show them."""
+
+    __slots__ = ('id', 'username', 'image_url', 'header_image_url', 'bio')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.username = row.username
+        self.image_url = row.image_url
+        self.header_image_url = row.header_image_url
+        self.bio = row.bio
+
+
+class Profile(UserCard):
+    """A user with the counts their profile header shows."""
+
+    __slots__ = ('location', 'messages_count', 'following_count',
+                 'followers_count', 'likes_count')
+
+    def __init__(self, row, following_count, followers_count, likes_count):
+        super().__init__(row)
+        self.location = row.location
+        self.messages_count = row.messages_count
+        self.following_count = following_count
+        self.followers_count = followers_count
+        self.likes_count = likes_count
+
+
+##############################################################################
+# Messages
+
+
+def message_query(*criteria):
+    """Columns for message cards, with their authors, matching `criteria`.
+
+    An ORM query of columns, not entities: it pages through
+    `timeline_page` like `Message.query` does, but returns plain rows.
+    """
+
+    return (db.session
+            .query(Message.id, Message.text, Message.timestamp,
+                   Message.user_id, Message.original_message_id,
+                   Message.is_repost,
+                   User.id.label('author_id'),
+                   User.username.label('author_username'),
+                   User.image_url.label('author_image_url'))
+            .join(User, User.id == Message.user_id)
+            .filter(*criteria))
+
+
+def message_cards(rows):
+    """Cards for `message_query` rows, with reposted originals attached.
+
+    The originals take one more query, and only if there are reposts.
+    """
+
+    cards = [MessageCard(row) for row in rows]
+
+    original_ids = list({card.original_message_id for card in cards
+                         if card.is_repost and card.original_message_id})
+    if original_ids:
+        originals = {}
+        for start in range(0, len(original_ids), IN_CHUNK):
+            chunk = original_ids[start:start + IN_CHUNK]
+            originals.update((row.id, MessageCard(row)) for row in
+                             message_query(Message.id.in_(chunk)))
+        for card in cards:
+            if card.is_repost:
+                # None if its month has been archived: shown as itself
+                card.original = originals.get(card.original_message_id)
+
+    return cards
+
+
+def message_card(message_id):
+    """The card for one message, or None."""
+
+    cards = message_cards(message_query(Message.id == message_id))
+    return cards[0] if cards else None
+
+
+##############################################################################
+# Users
+
+
+USER_CARD_COLUMNS = (User.id, User.username, User.image_url,
+                     User.header_image_url, User.bio)
+
+
+def user_cards(*criteria):
+    """Cards for users matching `criteria`, by id."""
+
+    return [UserCard(row) for row in (db.session
+                                      .query(*USER_CARD_COLUMNS)
+                                      .filter(*criteria)
+                                      .order_by(User.id))]
+
+
+def user_card(user_id):
+    """The card for one user, or None."""
+
+    cards = user_cards(User.id == user_id)
+    return cards[0] if cards else None
+
+
+def user_cards_by_ids(user_ids):
+    """Cards for ids from the shard router, in the same order."""
+
+    user_ids = list(user_ids)
+
+    found = {}
+    for start in range(0, len(user_ids), IN_CHUNK):
+        chunk = user_ids[start:start + IN_CHUNK]
+        found.update((card.id, card) for card in
+                     user_cards(User.id.in_(chunk)))
+
+    return [found[user_id] for user_id in user_ids if user_id in found]
+
+
+def user_profile(user_id):
+    """The profile header for `user_id`, or None.
+
+    Counts messages in the same query; follow and like counts come from
+    the shard router.
+    """
+
+    messages_count = (db.session
+                      .query(func.count(Message.id))
+                      .filter(Message.user_id == User.id)
+                      .correlate(User)
+                      .as_scalar()
+                      .label('messages_count'))
+
+    row = (db.session
+           .query(*USER_CARD_COLUMNS, User.location, messages_count)
+           .filter(User.id == user_id)
+           .first())
+    if row is None:
+        return None
+
+    router = get_router()
+    return Profile(row,
+                   following_count=router.following_counts([user_id])[user_id],
+                   followers_count=router.follower_counts([user_id])[user_id],
+                   likes_count=router.likes_counts([user_id])[user_id])
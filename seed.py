@@ -1,9 +1,13 @@
 """Seed database with sample data from CSV Files."""
 
 from csv import DictReader
-from app import db
-from models import User, Message, Follows
+from datetime import datetime
+from app import create_app
+from models import db, User, Message
+from sharding import follows, get_router
+from snowflake import backfill_ids
 
+app = create_app()
 
 db.drop_all()
 db.create_all()
@@ -12,9 +16,19 @@ with open('generator/users.csv') as users:
     db.session.bulk_insert_mappings(User, DictReader(users))
 
 with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
-
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+    # ids are time-ordered, so number the sample messages by their timestamps
+    rows = sorted(DictReader(messages), key=lambda row: row['timestamp'])
+    ids = backfill_ids(datetime.fromisoformat(row['timestamp']) for row in rows)
+    for row, id_ in zip(rows, ids):
+        row['id'] = id_
+    db.session.bulk_insert_mappings(Message, rows)
 
 db.session.commit()
+
+# follows go wherever the shard router puts them (see sharding.py)
+router = get_router(app)
+router.create_tables()
+router.clear()
+
+with open('generator/follows.csv') as rows:
+    router.insert_many(follows, list(DictReader(rows)), 'user_following_id')
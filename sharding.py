@@ -0,0 +1,469 @@
+"""Follows and likes spread over several databases by user id.
+
+Edges are placed by the acting user: a follow lives on the shard of the
+follower, a like on the shard of the liker, picked by crc32 of the user id.
+So "who does X follow", "did X like m" and "what has X liked" hit one
+shard, and writes for a user never span databases. The reverse lookups
+(followers of X, likers of m, like counts) ask every shard at once on a
+thread pool and merge the answers (scatter-gather).
+
+Shards come from SHARD_DATABASE_URLS. When that's empty there is one
+shard, the main database, with its own `follows` and `likes` tables, so
+nothing changes until more databases are configured. Moving to a new
+shard list copies every edge that changes shard, then deletes it from the
+old one:
+
+    python sharding.py create URL...                  # empty edge tables
+    python sharding.py reshard --from OLD_URL... NEW_URL...
+
+Each shard has the same two tables as the main database (minus the
+foreign keys: users and messages live elsewhere). So nothing cascades:
+deleting a user or message has to `purge_user`/`purge_message` too, and
+batch jobs read edges through the router (or `columnar.stream_shard_columns`),
+never through the `Follows`/`Likes` models on the main database.
+"""
+
+import argparse
+import heapq
+import threading
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import (BigInteger, Column, Index, Integer, MetaData, Table,
+                        and_, create_engine, func, select, tuple_)
+from sqlalchemy.exc import IntegrityError
+
+IN_CHUNK = 500
+KEYSET_PAGE = 1000
+RESHARD_BATCH = 5000
+
+metadata = MetaData()
+
+follows = Table(
+    'follows', metadata,
+    Column('user_being_followed_id', Integer, primary_key=True),
+    Column('user_following_id', Integer, primary_key=True),
+    Index('ix_follows_user_following_id',
+          'user_following_id', 'user_being_followed_id'),
+)
+
+likes = Table(
+    'likes', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer),
+    Column('message_id', BigInteger),
+    Index('uq_likes_user_id_message_id', 'user_id', 'message_id', unique=True),
+    Index('ix_likes_message_id', 'message_id'),
+)
+
+
+def shard_index(user_id, shard_count):
+    """Which of `shard_count` shards owns `user_id`'s edges."""
+
+    return zlib.crc32(str(user_id).encode()) % shard_count
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CHUNK):
+        yield ids[start:start + IN_CHUNK]
+
+
+class ShardRouter:
+    """Reads and writes follow/like edges on the right shard(s)."""
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self._pool = (ThreadPoolExecutor(max_workers=len(self.engines))
+                      if len(self.engines) > 1 else None)
+
+    @classmethod
+    def from_urls(cls, urls):
+        return cls([create_engine(url) for url in urls])
+
+    def create_tables(self):
+        """Create the edge tables on every shard that lacks them."""
+
+        for engine in self.engines:
+            metadata.create_all(engine)
+
+    def engine_for(self, user_id):
+        return self.engines[shard_index(user_id, len(self.engines))]
+
+    def by_shard(self, user_ids):
+        """Group `user_ids` by shard: {engine: [user ids]}."""
+
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(self.engine_for(user_id), []).append(user_id)
+        return groups
+
+    def gather(self, fn, engines=None):
+        """Run `fn(engine)` on each shard in parallel; list of results."""
+
+        engines = self.engines if engines is None else list(engines)
+        if self._pool is None or len(engines) == 1:
+            return [fn(engine) for engine in engines]
+        return list(self._pool.map(fn, engines))
+
+    def _scalar(self, owner_id, query):
+        with self.engine_for(owner_id).connect() as conn:
+            return conn.execute(query).scalar()
+
+    def _column(self, owner_id, query):
+        with self.engine_for(owner_id).connect() as conn:
+            return [row[0] for row in conn.execute(query)]
+
+    def _insert(self, owner_id, table, **values):
+        """Insert an edge; False if it was already there."""
+
+        try:
+            with self.engine_for(owner_id).begin() as conn:
+                conn.execute(table.insert().values(**values))
+        except IntegrityError:
+            return False
+        return True
+
+    def _delete(self, owner_id, table, *criteria):
+        with self.engine_for(owner_id).begin() as conn:
+            return conn.execute(table.delete().where(and_(*criteria))).rowcount > 0
+
+    def _counts(self, column, ids, *criteria):
+        """{id: count} of rows with `column` in `ids`, summed over shards."""
+
+        ids = list(ids)
+
+        def count(engine):
+            found = Counter()
+            with engine.connect() as conn:
+                for chunk in _chunks(ids):
+                    found.update(dict(conn.execute(
+                        select([column, func.count()])
+                        .where(and_(column.in_(chunk), *criteria))
+                        .group_by(column)).fetchall()))
+            return found
+
+        return sum(self.gather(count), Counter()) if ids else Counter()
+
+    def _keyset(self, engine, column, *criteria, page=KEYSET_PAGE):
+        """`column` values matching `criteria` on one shard, ascending.
+
+        Read `page` at a time with `column > last`, so only a page is ever
+        in memory and each page is one index range scan.
+        """
+
+        last = None
+        while True:
+            query = (select([column]).where(and_(*criteria))
+                     .order_by(column).limit(page))
+            if last is not None:
+                query = query.where(column > last)
+            with engine.connect() as conn:
+                ids = [row[0] for row in conn.execute(query)]
+            yield from ids
+            if len(ids) < page:
+                return
+            last = ids[-1]
+
+    def _keyset_everywhere(self, column, *criteria, page=KEYSET_PAGE):
+        """`_keyset` on every shard, merged into one ascending stream."""
+
+        return heapq.merge(*[self._keyset(engine, column, *criteria, page=page)
+                             for engine in self.engines])
+
+    # follows
+
+    def follow(self, follower_id, followed_id):
+        return self._insert(follower_id, follows,
+                            user_following_id=follower_id,
+                            user_being_followed_id=followed_id)
+
+    def unfollow(self, follower_id, followed_id):
+        return self._delete(follower_id, follows,
+                            follows.c.user_following_id == follower_id,
+                            follows.c.user_being_followed_id == followed_id)
+
+    def is_following(self, follower_id, followed_id):
+        return self._scalar(follower_id, select([follows.c.user_following_id])
+                            .where(follows.c.user_following_id == follower_id)
+                            .where(follows.c.user_being_followed_id == followed_id)
+                            ) is not None
+
+    def following_ids(self, user_id):
+        return self._column(user_id, select([follows.c.user_being_followed_id])
+                            .where(follows.c.user_following_id == user_id))
+
+    def follower_ids(self, user_id):
+        """Everyone following `user_id`: asks every shard."""
+
+        def followers(engine):
+            with engine.connect() as conn:
+                return [row[0] for row in conn.execute(
+                    select([follows.c.user_following_id])
+                    .where(follows.c.user_being_followed_id == user_id))]
+
+        return sorted(id_ for ids in self.gather(followers) for id_ in ids)
+
+    def iter_following_ids(self, user_id, page=KEYSET_PAGE):
+        """`following_ids`, ascending, read a page at a time."""
+
+        return self._keyset(self.engine_for(user_id),
+                            follows.c.user_being_followed_id,
+                            follows.c.user_following_id == user_id, page=page)
+
+    def iter_follower_ids(self, user_id, page=KEYSET_PAGE):
+        """`follower_ids`, ascending, a page at a time from each shard."""
+
+        return self._keyset_everywhere(follows.c.user_following_id,
+                                       follows.c.user_being_followed_id == user_id,
+                                       page=page)
+
+    def followers_among(self, user_id, candidate_ids):
+        """Those of `candidate_ids` who follow `user_id`.
+
+        Only the candidates' own shards are asked.
+        """
+
+        groups = self.by_shard(candidate_ids)
+
+        def followers(engine):
+            with engine.connect() as conn:
+                return [row[0]
+                        for chunk in _chunks(groups[engine])
+                        for row in conn.execute(
+                            select([follows.c.user_following_id])
+                            .where(follows.c.user_being_followed_id == user_id)
+                            .where(follows.c.user_following_id.in_(chunk)))]
+
+        return {id_ for ids in self.gather(followers, groups) for id_ in ids}
+
+    def follower_counts(self, user_ids):
+        return self._counts(follows.c.user_being_followed_id, user_ids)
+
+    def following_counts(self, user_ids):
+        return self._counts(follows.c.user_following_id, user_ids)
+
+    # likes
+
+    def like(self, user_id, message_id):
+        return self._insert(user_id, likes, user_id=user_id,
+                            message_id=message_id)
+
+    def unlike(self, user_id, message_id):
+        return self._delete(user_id, likes,
+                            likes.c.user_id == user_id,
+                            likes.c.message_id == message_id)
+
+    def has_liked(self, user_id, message_id):
+        return self._scalar(user_id, select([likes.c.id])
+                            .where(likes.c.user_id == user_id)
+                            .where(likes.c.message_id == message_id)
+                            ) is not None
+
+    def liked_message_ids(self, user_id):
+        return self._column(user_id, select([likes.c.message_id])
+                            .where(likes.c.user_id == user_id)
+                            .order_by(likes.c.message_id.desc()))
+
+    def iter_liked_message_ids(self, user_id, page=KEYSET_PAGE):
+        """`liked_message_ids`, but ascending and read a page at a time."""
+
+        return self._keyset(self.engine_for(user_id), likes.c.message_id,
+                            likes.c.user_id == user_id, page=page)
+
+    def liker_ids(self, message_id):
+        """Everyone who liked `message_id`: asks every shard."""
+
+        def likers(engine):
+            with engine.connect() as conn:
+                return [row[0] for row in conn.execute(
+                    select([likes.c.user_id])
+                    .where(likes.c.message_id == message_id))]
+
+        return sorted(id_ for ids in self.gather(likers) for id_ in ids)
+
+    def like_counts(self, message_ids):
+        return self._counts(likes.c.message_id, message_ids)
+
+    def likes_counts(self, user_ids):
+        """{user id: number of messages they liked}."""
+
+        return self._counts(likes.c.user_id, user_ids)
+
+    def likers_of(self, message_ids):
+        """{message id: [ids of users who liked it]}: asks every shard."""
+
+        message_ids = list(message_ids)
+
+        def likers(engine):
+            with engine.connect() as conn:
+                return [tuple(row)
+                        for chunk in _chunks(message_ids)
+                        for row in conn.execute(
+                            select([likes.c.message_id, likes.c.user_id])
+                            .where(likes.c.message_id.in_(chunk)))]
+
+        found = {}
+        for rows in self.gather(likers):
+            for message_id, user_id in rows:
+                found.setdefault(message_id, []).append(user_id)
+        return found
+
+    # bulk writes and cleanup (there are no foreign keys to cascade)
+
+    def insert_many(self, table, rows, owner_key):
+        """Bulk-insert edge dicts, each on the shard of `row[owner_key]`."""
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.engine_for(int(row[owner_key])), []).append(row)
+
+        for engine, group in groups.items():
+            with engine.begin() as conn:
+                conn.execute(table.insert(), group)
+
+    def clear(self):
+        """Delete every edge on every shard (for reseeding)."""
+
+        for engine in self.engines:
+            with engine.begin() as conn:
+                conn.execute(likes.delete())
+                conn.execute(follows.delete())
+
+    def _delete_everywhere(self, table, *criteria):
+        def delete(engine):
+            with engine.begin() as conn:
+                return conn.execute(table.delete().where(and_(*criteria))).rowcount
+
+        return sum(self.gather(delete))
+
+    def purge_user(self, user_id, message_ids=()):
+        """Drop every edge to or from a deleted user.
+
+        `message_ids` are their messages, whose likes go too. Their own
+        follows and likes are on their shard; follows of them and likes of
+        their messages can be on any.
+        """
+
+        self._delete(user_id, follows, follows.c.user_following_id == user_id)
+        self._delete(user_id, likes, likes.c.user_id == user_id)
+        self._delete_everywhere(follows,
+                                follows.c.user_being_followed_id == user_id)
+        for chunk in _chunks(message_ids):
+            self._delete_everywhere(likes, likes.c.message_id.in_(chunk))
+
+    def purge_message(self, message_id):
+        """Drop the likes of a deleted message."""
+
+        self._delete_everywhere(likes, likes.c.message_id == message_id)
+
+    def purge_messages_between(self, low, high):
+        """Drop the likes of messages with ids in [low, high) (archived)."""
+
+        self._delete_everywhere(likes, likes.c.message_id >= low,
+                                likes.c.message_id < high)
+
+
+_lock = threading.Lock()
+
+
+def get_router(app=None):
+    """The app's router, built on first use (so after any fork)."""
+
+    app = app or current_app
+    router = app.extensions.get('shards')
+    if router is None:
+        with _lock:
+            router = app.extensions.get('shards')
+            if router is None:
+                urls = app.config['SHARD_DATABASE_URLS']
+                if urls:
+                    router = ShardRouter.from_urls(urls)
+                else:
+                    from models import db
+                    router = ShardRouter([db.get_engine(app)])
+                app.extensions['shards'] = router
+    return router
+
+
+##############################################################################
+# Resharding
+
+
+def _moves(old, new, table, key, order_by):
+    """Yield (row, old engine, new engine) for rows whose shard changes."""
+
+    for engine in old.engines:
+        last = None
+        while True:
+            query = select([table]).order_by(*order_by).limit(RESHARD_BATCH)
+            if last is not None:
+                query = query.where(tuple_(*order_by) >
+                                    tuple_(*[last[c.name] for c in order_by]))
+            with engine.connect() as conn:
+                rows = [dict(row) for row in conn.execute(query)]
+            if not rows:
+                break
+            for row in rows:
+                target = new.engine_for(row[key])
+                if str(target.url) != str(engine.url):
+                    yield row, engine, target
+            last = rows[-1]
+
+
+def reshard(old, new, log=print):
+    """Move every edge to where `new` places it.
+
+    Rows are inserted on their new shard first and only then deleted from
+    the old one, so a crash leaves duplicates, never lost edges; running
+    it again finishes the job. Reads during a reshard may see an edge on
+    both shards, or (after the switch to `new`) not yet moved: run it with
+    writes paused, then point SHARD_DATABASE_URLS at the new list.
+    """
+
+    new.create_tables()
+
+    plans = (
+        (follows, 'user_following_id',
+         (follows.c.user_following_id, follows.c.user_being_followed_id)),
+        (likes, 'user_id', (likes.c.user_id, likes.c.message_id)),
+    )
+
+    for table, key, order_by in plans:
+        moved = 0
+        for row, source, target in _moves(old, new, table, key, order_by):
+            values = {k: v for k, v in row.items() if k != 'id'}
+            try:
+                with target.begin() as conn:
+                    conn.execute(table.insert().values(**values))
+            except IntegrityError:
+                pass  # copied by an earlier, interrupted run
+            with source.begin() as conn:
+                conn.execute(table.delete().where(and_(
+                    *[table.c[k] == v for k, v in values.items()])))
+            moved += 1
+        log(f"{table.name}: moved {moved}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command')
+
+    create = commands.add_parser('create', help="create edge tables on shards")
+    create.add_argument('urls', nargs='+')
+
+    move = commands.add_parser('reshard', help="move edges to a new shard list")
+    move.add_argument('--from', dest='old', nargs='+', required=True,
+                      help="current shard URLs, in order")
+    move.add_argument('urls', nargs='+', help="new shard URLs, in order")
+
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        ShardRouter.from_urls(args.urls).create_tables()
+    elif args.command == 'reshard':
+        reshard(ShardRouter.from_urls(args.old), ShardRouter.from_urls(args.urls))
+    else:
+        parser.print_help()
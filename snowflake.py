@@ -0,0 +1,166 @@
+"""Time-ordered 64-bit message ids, generated without asking the database.
+
+An id packs, from the high bits down:
+
+    41 bits  milliseconds since EPOCH (good for ~69 years)
+    10 bits  worker id
+    12 bits  sequence within the millisecond
+
+so sorting by id is sorting by creation time (to the millisecond; ties
+between workers break by worker id), and "newest first" or "older than this
+cursor" is a primary key range scan. Each process needs its own worker id:
+set SNOWFLAKE_WORKER_ID, and gunicorn.conf.py offsets it per worker.
+Worker BACKFILL_WORKER_ID is reserved for ids assigned to rows that
+predate this scheme (see migrations/0003 and `backfill_ids`).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# 2015-01-01 00:00:00 UTC, before the oldest sample data
+EPOCH_MS = 1420070400000
+
+TIMESTAMP_BITS = 41
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+WORKER_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = SEQUENCE_BITS + WORKER_BITS
+
+BACKFILL_WORKER_ID = MAX_WORKER_ID
+
+# how far the clock may step back before we refuse to hand out ids
+MAX_CLOCK_DRIFT_MS = 1000
+
+
+class ClockMovedBackwards(Exception):
+    """The system clock jumped back further than we're willing to wait."""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def make_id(ms, worker_id, sequence):
+    """Pack an id from milliseconds since EPOCH_MS, worker and sequence."""
+
+    return (ms << TIMESTAMP_SHIFT) | (worker_id << WORKER_SHIFT) | sequence
+
+
+def parse_id(id_):
+    """Unpack an id into (ms since EPOCH_MS, worker id, sequence)."""
+
+    return (id_ >> TIMESTAMP_SHIFT,
+            (id_ >> WORKER_SHIFT) & MAX_WORKER_ID,
+            id_ & MAX_SEQUENCE)
+
+
+def _epoch_ms(dt):
+    """Milliseconds since EPOCH_MS for a naive-UTC or aware datetime."""
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0, int(dt.timestamp() * 1000) - EPOCH_MS)
+
+
+def id_floor(dt):
+    """The smallest id that can be generated at or after `dt`.
+
+    `Message.id >= id_floor(dt)` means "created since dt", using the key.
+    """
+
+    return make_id(_epoch_ms(dt), 0, 0)
+
+
+def timestamp_of(id_):
+    """When `id_` was generated, as a naive UTC datetime."""
+
+    ms = (id_ >> TIMESTAMP_SHIFT) + EPOCH_MS
+    return datetime.utcfromtimestamp(ms / 1000)
+
+
+class SnowflakeGenerator:
+    """Hands out increasing ids for one worker id. Thread-safe.
+
+    If the sequence runs out within a millisecond, or the clock steps back a
+    little (NTP), it waits for the clock to catch up rather than repeat an id.
+    """
+
+    def __init__(self, worker_id=0, clock=_now_ms):
+        if not 0 <= worker_id < BACKFILL_WORKER_ID:
+            raise ValueError(
+                f"worker id must be between 0 and {BACKFILL_WORKER_ID - 1}")
+
+        self.worker_id = worker_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _wait_past(self, ms):
+        now = self._clock() - EPOCH_MS
+        while now <= ms:
+            time.sleep(0.0001)
+            now = self._clock() - EPOCH_MS
+        return now
+
+    def next_id(self):
+        with self._lock:
+            now = self._clock() - EPOCH_MS
+
+            if now < self._last_ms:
+                if self._last_ms - now > MAX_CLOCK_DRIFT_MS:
+                    raise ClockMovedBackwards(
+                        f"clock moved back {self._last_ms - now}ms")
+                now = self._wait_past(self._last_ms - 1)
+
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    now = self._wait_past(self._last_ms)
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return make_id(now, self.worker_id, self._sequence)
+
+
+def backfill_ids(timestamps):
+    """Ids for existing rows, given their timestamps in current id order.
+
+    Ids keep the given order and are never earlier than the row's own
+    timestamp. Rows that would share a millisecond take successive
+    sequence numbers, spilling into later milliseconds past 4096. Uses the
+    reserved BACKFILL_WORKER_ID, so live workers never collide with them.
+    This is the same numbering migrations/0003 does in SQL.
+    """
+
+    per_ms = MAX_SEQUENCE + 1
+    floor = None
+
+    for count, dt in enumerate(timestamps):
+        candidate = _epoch_ms(dt) * per_ms - count
+        floor = candidate if floor is None else max(floor, candidate)
+        slot = floor + count
+        yield make_id(slot // per_ms, BACKFILL_WORKER_ID, slot % per_ms)
+
+
+generator = SnowflakeGenerator(
+    int(os.environ.get('SNOWFLAKE_WORKER_ID', 0)))
+
+
+def configure(worker_id):
+    """Switch this process to `worker_id` (call after forking)."""
+
+    global generator
+    generator = SnowflakeGenerator(worker_id)
+
+
+def next_id():
+    """A new id from this process's generator."""
+
+    return generator.next_id()
@@ -0,0 +1,190 @@
+"""Offline "who to follow" suggestions for Warbler.
+
+Loads the whole `follows` table into a sparse adjacency matrix and scores
+friends-of-friends for every user in one sparse matrix product, instead of
+running a friends-of-friends join per page view. Results are written to
+`follow_suggestions`, which the homepage reads by primary key.
+
+Run it like:
+
+    python suggestions.py                      # everyone
+    python suggestions.py --shard 0 --shards 4 # one of four parallel workers
+    python suggestions.py --stale-hours 24     # only users not refreshed today
+
+Shards are disjoint (user_id % shards), so several copies of the job can run
+side by side without stepping on each other's rows.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from scipy import sparse
+
+from columnar import stream_shard_columns
+from models import db, FollowSuggestion
+from sharding import follows, get_router
+
+DEFAULT_TOP_N = 5
+BATCH_SIZE = 5000
+
+
+def load_follow_edges():
+    """Load `follows` as two int32 arrays: (follower ids, followed ids)."""
+
+    return stream_shard_columns(
+        get_router(),
+        (follows.c.user_following_id, follows.c.user_being_followed_id),
+        (np.int32, np.int32))
+
+
+def build_adjacency(followers, followed, size=None):
+    """Build a CSR matrix where A[u, v] == 1 means u follows v.
+
+    Users are indexed directly by id, so `size` must be > the largest id.
+    """
+
+    if size is None:
+        size = int(max(followers.max(initial=0), followed.max(initial=0))) + 1
+
+    data = np.ones(len(followers), dtype=np.float32)
+    adjacency = sparse.csr_matrix((data, (followers, followed)),
+                                  shape=(size, size))
+    # duplicate edges would otherwise be summed into 2s
+    adjacency.data[:] = 1
+    return adjacency
+
+
+def score_suggestions(adjacency, user_ids, top_n=DEFAULT_TOP_N):
+    """Score suggestions for `user_ids` against the full `adjacency` matrix.
+
+    A candidate's mutual count is the number of people the user follows who
+    follow the candidate (a row of A @ A). Mutual counts are divided by
+    log2(2 + followers) so a handful of huge accounts don't win every list.
+
+    Yields (user_id, [(candidate_id, mutual_count, score), ...]) with the
+    candidates best-first.
+    """
+
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    rows = adjacency[user_ids]
+
+    mutuals = (rows @ adjacency).tocsr()
+    # drop people the user already follows...
+    mutuals = mutuals - mutuals.multiply(rows)
+    # ...and the user themselves
+    own = sparse.csr_matrix(
+        (np.ones(len(user_ids), dtype=np.float32),
+         (np.arange(len(user_ids)), user_ids)),
+        shape=mutuals.shape)
+    mutuals = mutuals - mutuals.multiply(own)
+    mutuals.eliminate_zeros()
+
+    follower_counts = np.asarray(adjacency.sum(axis=0)).ravel()
+    damping = np.log2(2.0 + follower_counts)
+
+    for i, user_id in enumerate(user_ids):
+        start, end = mutuals.indptr[i], mutuals.indptr[i + 1]
+        if start == end:
+            yield int(user_id), []
+            continue
+
+        candidates = mutuals.indices[start:end]
+        counts = mutuals.data[start:end]
+        scores = counts / damping[candidates]
+
+        if len(scores) > top_n:
+            best = np.argpartition(-scores, top_n)[:top_n]
+        else:
+            best = np.arange(len(scores))
+        # ties broken by id so reruns don't shuffle the sidebar
+        best = best[np.lexsort((candidates[best], -scores[best]))]
+
+        yield int(user_id), [(int(candidates[j]), int(counts[j]),
+                              float(scores[j])) for j in best]
+
+
+def stale_user_ids(user_ids, stale_hours):
+    """Drop users whose suggestions were refreshed within `stale_hours`."""
+
+    cutoff = datetime.utcnow() - timedelta(hours=stale_hours)
+    fresh = (db.session
+             .query(FollowSuggestion.user_id)
+             .filter(FollowSuggestion.computed_at >= cutoff)
+             .distinct())
+    fresh_ids = np.fromiter((row[0] for row in fresh), dtype=np.int64)
+
+    return user_ids[~np.isin(user_ids, fresh_ids)]
+
+
+def save_suggestions(results):
+    """Replace the stored suggestions for every user in `results`."""
+
+    now = datetime.utcnow()
+    user_ids = [user_id for user_id, _ in results]
+
+    (FollowSuggestion
+        .query
+        .filter(FollowSuggestion.user_id.in_(user_ids))
+        .delete(synchronize_session=False))
+
+    db.session.bulk_insert_mappings(FollowSuggestion, [
+        dict(user_id=user_id,
+             rank=rank,
+             suggested_user_id=candidate_id,
+             mutual_count=mutual_count,
+             score=score,
+             computed_at=now)
+        for user_id, suggested in results
+        for rank, (candidate_id, mutual_count, score) in enumerate(suggested)
+    ])
+    db.session.commit()
+
+
+def run(shard=0, shards=1, top_n=DEFAULT_TOP_N, stale_hours=None,
+        batch_size=BATCH_SIZE):
+    """Recompute suggestions for every follower in one shard.
+
+    Work is committed every `batch_size` users, so an interrupted run only
+    loses its current batch and a rerun with `stale_hours` resumes from there.
+    Returns the number of users processed.
+    """
+
+    followers, followed = load_follow_edges()
+    if not len(followers):
+        return 0
+
+    adjacency = build_adjacency(followers, followed)
+
+    user_ids = np.unique(followers).astype(np.int64)
+    user_ids = user_ids[user_ids % shards == shard]
+
+    if stale_hours is not None:
+        user_ids = stale_user_ids(user_ids, stale_hours)
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        save_suggestions(list(score_suggestions(adjacency, batch, top_n)))
+
+    return len(user_ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--shard', type=int, default=0)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_N)
+    parser.add_argument('--stale-hours', type=float, default=None,
+                        help="skip users refreshed more recently than this")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        count = run(shard=args.shard, shards=args.shards, top_n=args.top,
+                    stale_hours=args.stale_hours, batch_size=args.batch_size)
+
+    print(f"Updated suggestions for {count} users.")
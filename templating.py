@@ -0,0 +1,111 @@
+"""Template compilation caching for Warbler.
+
+Two layers, both optional and both shared by every worker on the host:
+
+- a Jinja bytecode cache (TEMPLATE_BYTECODE_DIR), so a restarted worker
+  loads compiled bytecode instead of re-parsing templates; entries are keyed
+  on the template source, so an edited template is never served stale;
+- ahead-of-time compiled template modules (TEMPLATES_COMPILED_DIR), written
+  by `flask compile-templates` at build time and loaded without parsing.
+  These are not re-checked against the sources, so rebuild on deploy.
+
+`warm_templates` loads and renders every template once at boot, so the first
+real request never pays for compilation.
+"""
+
+import logging
+import os
+
+import click
+from flask.cli import with_appcontext
+from flask import current_app
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, ModuleLoader
+
+log = logging.getLogger(__name__)
+
+
+def configure_templates(app):
+    """Attach the bytecode cache and compiled-module loader to `app`.
+
+    Must run before anything touches `app.jinja_env`, which is built lazily
+    from `app.jinja_options`.
+    """
+
+    options = dict(app.jinja_options)
+
+    bytecode_dir = app.config['TEMPLATE_BYTECODE_DIR']
+    if bytecode_dir and bytecode_dir != 'off':
+        os.makedirs(bytecode_dir, exist_ok=True)
+        options['bytecode_cache'] = FileSystemBytecodeCache(bytecode_dir)
+
+    compiled_dir = app.config['TEMPLATES_COMPILED_DIR']
+    if compiled_dir and os.path.isdir(compiled_dir):
+        options['loader'] = ChoiceLoader([
+            ModuleLoader(compiled_dir),
+            app.create_global_jinja_loader(),
+        ])
+
+    app.jinja_options = options
+    app.cli.add_command(compile_templates_command)
+
+
+def template_names(app):
+    """Every template name the app can render (from the source loaders)."""
+
+    return sorted(app.create_global_jinja_loader().list_templates())
+
+
+def compile_templates(app, target):
+    """Compile every template to a Python module in `target`.
+
+    Returns the number of templates written.
+    """
+
+    env = app.jinja_env
+    loader = app.create_global_jinja_loader()
+    os.makedirs(target, exist_ok=True)
+
+    names = template_names(app)
+    for name in names:
+        source, filename, _ = loader.get_source(env, name)
+        # defer_init matches what ModuleLoader expects to import
+        code = env.compile(source, name, filename, raw=True, defer_init=True)
+
+        path = os.path.join(target, ModuleLoader.get_module_filename(name))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(code)
+
+    return len(names)
+
+
+def warm_templates(app):
+    """Load and render each template once.
+
+    Loading fills the bytecode cache; rendering with an empty context in a
+    throwaway request exercises the runtime too. Templates that need real
+    context (forms, users) fail to render, which is fine: they're compiled.
+    """
+
+    for name in template_names(app):
+        template = app.jinja_env.get_template(name)
+
+        with app.test_request_context():
+            try:
+                template.render()
+            except Exception as exc:
+                log.debug("warm-up render of %s skipped: %s", name, exc)
+
+
+@click.command('compile-templates')
+@click.option('--target', default=None,
+              help="output directory (default: TEMPLATES_COMPILED_DIR)")
+@with_appcontext
+def compile_templates_command(target):
+    """Compile all templates ahead of time."""
+
+    target = target or current_app.config['TEMPLATES_COMPILED_DIR']
+    if not target:
+        raise click.UsageError("set TEMPLATES_COMPILED_DIR or pass --target")
+
+    count = compile_templates(current_app, target)
+    click.echo(f"Compiled {count} templates into {target}")
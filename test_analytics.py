@@ -0,0 +1,145 @@
+"""Analytics report and column streaming tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_analytics.py
+
+
+import io
+import os
+from unittest import TestCase
+
+import numpy as np
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+from analytics import (build_report, distribution, find_sorted,  # noqa: E402
+                       mutual_follow_mask, ratio_distribution, safe_ratio,
+                       write_csv)
+from app import create_app  # noqa: E402
+from columnar import stream_columns  # noqa: E402
+from models import db, Follows, Likes, Message, User  # noqa: E402
+
+app = create_app('testing')
+
+
+class DistributionTestCase(TestCase):
+    """Test the summaries (no database needed)."""
+
+    def test_power_of_two_buckets(self):
+        summary = distribution(np.array([0, 1, 2, 3, 4, 7, 8]))
+
+        self.assertEqual(summary['histogram'],
+                         {'0': 1, '1': 1, '2-3': 2, '4-7': 2, '8-15': 1})
+        self.assertEqual(summary['max'], 8)
+
+    def test_empty(self):
+        self.assertEqual(distribution(np.array([], dtype=np.int64)),
+                         dict(count=0))
+        self.assertEqual(ratio_distribution(np.array([])), dict(count=0))
+
+    def test_ratios_below_half(self):
+        summary = ratio_distribution(np.array([0.0, 0.05, 0.25, 0.49, 1.0]))
+
+        self.assertEqual(summary['histogram'],
+                         {'0.0-0.1': 2, '0.2-0.3': 1, '0.4-0.5': 1,
+                          '0.9-1.0': 1})
+        self.assertEqual(summary['max'], 1.0)
+
+    def test_ratios_above_one(self):
+        summary = ratio_distribution(np.array([0.5, 2.5, 3.0]))
+
+        self.assertEqual(summary['histogram'], {'0.5-0.6': 1, '>1': 2})
+
+    def test_safe_ratio(self):
+        ratio = safe_ratio(np.array([1, 2, 3]), np.array([2, 0, 4]))
+
+        np.testing.assert_allclose(ratio, [0.5, 0.75])
+
+
+class GraphTestCase(TestCase):
+    """Test the vectorized edge helpers."""
+
+    def test_find_sorted(self):
+        pos, found = find_sorted(np.array([2, 5, 9]), np.array([5, 6, 9, 10]))
+
+        self.assertEqual(found.tolist(), [True, False, True, False])
+        self.assertEqual(pos[found].tolist(), [1, 2])
+
+    def test_find_sorted_empty(self):
+        _, found = find_sorted(np.array([], dtype=np.int64), np.array([1]))
+
+        self.assertEqual(found.tolist(), [False])
+
+    def test_mutual_follow_mask(self):
+        followers = np.array([1, 2, 1, 3], dtype=np.int32)
+        followed = np.array([2, 1, 3, 4], dtype=np.int32)
+
+        self.assertEqual(mutual_follow_mask(followers, followed).tolist(),
+                         [True, True, False, False])
+
+    def test_write_csv_chunks(self):
+        per_user = dict(user_id=np.arange(1, 6), followers=np.arange(5))
+        out = io.StringIO()
+
+        write_csv(per_user, out, chunk_size=2)
+
+        self.assertEqual(out.getvalue().splitlines(),
+                         ['user_id,followers', '1,0', '2,1', '3,2', '4,3',
+                          '5,4'])
+
+
+class DatabaseTestCase(TestCase):
+    """Test streaming and the full report against a small graph."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        for model in (Likes, Follows, Message, User):
+            model.query.delete()
+
+        self.users = [User(id=i, username=f"user{i}", email=f"user{i}@test.com",
+                           password="x", location="test")
+                      for i in range(1, 5)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+        # 1 <-> 2 mutual, 3 -> 1
+        db.session.add_all([
+            Follows(user_following_id=1, user_being_followed_id=2),
+            Follows(user_following_id=2, user_being_followed_id=1),
+            Follows(user_following_id=3, user_being_followed_id=1),
+        ])
+        messages = [Message(text=f"warble {i}") for i in range(3)]
+        self.users[0].messages.extend(messages)
+        db.session.commit()
+        db.session.add(Likes(user_id=2, message_id=messages[0].id))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_stream_columns(self):
+        ids, names = stream_columns(
+            db.session.query(User.id, User.username).order_by(User.id),
+            (np.int32, object), chunk_size=3)
+
+        self.assertEqual(ids.dtype, np.int32)
+        self.assertEqual(ids.tolist(), [1, 2, 3, 4])
+        self.assertEqual(names.tolist(), ['user1', 'user2', 'user3', 'user4'])
+
+    def test_report(self):
+        summary, per_user = build_report(top_n=2)
+
+        self.assertEqual(summary['totals'],
+                         dict(users=4, follows=3, messages=3, likes=1))
+        self.assertEqual(per_user['followers'].tolist(), [2, 1, 0, 0])
+        self.assertEqual(per_user['likes_received'].tolist(), [1, 0, 0, 0])
+        self.assertEqual(summary['top_accounts'][0],
+                         dict(user_id=1, username='user1', followers=2))
+        # 1 of 3 messages liked: a ratio well under 0.5
+        self.assertEqual(summary['likes_received_per_message']['histogram'],
+                         {'0.3-0.4': 1})
@@ -0,0 +1,159 @@
+"""Batched JSON API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase, mock
+
+from sqlalchemy import event
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+import api  # noqa: E402
+from app import create_app, CURR_USER_KEY  # noqa: E402
+from models import db, Follows, Likes, Message, User  # noqa: E402
+
+app = create_app('testing')
+
+
+class APITestCase(TestCase):
+    """Test /api/messages and /api/users."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        for model in (Likes, Follows, Message, User):
+            model.query.delete()
+
+        self.users = [User(username=f"user{i}", email=f"user{i}@test.com",
+                           password="x", location="test") for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+        self.messages = [Message(text=f"warble {i}") for i in range(5)]
+        self.users[0].messages.extend(self.messages)
+        db.session.commit()
+
+        db.session.add_all([
+            Follows(user_following_id=self.users[1].id,
+                    user_being_followed_id=self.users[0].id),
+            Follows(user_following_id=self.users[2].id,
+                    user_being_followed_id=self.users[0].id),
+            Likes(user_id=self.users[1].id, message_id=self.messages[0].id),
+        ])
+        db.session.commit()
+
+        self.user_ids = [user.id for user in self.users]
+        self.message_ids = [msg.id for msg in self.messages]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session[CURR_USER_KEY] = self.user_ids[0]
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_login_required(self):
+        resp = app.test_client().get(f'/api/users?ids={self.user_ids[0]}')
+
+        self.assertEqual(resp.status_code, 401)
+
+    def test_messages_default_fields(self):
+        ids = [self.message_ids[2], self.message_ids[0]]
+        resp = self.client.get(f'/api/messages?ids={ids[0]},{ids[1]}')
+
+        messages = resp.get_json()['messages']
+        self.assertEqual([msg['id'] for msg in messages], [str(i) for i in ids])
+        self.assertEqual(set(messages[0]), {'id', 'text', 'timestamp',
+                                            'user_id'})
+        self.assertEqual(messages[0]['text'], "warble 2")
+
+    def test_message_fields(self):
+        resp = self.client.post('/api/messages', json=dict(
+            ids=[str(self.message_ids[0])],
+            fields=['user.username', 'likes_count', 'reposts_count']))
+
+        [msg] = resp.get_json()['messages']
+        self.assertEqual(msg, {'id': str(self.message_ids[0]),
+                               'user.username': 'user0',
+                               'likes_count': 1, 'reposts_count': 0})
+
+    def test_user_fields(self):
+        resp = self.client.post('/api/users', json=dict(
+            ids=self.user_ids[:2],
+            fields=['username', 'followers_count', 'messages_count']))
+
+        self.assertEqual(resp.get_json()['users'], [
+            dict(id=self.user_ids[0], username='user0', followers_count=2,
+                 messages_count=5),
+            dict(id=self.user_ids[1], username='user1', followers_count=0,
+                 messages_count=0),
+        ])
+
+    def test_unknown_fields(self):
+        resp = self.client.get(
+            f'/api/users?ids={self.user_ids[0]}&fields=username,password,email')
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json(),
+                         dict(error="unknown fields: password, email"))
+
+    def test_missing_ids(self):
+        resp = self.client.get(f'/api/users?ids=0,{self.user_ids[1]},0')
+
+        body = resp.get_json()
+        self.assertEqual([user['id'] for user in body['users']],
+                         [self.user_ids[1]])
+        self.assertEqual(body['missing'], [0])
+
+        resp = self.client.get('/api/messages?ids=1')
+        self.assertEqual(resp.get_json(), dict(messages=[], missing=['1']))
+
+    def test_bad_ids(self):
+        for query in ('', 'ids=', 'ids=1,x'):
+            resp = self.client.get(f'/api/users?{query}')
+            self.assertEqual(resp.status_code, 400, query)
+
+    def test_bad_json(self):
+        for body in ([1, 2], 7, "ids",
+                     dict(ids="12"), dict(ids=[1.5]), dict(ids=[True]),
+                     dict(ids=[{}]), dict(ids=[1], fields="username"),
+                     dict(ids=[1], fields=[1])):
+            resp = self.client.post('/api/users', json=body)
+            self.assertEqual(resp.status_code, 400, body)
+            self.assertIn('error', resp.get_json())
+
+    def test_id_limit(self):
+        ids = ','.join(str(i) for i in range(api.MAX_IDS + 1))
+
+        resp = self.client.get(f'/api/users?ids={ids}')
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn(str(api.MAX_IDS), resp.get_json()['error'])
+
+    def test_batched(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            if 'FROM messages' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            with mock.patch('api.IN_CHUNK', 2):
+                resp = self.client.post('/api/messages', json=dict(
+                    ids=[str(i) for i in reversed(self.message_ids)],
+                    fields=['text']))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual([msg['text'] for msg in resp.get_json()['messages']],
+                         [f"warble {i}" for i in reversed(range(5))])
+        # 5 ids in chunks of 2
+        self.assertEqual(len(statements), 3)
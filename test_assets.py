@@ -0,0 +1,102 @@
+"""Static asset build tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_assets.py
+
+
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+from flask import Flask, render_template_string
+
+from assets import build, init_assets
+
+
+CSS = 'body { background: url("/static/images/bg.png"); }\n' * 20
+
+
+class AssetsTestCase(TestCase):
+    """Test fingerprinting, precompression and serving."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.static = os.path.join(self.tmp.name, 'static')
+        self.dist = os.path.join(self.static, 'dist')
+
+        os.makedirs(os.path.join(self.static, 'images'))
+        os.makedirs(os.path.join(self.static, 'stylesheets'))
+        with open(os.path.join(self.static, 'images', 'bg.png'), 'wb') as f:
+            f.write(b'\x89PNG not really')
+        with open(os.path.join(self.static, 'stylesheets', 'style.css'), 'w') as f:
+            f.write(CSS)
+
+        self.manifest = build(self.static, self.dist)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self.dist, name), 'rb') as f:
+            return f.read()
+
+    def test_hashed_names(self):
+        css = self.manifest['stylesheets/style.css']['path']
+        png = self.manifest['images/bg.png']['path']
+
+        self.assertRegex(css, r'^stylesheets/style\.[0-9a-f]{12}\.css$')
+        self.assertRegex(png, r'^images/bg\.[0-9a-f]{12}\.png$')
+
+    def test_css_references_rewritten(self):
+        css = self.manifest['stylesheets/style.css']['path']
+        png = self.manifest['images/bg.png']['path']
+
+        content = self.read(css).decode()
+
+        self.assertIn(f'url("/assets/{png}")', content)
+        self.assertNotIn('/static/', content)
+
+    def test_precompressed(self):
+        css = self.manifest['stylesheets/style.css']
+        png = self.manifest['images/bg.png']
+
+        self.assertIn('gzip', css['encodings'])
+        self.assertEqual(png['encodings'], [])
+        self.assertEqual(gzip.decompress(self.read(css['path'] + '.gz')),
+                         self.read(css['path']))
+
+    def test_build_is_stable(self):
+        self.assertEqual(build(self.static, self.dist), self.manifest)
+
+    def test_serving(self):
+        app = Flask(__name__, static_folder=self.static)
+        app.config['ASSETS_DIST_DIR'] = self.dist
+        init_assets(app)
+        css = self.manifest['stylesheets/style.css']['path']
+
+        with app.test_request_context():
+            url = render_template_string(
+                "{{ asset_url('stylesheets/style.css') }}")
+            plain = render_template_string("{{ asset_url('missing.js') }}")
+
+        self.assertEqual(url, f'/assets/{css}')
+        self.assertEqual(plain, '/static/missing.js')
+
+        with app.test_client() as client:
+            resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', resp.headers['Cache-Control'])
+            self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(resp.mimetype, 'text/css')
+            resp.close()
+
+            resp = client.get(url)
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.get_data(as_text=True), self.read(css).decode())
+            resp.close()
+
+            self.assertEqual(client.get('/assets/stylesheets/style.css')
+                             .status_code, 404)
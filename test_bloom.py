@@ -0,0 +1,182 @@
+"""Bloom filter tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_bloom.py
+
+
+import os
+from unittest import TestCase, mock
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+from app import create_app, CURR_USER_KEY  # noqa: E402
+from bloom import REBUILD_SECONDS, REFRESH_SECONDS, BloomFilter, TakenNames  # noqa: E402
+from models import db, Message, User  # noqa: E402
+
+app = create_app('testing')
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class BloomFilterTestCase(TestCase):
+    """Test sizing, membership and the false positive rate."""
+
+    def test_sizing(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+
+        # ~9.6 bits and 7 hashes per item at 1%
+        self.assertEqual(bloom.size, 9586)
+        self.assertEqual(bloom.hashes, 7)
+        self.assertEqual(len(bloom.bits), 1199)
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(5000)
+        names = [f"user{i}" for i in range(5000)]
+        for name in names:
+            bloom.add(name)
+
+        self.assertTrue(all(name in bloom for name in names))
+        self.assertEqual(bloom.count, 5000)
+        self.assertFalse(bloom.full)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(5000, error_rate=0.01)
+        for i in range(5000):
+            bloom.add(f"user{i}@example.com")
+
+        false_positives = sum(f"other{i}@example.com" in bloom
+                              for i in range(20000))
+
+        self.assertLess(false_positives / 20000, 0.02)
+
+    def test_empty(self):
+        bloom = BloomFilter(10)
+
+        self.assertNotIn('anyone', bloom)
+
+    def test_full(self):
+        bloom = BloomFilter(2)
+        for name in ('a', 'b', 'c'):
+            bloom.add(name)
+
+        self.assertTrue(bloom.full)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TakenNamesTestCase(TestCase):
+    """Test the filters against the users table."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        Message.query.delete()
+        User.query.delete()
+        self.user = self.make_user("taken")
+        app.extensions.pop('taken_names', None)
+
+        self.clock = FakeClock()
+        self.names = TakenNames(clock=self.clock)
+
+    def tearDown(self):
+        db.session.rollback()
+        app.extensions.pop('taken_names', None)
+        self.ctx.pop()
+
+    def make_user(self, name):
+        # as another process would: the filters don't hear about it
+        user = User(username=name, email=f"{name}@test.com", password="x",
+                    location="test")
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def test_taken(self):
+        self.assertEqual(self.names.taken("taken", "taken@test.com"),
+                         {'username', 'email'})
+        self.assertEqual(self.names.taken("free", "free@test.com"), set())
+
+    def test_exclude_user_id(self):
+        self.assertEqual(self.names.taken("taken", "taken@test.com",
+                                          exclude_user_id=self.user.id),
+                         set())
+
+    def test_refresh_picks_up_new_users(self):
+        self.make_user("newcomer")
+
+        # not looked for again yet
+        self.assertEqual(self.names.taken("newcomer"), set())
+
+        self.clock.now = REFRESH_SECONDS
+        self.assertEqual(self.names.taken("newcomer"), {'username'})
+
+    def test_rebuild_picks_up_renames(self):
+        self.user.username = "renamed"
+        db.session.commit()
+
+        self.clock.now = REFRESH_SECONDS
+        self.assertEqual(self.names.taken("renamed"), set())
+
+        self.clock.now = REBUILD_SECONDS
+        self.assertEqual(self.names.taken("renamed"), {'username'})
+
+    def test_add(self):
+        self.names.add("added", "added@test.com")
+
+        self.assertIn("added", self.names.usernames)
+        self.assertIn("added@test.com", self.names.emails)
+
+    def test_signup_short_circuits(self):
+        with mock.patch.object(User, 'signup') as signup:
+            resp = app.test_client().post('/signup', data=dict(
+                username="taken", email="other@test.com", password="secret1"))
+
+        signup.assert_not_called()
+        self.assertIn(b"Username already taken", resp.data)
+
+    def test_available_endpoint(self):
+        client = app.test_client()
+
+        self.assertEqual(client.get('/users/available?username=taken')
+                         .get_json(), dict(username=False))
+        self.assertEqual(client.get('/users/available?username=free')
+                         .get_json(), dict(username=True))
+
+        # anonymous: no email answers
+        self.assertEqual(client.get('/users/available?email=taken@test.com')
+                         .get_json(), {})
+
+    def test_available_endpoint_logged_in(self):
+        other = self.make_user("other")
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session[CURR_USER_KEY] = other.id
+
+        # emails aren't answered for anyone
+        self.assertEqual(client.get('/users/available?email=taken@test.com')
+                         .get_json(), {})
+        # your own name isn't taken from you
+        self.assertEqual(client.get('/users/available?username=other')
+                         .get_json(), dict(username=True))
+
+    def test_profile_checks_password_first(self):
+        other = self.make_user("other")
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session[CURR_USER_KEY] = other.id
+
+        with mock.patch.object(User, 'authenticate', return_value=False):
+            resp = client.post('/users/profile', data=dict(
+                username="taken", email="other@test.com", password="wrong1"))
+
+        # a wrong password says nothing about whether "taken" is
+        self.assertIn(b"Invalid password", resp.data)
+        self.assertNotIn(b"already taken", resp.data)
@@ -0,0 +1,52 @@
+"""Configuration tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_config.py
+
+
+import os
+from unittest import TestCase, mock
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+
+
+class FromEnvTestCase(TestCase):
+    """Test environment overrides."""
+
+    def test_empty_values_are_unset(self):
+        with mock.patch.dict(os.environ, {'IMAGE_CACHE_DIR': '',
+                                          'SECRET_KEY': 'shh'}):
+            env = Config.from_env()
+
+        self.assertNotIn('IMAGE_CACHE_DIR', env)
+        self.assertEqual(env['SECRET_KEY'], 'shh')
+
+    def test_lists(self):
+        with mock.patch.dict(os.environ,
+                             {'SHARD_DATABASE_URLS': 'postgresql:///a, ,'
+                                                     'postgresql:///b'}):
+            env = Config.from_env()
+
+        self.assertEqual(env['SHARD_DATABASE_URLS'],
+                         ('postgresql:///a', 'postgresql:///b'))
+
+
+class BytecodeCacheTestCase(TestCase):
+    """Test turning the template bytecode cache on and off."""
+
+    def test_on_by_default(self):
+        app = create_app('testing')
+
+        self.assertIsNotNone(app.jinja_env.bytecode_cache)
+        self.assertTrue(app.config['TEMPLATE_BYTECODE_DIR']
+                        .startswith(app.instance_path))
+
+    def test_off_from_env(self):
+        with mock.patch.dict(os.environ, {'TEMPLATE_BYTECODE_DIR': 'off'}):
+            app = create_app('testing')
+
+        self.assertIsNone(app.jinja_env.bytecode_cache)
@@ -0,0 +1,146 @@
+"""Live event dispatch tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_events.py
+
+
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+import events
+from events import Dispatcher, Subscription, event_stream, format_sse
+
+
+class FakeRouter:
+    """Stands in for the shard router: author 1 is followed by 2 and 3."""
+
+    def followers_among(self, author_id, user_ids):
+        return {2, 3} & set(user_ids) if author_id == 1 else set()
+
+    def like_counts(self, message_ids):
+        return {message_id: 7 for message_id in message_ids}
+
+
+class DispatcherTestCase(TestCase):
+    """Test subscribing and fan-out."""
+
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+
+    def test_fan_out(self):
+        first = self.dispatcher.subscribe(1)
+        second = self.dispatcher.subscribe(1)
+        other = self.dispatcher.subscribe(2)
+
+        self.dispatcher.publish([1, 3], 'message', dict(id='5'))
+
+        self.assertEqual(first.get(0), ('message', '{"id": "5"}'))
+        self.assertEqual(second.get(0), ('message', '{"id": "5"}'))
+        self.assertIsNone(other.get(0))
+
+    def test_unsubscribe(self):
+        first = self.dispatcher.subscribe(1)
+        second = self.dispatcher.subscribe(1)
+
+        self.dispatcher.unsubscribe(first)
+        self.assertEqual(self.dispatcher.connected_user_ids(), [1])
+
+        self.dispatcher.unsubscribe(second)
+        self.assertEqual(self.dispatcher.connected_user_ids(), [])
+
+        # twice is harmless
+        self.dispatcher.unsubscribe(second)
+
+    def test_overflow_drops_newest(self):
+        subscription = Subscription(1, maxsize=2)
+        for i in range(5):
+            subscription.put(('likes', i))
+
+        self.assertEqual(subscription.get(0), ('likes', 0))
+        self.assertEqual(subscription.get(0), ('likes', 1))
+        self.assertIsNone(subscription.get(0))
+
+
+class EventStreamTestCase(TestCase):
+    """Test the SSE body."""
+
+    def setUp(self):
+        self.stream = event_stream(1, heartbeat=0.01)
+
+    def tearDown(self):
+        self.stream.close()
+
+    def test_format(self):
+        self.assertEqual(format_sse('likes', '{"id": "5"}'),
+                         'event: likes\ndata: {"id": "5"}\n\n')
+
+    def test_events_and_heartbeat(self):
+        stream = self.stream
+
+        self.assertEqual(next(stream), "retry: 5000\n\n")
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+
+        events.dispatcher.publish([1], 'likes', dict(id='5', likes=2))
+        self.assertEqual(next(stream),
+                         'event: likes\ndata: {"id": "5", "likes": 2}\n\n')
+
+    def test_subscribes_once_started(self):
+        # a client that disconnects before the body starts leaves nothing
+        self.assertNotIn(1, events.dispatcher.connected_user_ids())
+
+        next(self.stream)
+
+        self.assertIn(1, events.dispatcher.connected_user_ids())
+
+    def test_close_unsubscribes(self):
+        next(self.stream)
+
+        self.stream.close()
+
+        self.assertNotIn(1, events.dispatcher.connected_user_ids())
+
+
+@mock.patch('events.variant_url', lambda url, variant: url)
+@mock.patch('events.get_router', FakeRouter)
+class PublishTestCase(TestCase):
+    """Test who gets pushed messages and like counts."""
+
+    def setUp(self):
+        self.subscriptions = {user_id: events.dispatcher.subscribe(user_id)
+                              for user_id in (1, 2, 4)}
+
+        author = SimpleNamespace(id=1, username='author',
+                                 image_url='/static/images/default-pic.png')
+        self.msg = SimpleNamespace(id=2 ** 60, user_id=1, user=author,
+                                   text='hello', is_repost=False,
+                                   timestamp=datetime(2018, 10, 1))
+        self.msg.content = self.msg
+
+    def tearDown(self):
+        for subscription in self.subscriptions.values():
+            events.dispatcher.unsubscribe(subscription)
+
+    def received(self, user_id):
+        return self.subscriptions[user_id].get(0)
+
+    def test_connected_followers(self):
+        self.assertEqual(events.connected_followers(1), {1, 2})
+
+    def test_publish_message(self):
+        events.publish_message(self.msg)
+
+        event, data = self.received(2)
+        self.assertEqual(event, 'message')
+        self.assertIn(f'"id": "{2 ** 60}"', data)
+        self.assertIn('"reposted_by": null', data)
+        self.assertIsNotNone(self.received(1))
+        self.assertIsNone(self.received(4))
+
+    def test_publish_like_count(self):
+        events.publish_like_count(self.msg)
+
+        self.assertEqual(self.received(2),
+                         ('likes', f'{{"id": "{2 ** 60}", "likes": 7}}'))
+        self.assertIsNone(self.received(4))
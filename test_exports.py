@@ -0,0 +1,180 @@
+"""Streaming export tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_exports.py
+
+
+import csv
+import gzip
+import io
+import json
+import os
+from unittest import TestCase, mock
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+import exports  # noqa: E402
+from app import create_app, CURR_USER_KEY  # noqa: E402
+from exports import (export_chunks, gzip_chunks, messages_rows,  # noqa: E402
+                     parse_export_name)
+from models import db, Follows, Likes, Message, User  # noqa: E402
+
+app = create_app('testing')
+
+
+class ParseExportNameTestCase(TestCase):
+    """Test download file names (no database needed)."""
+
+    def test_known(self):
+        self.assertEqual(parse_export_name('messages.ndjson'),
+                         ('messages', 'ndjson', False))
+        self.assertEqual(parse_export_name('likes.csv.gz'),
+                         ('likes', 'csv', True))
+
+    def test_unknown(self):
+        for filename in ('messages.xml', 'passwords.csv', 'messages',
+                         'messages.csv.zip', 'a.messages.csv', '.gz'):
+            self.assertIsNone(parse_export_name(filename), filename)
+
+    def test_gzip_is_one_stream(self):
+        chunks = [b'{"id": %d}\n' % i for i in range(1000)]
+
+        compressed = b''.join(gzip_chunks(iter(chunks)))
+
+        self.assertEqual(compressed[:2], b'\x1f\x8b')
+        self.assertEqual(gzip.decompress(compressed), b''.join(chunks))
+
+
+class DatabaseTestCase(TestCase):
+    """A user with messages, a like and a follow to export."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        for model in (Likes, Follows, Message, User):
+            model.query.delete()
+
+        self.user = User(username="exporter", email="exporter@test.com",
+                         password="x", location="test")
+        self.other = User(username="other", email="other@test.com",
+                          password="x", location="test")
+        db.session.add_all([self.user, self.other])
+        db.session.commit()
+
+        self.messages = [Message(text=f"warble, \"{i}\"") for i in range(5)]
+        self.user.messages.extend(self.messages)
+        liked = Message(text="liked")
+        self.other.messages.append(liked)
+        db.session.commit()
+
+        db.session.add_all([
+            Likes(user_id=self.user.id, message_id=liked.id),
+            Follows(user_following_id=self.user.id,
+                    user_being_followed_id=self.other.id),
+        ])
+        db.session.commit()
+        self.user_id = self.user.id
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def export(self, kind, fmt, compress=False):
+        data = b''.join(export_chunks(self.user_id, kind, fmt, compress))
+        return gzip.decompress(data) if compress else data
+
+
+class ExportTestCase(DatabaseTestCase):
+    """Test formats, compression and batching."""
+
+    def test_ndjson(self):
+        lines = self.export('messages', 'ndjson').decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+
+        self.assertEqual([row['text'] for row in rows],
+                         [msg.text for msg in self.messages])
+        self.assertEqual(set(rows[0]), {'id', 'text', 'timestamp',
+                                        'original_message_id', 'is_repost'})
+        self.assertIsInstance(rows[0]['timestamp'], str)
+
+    def test_csv(self):
+        reader = csv.reader(io.StringIO(self.export('messages', 'csv').decode()))
+        header, *rows = list(reader)
+
+        self.assertEqual(header, ['id', 'text', 'timestamp',
+                                  'original_message_id', 'is_repost'])
+        self.assertEqual([row[1] for row in rows],
+                         [msg.text for msg in self.messages])
+
+    def test_gzip_matches_plain(self):
+        self.assertEqual(self.export('messages', 'csv', compress=True),
+                         self.export('messages', 'csv'))
+
+    def test_likes_and_follows(self):
+        [like] = [json.loads(line) for line in
+                  self.export('likes', 'ndjson').decode().splitlines()]
+        self.assertEqual(like['text'], "liked")
+        self.assertEqual(like['author_id'], self.other.id)
+
+        [follow] = [json.loads(line) for line in
+                    self.export('follows', 'ndjson').decode().splitlines()]
+        self.assertEqual(follow, dict(direction='following',
+                                      user_id=self.other.id,
+                                      username='other'))
+
+    def test_yield_per(self):
+        query = messages_rows(self.user_id)
+
+        self.assertEqual(query._yield_per, exports.BATCH_SIZE)
+        self.assertTrue(query._execution_options['stream_results'])
+
+    def test_batches_and_flushes(self):
+        with mock.patch('exports.BATCH_SIZE', 2), \
+                mock.patch('exports.FLUSH_BYTES', 1):
+            chunks = list(export_chunks(self.user_id, 'messages', 'ndjson'))
+
+        # one chunk per row once the buffer passes FLUSH_BYTES
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(b''.join(chunks), self.export('messages', 'ndjson'))
+
+
+class ExportViewTestCase(DatabaseTestCase):
+    """Test the download view and the CLI command."""
+
+    def get(self, filename):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session[CURR_USER_KEY] = self.user_id
+        return client.get(f'/users/export/{filename}')
+
+    def test_download(self):
+        resp = self.get('messages.csv.gz')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/gzip')
+        self.assertIn('warbler-messages.csv.gz',
+                      resp.headers['Content-Disposition'])
+        self.assertEqual(gzip.decompress(resp.data),
+                         self.export('messages', 'csv'))
+
+    def test_unknown_format(self):
+        self.assertEqual(self.get('messages.xml').status_code, 404)
+
+    def test_cli(self):
+        runner = app.test_cli_runner()
+
+        result = runner.invoke(args=['export-user', str(self.user_id),
+                                     'messages', '--format', 'csv'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(result.stdout_bytes, self.export('messages', 'csv'))
+
+    def test_cli_unknown_format(self):
+        result = app.test_cli_runner().invoke(
+            args=['export-user', str(self.user_id), 'messages',
+                  '--format', 'xml'])
+
+        self.assertEqual(result.exit_code, 2)
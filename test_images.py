@@ -0,0 +1,194 @@
+"""Image variant tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_images.py
+
+
+import io
+import os
+import socket
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase, mock
+
+from flask import Flask
+from PIL import Image
+
+from images import (MAX_SOURCE_BYTES, VARIANTS, ImageSourceError, VariantCache,
+                    public_address, read_source, render_variant, variant_url)
+
+
+def jpeg_bytes(size):
+    out = io.BytesIO()
+    Image.new('RGB', size, 'red').save(out, 'JPEG')
+    return out.getvalue()
+
+
+class RenderVariantTestCase(TestCase):
+    """Test resizing and re-encoding (no app or database needed)."""
+
+    def test_thumb_is_cropped_to_square(self):
+        data = render_variant(jpeg_bytes((800, 600)), 'thumb', 'jpeg')
+        img = Image.open(io.BytesIO(data))
+
+        self.assertEqual(img.size, VARIANTS['thumb'][:2])
+        self.assertEqual(img.format, 'JPEG')
+
+    def test_hero_keeps_aspect_ratio(self):
+        data = render_variant(jpeg_bytes((2400, 1600)), 'hero', 'jpeg')
+        img = Image.open(io.BytesIO(data))
+
+        self.assertEqual(img.size, (600, 400))
+
+    def test_pixel_cap(self):
+        with mock.patch('images.MAX_SOURCE_PIXELS', 100 * 100):
+            with self.assertRaises(ImageSourceError):
+                render_variant(jpeg_bytes((200, 200)), 'thumb', 'jpeg')
+
+
+class VariantCacheTestCase(TestCase):
+    """Test the bounded on-disk cache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = VariantCache(self.tmp.name, max_bytes=2500)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_miss_then_hit(self):
+        path = self.cache.path_for('/static/a.jpg', 'thumb', 'jpeg')
+
+        self.assertIsNone(self.cache.get(path))
+        self.cache.put(path, b'x' * 10)
+        self.assertEqual(self.cache.get(path), path)
+
+    def test_keys_differ_by_variant_and_format(self):
+        paths = {self.cache.path_for('/static/a.jpg', v, f)
+                 for v in ('thumb', 'card') for f in ('jpeg', 'webp')}
+
+        self.assertEqual(len(paths), 4)
+
+    def test_trims_least_recently_used(self):
+        paths = [self.cache.path_for(f'/static/{i}.jpg', 'thumb', 'jpeg')
+                 for i in range(3)]
+
+        for i, path in enumerate(paths[:2]):
+            self.cache.put(path, b'x' * 1000)
+            os.utime(path, (i, i))
+
+        self.cache.put(paths[2], b'x' * 1000)
+
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    """/ok is an image, /redirect points at /ok, /huge is too large."""
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/ok')
+            self.end_headers()
+        elif self.path == '/huge':
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'x' * (MAX_SOURCE_BYTES + 1))
+        else:
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(jpeg_bytes((10, 10)))
+
+    def log_message(self, *args):
+        pass
+
+
+def addrinfo(*addresses):
+    family = {4: socket.AF_INET, 6: socket.AF_INET6}
+    return [(family[6 if ':' in a else 4], socket.SOCK_STREAM, 6, '', (a, 80))
+            for a in addresses]
+
+
+class SourceTestCase(TestCase):
+    """Test which sources are fetched, and how."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), SourceHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.config.update(SECRET_KEY='test',
+                          IMAGE_SOURCE_HOSTS=('images.test',))
+        app.add_url_rule('/images/<variant>/<token>', 'warbler.image_variant')
+        self.ctx = app.test_request_context()
+        self.ctx.push()
+
+        # images.test "resolves" to the test server after passing the checks
+        patcher = mock.patch('images.public_address',
+                             lambda host, port: '127.0.0.1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def url(self, path, host='images.test'):
+        return f"http://{host}:{self.server.server_port}{path}"
+
+    def test_allowed_host(self):
+        self.assertEqual(read_source(self.url('/ok')), jpeg_bytes((10, 10)))
+
+    def test_other_hosts_not_fetched(self):
+        for source in (self.url('/ok', host='169.254.169.254'),
+                       self.url('/ok', host='evil.test'),
+                       'file:///etc/passwd'):
+            with self.assertRaises(ImageSourceError):
+                read_source(source)
+            # and the browser loads them itself
+            self.assertEqual(variant_url(source, 'thumb'), source)
+
+    def test_allowed_host_gets_variant(self):
+        self.assertTrue(variant_url(self.url('/ok'), 'thumb')
+                        .startswith('/images/thumb/'))
+
+    def test_redirect_not_followed(self):
+        with self.assertRaises(ImageSourceError):
+            read_source(self.url('/redirect'))
+
+    def test_size_cap(self):
+        with self.assertRaises(ImageSourceError):
+            read_source(self.url('/huge'))
+
+
+class PublicAddressTestCase(TestCase):
+    """Test the resolved-address checks."""
+
+    def check(self, *addresses):
+        with mock.patch('socket.getaddrinfo',
+                        lambda *args, **kwargs: addrinfo(*addresses)):
+            return public_address('images.test', 80)
+
+    def test_public(self):
+        self.assertEqual(self.check('93.184.216.34'), '93.184.216.34')
+
+    def test_internal_rejected(self):
+        for address in ('127.0.0.1', '10.0.0.5', '192.168.1.1',
+                        '169.254.169.254', '::1', 'fe80::1', '::ffff:10.0.0.1',
+                        '0.0.0.0'):
+            with self.assertRaises(ValueError, msg=address):
+                self.check(address)
+
+    def test_any_internal_rejected(self):
+        with self.assertRaises(ValueError):
+            self.check('93.184.216.34', '10.0.0.5')
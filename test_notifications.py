@@ -0,0 +1,127 @@
+"""Notification rollup tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_notifications.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase, mock
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+from app import create_app  # noqa: E402
+from models import db, Message, Notification, NotificationActor, User  # noqa: E402
+from notifications import (bucket_start, notifications_page, notify_follow,  # noqa: E402
+                           notify_like, retract_like)
+
+app = create_app('testing')
+
+
+def at(when):
+    """Patch the notifications clock to `when`."""
+
+    clock = mock.Mock(wraps=datetime)
+    clock.utcnow.return_value = when
+    return mock.patch('notifications.datetime', clock)
+
+
+class NotificationsTestCase(TestCase):
+    """Test rollups and the feed's pagination."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        # don't inherit an aborted transaction from another module's test
+        db.session.rollback()
+        db.create_all()
+
+        for model in (NotificationActor, Notification, Message, User):
+            model.query.delete()
+
+        self.users = [User(username=f"user{i}", email=f"user{i}@test.com",
+                           password="x", location="test")
+                      for i in range(4)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+        self.message = Message(text="a warble worth liking")
+        self.users[0].messages.append(self.message)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_bucket_start(self):
+        self.assertEqual(bucket_start(datetime(2019, 3, 4, 17, 5), 24),
+                         datetime(2019, 3, 4))
+        self.assertEqual(bucket_start(datetime(2019, 3, 4, 17, 5), 6),
+                         datetime(2019, 3, 4, 12))
+
+    def test_likes_roll_up(self):
+        owner, *likers = self.users
+        for liker in likers:
+            notify_like(liker, self.message)
+
+        [rollup] = Notification.query.filter_by(recipient_id=owner.id).all()
+
+        self.assertEqual(rollup.actor_count, 3)
+        self.assertEqual(rollup.subject_id, self.message.id)
+        self.assertEqual(rollup.last_actor_username, likers[-1].username)
+        self.assertEqual(rollup.excerpt, self.message.text)
+
+    def test_own_likes_ignored(self):
+        notify_like(self.users[0], self.message)
+
+        self.assertEqual(Notification.query.count(), 0)
+
+    def test_retract(self):
+        owner, first, second, _ = self.users
+        notify_like(first, self.message)
+        notify_like(second, self.message)
+
+        retract_like(second, self.message)
+        rollup = Notification.query.one()
+        self.assertEqual(rollup.actor_count, 1)
+        self.assertIsNone(rollup.last_actor_id)
+
+        retract_like(first, self.message)
+        self.assertEqual(Notification.query.count(), 0)
+
+    def test_retract_from_earlier_bucket(self):
+        owner, first, second, _ = self.users
+        with at(datetime(2019, 3, 4, 23, 50)):
+            notify_like(first, self.message)
+        with at(datetime(2019, 3, 5, 0, 10)):
+            notify_like(second, self.message)
+            retract_like(first, self.message)
+
+        [rollup] = Notification.query.all()
+        self.assertEqual(rollup.bucket, datetime(2019, 3, 5))
+        self.assertEqual(rollup.actor_count, 1)
+        self.assertEqual(rollup.last_actor_id, second.id)
+
+    def test_retract_uncounted(self):
+        owner, first, second, _ = self.users
+        notify_like(first, self.message)
+
+        retract_like(second, self.message)
+        notify_like(first, self.message)
+
+        rollup = Notification.query.one()
+        self.assertEqual(rollup.actor_count, 1)
+        self.assertEqual(rollup.last_actor_id, first.id)
+
+    def test_pagination(self):
+        owner, *actors = self.users
+        for actor in actors:
+            notify_follow(actor, owner)
+        notify_like(actors[0], self.message)
+
+        first, before = notifications_page(owner.id, per_page=1)
+        second, after = notifications_page(owner.id, before=before, per_page=1)
+
+        self.assertEqual([n.kind for n in first + second], ['like', 'follow'])
+        self.assertEqual(notifications_page(owner.id, before=after), ([], None))
@@ -0,0 +1,126 @@
+"""Message partition tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_partitions.py
+#
+# Postgres only: needs the partitioned tables from migrations/.
+
+
+import os
+from datetime import date, datetime
+from unittest import TestCase
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import create_app  # noqa: E402
+from migrate import apply_migrations  # noqa: E402
+from models import db, Likes, Message, User  # noqa: E402
+from partitions import (_archive_rows, add_months, check_partitions,  # noqa: E402
+                        default_rows, ensure_partitions, month_range,
+                        partition_months)
+from snowflake import id_floor  # noqa: E402
+
+app = create_app('testing')
+
+# far enough out that nothing has created it
+FUTURE = date(2031, 3, 1)
+
+
+class PartitionsTestCase(TestCase):
+    """Test the DEFAULT partition, ensure/check and archive reads."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = app.app_context()
+        cls.ctx.push()
+        apply_migrations()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.pop()
+
+    def setUp(self):
+        # don't inherit an aborted transaction from another module's test
+        db.session.rollback()
+
+        Likes.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.user = User(username="poster", email="poster@test.com",
+                         password="x", location="test")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+        # as archive_partition does: likes first, detach before dropping
+        failed = None
+        for parent in ('likes', 'messages'):
+            table = f"{parent}_p{FUTURE:%Y_%m}"
+            try:
+                if db.session.execute("SELECT to_regclass(:t)",
+                                      {'t': table}).scalar():
+                    db.session.execute(
+                        f"ALTER TABLE {parent} DETACH PARTITION {table}")
+                    db.session.execute(f"DROP TABLE {table}")
+                db.session.commit()
+            except Exception as exc:
+                # keep the session usable and try the other table anyway
+                db.session.rollback()
+                failed = failed or exc
+
+        if failed:
+            raise failed
+
+    def post(self, message_id):
+        msg = Message(text=f"warble {message_id}")
+        msg.id = message_id
+        self.user.messages.append(msg)
+        db.session.commit()
+        return msg
+
+    def test_month_helpers(self):
+        self.assertEqual(add_months(date(2018, 11, 1), 3), date(2019, 2, 1))
+        low, high = month_range(date(2018, 12, 1))
+        self.assertEqual(low, id_floor(datetime(2018, 12, 1)))
+        self.assertEqual(high, id_floor(datetime(2019, 1, 1)))
+
+    def test_insert_without_partition_lands_in_default(self):
+        low, _ = month_range(FUTURE)
+        msg = self.post(low + 1)
+        db.session.add(Likes(user_id=self.user.id, message_id=msg.id))
+        db.session.commit()
+
+        self.assertEqual(default_rows(), 1)
+        self.assertTrue(any("messages_default" in problem
+                            for problem in check_partitions()))
+
+        ensure_partitions(ahead=0, today=FUTURE)
+
+        self.assertEqual(default_rows(), 0)
+        self.assertIn(FUTURE, partition_months())
+        self.assertEqual(Message.query.get(msg.id).text, msg.text)
+        self.assertEqual(Likes.query.filter_by(message_id=msg.id).count(), 1)
+
+    def test_check_horizon(self):
+        ensure_partitions(ahead=1)
+        self.assertEqual(check_partitions(ahead=1), [])
+
+        [problem] = check_partitions(ahead=1, today=FUTURE)
+        self.assertIn("need through 2031-04", problem)
+
+    def test_archive_rows_in_batches(self):
+        ensure_partitions(ahead=0, today=FUTURE)
+        low, _ = month_range(FUTURE)
+        ids = [self.post(low + n).id for n in range(5)]
+        db.session.add(Likes(user_id=self.user.id, message_id=ids[2]))
+        db.session.commit()
+
+        rows = list(_archive_rows(FUTURE, batch_size=2))
+
+        self.assertEqual([row['id'] for row in rows], ids)
+        self.assertEqual([row['liked_by'] for row in rows],
+                         [[], [], [self.user.id], [], []])
@@ -0,0 +1,180 @@
+"""Query plan regression tests for the hot queries."""
+
+# run these tests like:
+#
+#    python -m unittest test_query_plans.py
+#
+# Each test EXPLAINs a query the app runs on every page view, against a
+# seeded test database with sequential scans discouraged. If an index the
+# query relies on goes missing, Postgres falls back to a Seq Scan anyway and
+# the test fails.
+
+
+import json
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+from app import create_app  # noqa: E402
+from migrate import apply_migrations  # noqa: E402
+from models import db, User, Message, Follows, Likes, FollowSuggestion  # noqa: E402
+from readmodels import message_query  # noqa: E402
+from snowflake import id_floor, next_id  # noqa: E402
+
+app = create_app('testing')
+
+NUM_USERS = 500
+MESSAGES_PER_USER = 20
+FOLLOWS_PER_USER = 30
+
+
+def seed():
+    """Fill the test database with enough rows for realistic plans."""
+
+    Likes.query.delete()
+    Follows.query.delete()
+    Message.query.delete()
+    FollowSuggestion.query.delete()
+    User.query.delete()
+    db.session.commit()
+
+    db.session.bulk_insert_mappings(User, [
+        dict(id=i, username=f"user{i}", email=f"user{i}@test.com",
+             password="HASHED_PASSWORD", location="testlocation")
+        for i in range(1, NUM_USERS + 1)
+    ])
+    # ids from the generator, so they land in this month's partition
+    message_ids = [next_id() for _ in range(NUM_USERS * MESSAGES_PER_USER)]
+    db.session.bulk_insert_mappings(Message, [
+        dict(id=message_ids[(u - 1) * MESSAGES_PER_USER + n], text="warble",
+             user_id=u)
+        for u in range(1, NUM_USERS + 1)
+        for n in range(MESSAGES_PER_USER)
+    ])
+    db.session.bulk_insert_mappings(Follows, [
+        dict(user_following_id=u,
+             user_being_followed_id=(u + n) % NUM_USERS + 1)
+        for u in range(1, NUM_USERS + 1)
+        for n in range(1, FOLLOWS_PER_USER + 1)
+    ])
+    db.session.bulk_insert_mappings(Likes, [
+        dict(user_id=u, message_id=message_ids[m])
+        for u in range(1, NUM_USERS + 1)
+        for m in range(u, NUM_USERS * MESSAGES_PER_USER, NUM_USERS // 5)
+    ])
+    db.session.commit()
+
+    # an old, empty month that recent-window queries should never touch
+    db.session.execute("SELECT warbler_month_partition('2019-01-01')")
+    db.session.commit()
+
+    db.session.execute("ANALYZE")
+    db.session.commit()
+
+
+def plan_nodes(plan):
+    """Yield every node of a JSON EXPLAIN plan, depth first."""
+
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+class QueryPlanTestCase(TestCase):
+    """EXPLAIN each hot query and reject sequential scans."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = app.app_context()
+        cls.ctx.push()
+        apply_migrations()
+        seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.pop()
+
+    def explain(self, query):
+        """Return the list of plan nodes Postgres picks for `query`."""
+
+        sql = str(query.statement.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={'literal_binds': True}))
+
+        try:
+            db.session.execute("SET LOCAL enable_seqscan = off")
+            [(plan,)] = db.session.execute(
+                "EXPLAIN (FORMAT JSON) " + sql).fetchall()
+        finally:
+            db.session.rollback()
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return list(plan_nodes(plan[0]['Plan']))
+
+    def assertNoSeqScan(self, query):
+        nodes = self.explain(query)
+        scans = [node['Relation Name'] for node in nodes
+                 if node['Node Type'] == 'Seq Scan']
+
+        self.assertEqual(scans, [], f"sequential scan in plan: {nodes}")
+
+    def test_user_timeline(self):
+        self.assertNoSeqScan(message_query(Message.user_id == 42)
+                             .order_by(Message.id.desc())
+                             .limit(100))
+
+    def test_home_timeline(self):
+        self.assertNoSeqScan(message_query()
+                             .order_by(Message.id.desc())
+                             .limit(100))
+
+    def test_timeline_window_prunes_old_partitions(self):
+        floor = id_floor(datetime.utcnow() - timedelta(days=30))
+        nodes = self.explain(Message
+                             .query
+                             .filter(Message.id >= floor)
+                             .order_by(Message.id.desc())
+                             .limit(100))
+        scanned = {node.get('Relation Name') for node in nodes}
+
+        self.assertNotIn('messages_p2019_01', scanned)
+
+    def test_has_liked_message(self):
+        self.assertNoSeqScan(Likes
+                             .query
+                             .filter_by(user_id=42, message_id=next_id()))
+
+    def test_message_likes(self):
+        self.assertNoSeqScan(Likes.query.filter_by(message_id=next_id()))
+
+    def test_following(self):
+        self.assertNoSeqScan(Follows
+                             .query
+                             .filter(Follows.user_following_id == 42))
+
+    def test_followers(self):
+        self.assertNoSeqScan(Follows
+                             .query
+                             .filter(Follows.user_being_followed_id == 42))
+
+    def test_thread_replies(self):
+        self.assertNoSeqScan(Message
+                             .query
+                             .filter(Message.original_message_id == 42)
+                             .order_by(Message.id)
+                             .limit(5))
+
+    def test_login_lookup(self):
+        self.assertNoSeqScan(User.query.filter_by(username="user42"))
+
+    def test_follow_suggestions(self):
+        self.assertNoSeqScan(FollowSuggestion
+                             .query
+                             .filter(FollowSuggestion.user_id == 42)
+                             .order_by(FollowSuggestion.rank))
@@ -0,0 +1,166 @@
+"""Rate limiting tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ratelimit.py
+
+
+from unittest import TestCase
+
+from flask import Flask
+
+from config import Config
+from ratelimit import (ConcurrencyLimiter, MemoryBackend, RateLimiter,
+                       init_rate_limiting, rate_limit)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryBackendTestCase(TestCase):
+    """Test the in-process token buckets."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.backend = MemoryBackend(clock=self.clock)
+
+    def test_burst_then_limited(self):
+        results = [self.backend.consume('k', rate=1, burst=3)[0]
+                   for _ in range(4)]
+
+        self.assertEqual(results, [True, True, True, False])
+
+    def test_retry_after(self):
+        for _ in range(2):
+            self.backend.consume('k', rate=0.5, burst=2)
+
+        allowed, retry_after = self.backend.consume('k', rate=0.5, burst=2)
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 2.0)
+
+    def test_refill(self):
+        for _ in range(3):
+            self.backend.consume('k', rate=1, burst=3)
+
+        self.clock.now = 2.0
+
+        self.assertTrue(self.backend.consume('k', rate=1, burst=3)[0])
+        self.assertTrue(self.backend.consume('k', rate=1, burst=3)[0])
+        self.assertFalse(self.backend.consume('k', rate=1, burst=3)[0])
+
+    def test_keys_are_independent(self):
+        self.backend.consume('a', rate=1, burst=1)
+
+        self.assertFalse(self.backend.consume('a', rate=1, burst=1)[0])
+        self.assertTrue(self.backend.consume('b', rate=1, burst=1)[0])
+
+
+    def test_refilled_buckets_are_dropped(self):
+        backend = MemoryBackend(clock=self.clock, sweep_seconds=10)
+        backend.consume('idle', rate=1, burst=3)
+        backend.consume('busy', rate=0.01, burst=3)
+
+        self.clock.now = 10.0
+        backend.consume('new', rate=1, burst=3)
+
+        # 'idle' refilled after 1s; 'busy' needs 100s
+        self.assertEqual(len(backend), 2)
+        self.assertEqual(set(backend._buckets), {'busy', 'new'})
+
+
+class RateLimiterTestCase(TestCase):
+    """Test budgets, counters and load shedding."""
+
+    def setUp(self):
+        self.limiter = RateLimiter(
+            backend=MemoryBackend(clock=FakeClock()),
+            budgets={'login': (1, 2, ('POST',))},
+            concurrency=ConcurrencyLimiter(2, wait=0))
+
+    def test_any_key_over_budget_limits(self):
+        self.limiter.check('login', ['ip:1', 'user:1'])
+        self.limiter.check('login', ['ip:1', 'user:1'])
+
+        # new IP, same user: the user's bucket is empty
+        self.assertIsNotNone(self.limiter.check('login', ['ip:2', 'user:1']))
+
+    def test_metrics(self):
+        self.limiter.check('login', ['ip:1'])
+        self.limiter.check('login', ['ip:1'])
+        self.limiter.check('login', ['ip:1'])
+
+        metrics = self.limiter.metrics()
+
+        self.assertIn('route="login",result="allowed"} 2', metrics)
+        self.assertIn('route="login",result="limited"} 1', metrics)
+
+    def test_concurrency_limit(self):
+        concurrency = self.limiter.concurrency
+
+        self.assertTrue(concurrency.acquire())
+        self.assertTrue(concurrency.acquire())
+        self.assertFalse(concurrency.acquire())
+
+        concurrency.release()
+
+        self.assertTrue(concurrency.acquire())
+        self.assertEqual(concurrency.in_flight, 2)
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(RATE_LIMITS={'login': (1, 1, ('POST',))}, **config)
+    init_rate_limiting(app)
+
+    @app.route('/login', methods=['POST'])
+    @rate_limit('login')
+    def login():
+        return 'ok'
+
+    return app
+
+
+class AppTestCase(TestCase):
+    """Test client addresses and the /metrics endpoint."""
+
+    def test_clients_behind_proxy(self):
+        client = make_app(TRUSTED_PROXIES=1).test_client()
+
+        for ip in ('1.1.1.1', '2.2.2.2'):
+            resp = client.post('/login', headers={'X-Forwarded-For': ip})
+            self.assertEqual(resp.status_code, 200)
+
+        resp = client.post('/login', headers={'X-Forwarded-For': '1.1.1.1'})
+        self.assertEqual(resp.status_code, 429)
+
+    def test_forwarded_for_ignored_by_default(self):
+        client = make_app().test_client()
+
+        client.post('/login', headers={'X-Forwarded-For': '1.1.1.1'})
+        resp = client.post('/login', headers={'X-Forwarded-For': '2.2.2.2'})
+
+        self.assertEqual(resp.status_code, 429)
+
+    def test_metrics_need_token(self):
+        client = make_app(METRICS_TOKEN='s3cret').test_client()
+
+        self.assertEqual(client.get('/metrics').status_code, 404)
+        self.assertEqual(client.get('/metrics', headers={
+            'Authorization': 'Bearer wrong'}).status_code, 404)
+
+        resp = client.get('/metrics',
+                          headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'warbler_requests_in_flight', resp.data)
+
+    def test_metrics_off_without_token(self):
+        client = make_app().test_client()
+
+        self.assertEqual(client.get('/metrics').status_code, 404)
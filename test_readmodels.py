@@ -0,0 +1,78 @@
+"""Read-model card tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_readmodels.py
+
+
+import os
+from unittest import TestCase
+
+os.environ.setdefault('DATABASE_URL', "postgresql:///warbler-test")
+
+from app import create_app  # noqa: E402
+from models import db, Message, User  # noqa: E402
+from readmodels import (message_card, message_cards, message_query,  # noqa: E402
+                        user_cards_by_ids, user_profile)
+
+app = create_app('testing')
+
+
+class ReadModelsTestCase(TestCase):
+    """Test that cards carry what the templates read."""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        Message.query.delete()
+        User.query.delete()
+
+        self.author = User(username="author", email="author@test.com",
+                           password="x", location="test")
+        self.reposter = User(username="reposter", email="reposter@test.com",
+                             password="x", location="test")
+        db.session.add_all([self.author, self.reposter])
+        db.session.commit()
+
+        self.original = Message(text="the original")
+        self.author.messages.append(self.original)
+        db.session.commit()
+        self.repost = Message.repost(self.reposter, self.original)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_message_card(self):
+        card = message_card(self.original.id)
+
+        self.assertEqual(card.text, "the original")
+        self.assertEqual(card.user.username, "author")
+        self.assertIs(card.content, card)
+        self.assertFalse(hasattr(card, '__dict__'))
+
+    def test_repost_shows_original(self):
+        [card] = message_cards(message_query(Message.id == self.repost.id))
+
+        self.assertEqual(card.user.username, "reposter")
+        self.assertEqual(card.content.id, self.original.id)
+        self.assertEqual(card.content.user.username, "author")
+
+    def test_missing_message(self):
+        self.assertIsNone(message_card(1))
+
+    def test_user_cards_keep_order(self):
+        ids = [self.reposter.id, 0, self.author.id]
+
+        self.assertEqual([card.username for card in user_cards_by_ids(ids)],
+                         ["reposter", "author"])
+
+    def test_profile_counts(self):
+        profile = user_profile(self.reposter.id)
+
+        self.assertEqual(profile.messages_count, 1)
+        self.assertEqual(profile.followers_count, 0)
+        self.assertIsNone(user_profile(0))
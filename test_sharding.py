@@ -0,0 +1,191 @@
+"""Shard router tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_sharding.py
+#
+# By default the shards are SQLite files in a temp directory. To run against
+# real databases, list at least three (empty) ones:
+#
+#    SHARD_TEST_URLS=postgresql:///shard0,postgresql:///shard1,postgresql:///shard2 \
+#        python -m unittest test_sharding.py
+
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from columnar import stream_shard_columns
+from sharding import ShardRouter, follows, likes, metadata, reshard, shard_index
+
+
+def shard_urls(directory, count):
+    urls = os.environ.get('SHARD_TEST_URLS')
+    if urls:
+        return urls.split(',')[:count]
+    return [f"sqlite:///{directory}/shard{n}.db" for n in range(count)]
+
+
+def rows_on(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(table.select()).fetchall()
+
+
+class ShardRouterTestCase(TestCase):
+    """Test placement, scatter-gather reads and resharding."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.urls = shard_urls(self.dir, 3)
+        self.router = ShardRouter.from_urls(self.urls[:2])
+        for engine in ShardRouter.from_urls(self.urls).engines:
+            metadata.drop_all(engine)
+        self.router.create_tables()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_edges_live_on_the_actors_shard(self):
+        for follower in range(1, 11):
+            self.router.follow(follower, 100)
+            self.router.like(follower, 5000)
+
+        for n, engine in enumerate(self.router.engines):
+            for row in rows_on(engine, follows):
+                self.assertEqual(shard_index(row.user_following_id, 2), n)
+            for row in rows_on(engine, likes):
+                self.assertEqual(shard_index(row.user_id, 2), n)
+
+        # and both shards got some
+        self.assertTrue(all(rows_on(e, follows) for e in self.router.engines))
+
+    def test_follow_unfollow(self):
+        self.assertTrue(self.router.follow(1, 2))
+        self.assertFalse(self.router.follow(1, 2))
+        self.assertTrue(self.router.is_following(1, 2))
+        self.assertFalse(self.router.is_following(2, 1))
+        self.assertEqual(self.router.following_ids(1), [2])
+
+        self.assertTrue(self.router.unfollow(1, 2))
+        self.assertFalse(self.router.is_following(1, 2))
+
+    def test_scatter_gather_reverse_lookups(self):
+        for follower in range(1, 21):
+            self.router.follow(follower, 100)
+        for liker in (3, 4, 5):
+            self.router.like(liker, 5000)
+
+        self.assertEqual(self.router.follower_ids(100), list(range(1, 21)))
+        self.assertEqual(self.router.followers_among(100, [2, 7, 42]), {2, 7})
+        self.assertEqual(self.router.follower_counts([100, 101]), {100: 20})
+        self.assertEqual(self.router.liker_ids(5000), [3, 4, 5])
+        self.assertEqual(self.router.like_counts([5000])[5000], 3)
+
+    def test_likes(self):
+        self.assertTrue(self.router.like(1, 5000))
+        self.assertFalse(self.router.like(1, 5000))
+        self.assertTrue(self.router.has_liked(1, 5000))
+        self.assertEqual(self.router.liked_message_ids(1), [5000])
+
+        self.router.unlike(1, 5000)
+
+        self.assertFalse(self.router.has_liked(1, 5000))
+
+    def test_keyset_streams(self):
+        for follower in range(1, 21):
+            self.router.follow(follower, 100)
+            self.router.follow(100, follower)
+        for message_id in (7000, 5000, 6000):
+            self.router.like(1, message_id)
+
+        # pages smaller than a shard's share, merged back in order
+        self.assertEqual(list(self.router.iter_follower_ids(100, page=3)),
+                         list(range(1, 21)))
+        self.assertEqual(list(self.router.iter_following_ids(100, page=3)),
+                         list(range(1, 21)))
+        self.assertEqual(list(self.router.iter_liked_message_ids(1, page=2)),
+                         [5000, 6000, 7000])
+
+    def test_likers_of(self):
+        for liker in (3, 4, 5):
+            self.router.like(liker, 5000)
+        self.router.like(3, 6000)
+
+        likers = self.router.likers_of([5000, 6000, 7000])
+
+        self.assertEqual(sorted(likers[5000]), [3, 4, 5])
+        self.assertEqual(likers[6000], [3])
+        self.assertNotIn(7000, likers)
+
+    def test_purge_user(self):
+        for user in range(1, 11):
+            self.router.follow(user, 100)
+            self.router.follow(100, user)
+            self.router.like(user, 5000)
+        self.router.like(100, 6000)
+        self.router.like(1, 7000)
+
+        self.router.purge_user(100, message_ids=[5000])
+
+        self.assertEqual(self.router.follower_ids(100), [])
+        self.assertEqual(self.router.following_ids(100), [])
+        self.assertEqual(self.router.liked_message_ids(100), [])
+        self.assertEqual(self.router.liker_ids(5000), [])
+        # everyone else's other edges stay
+        self.assertEqual(self.router.liker_ids(7000), [1])
+
+    def test_purge_messages(self):
+        for liker in (3, 4, 5):
+            self.router.like(liker, 5000)
+            self.router.like(liker, 5001)
+            self.router.like(liker, 6000)
+
+        self.router.purge_message(5000)
+        self.assertEqual(self.router.liker_ids(5000), [])
+        self.assertEqual(self.router.liker_ids(5001), [3, 4, 5])
+
+        self.router.purge_messages_between(5000, 6000)
+        self.assertEqual(self.router.liker_ids(5001), [])
+        self.assertEqual(self.router.liker_ids(6000), [3, 4, 5])
+
+    def test_insert_many_and_clear(self):
+        self.router.insert_many(follows, [
+            dict(user_following_id=str(user), user_being_followed_id=100)
+            for user in range(1, 11)], 'user_following_id')
+
+        self.assertEqual(self.router.follower_ids(100), list(range(1, 11)))
+        self.assertTrue(self.router.is_following(7, 100))
+
+        self.router.clear()
+
+        self.assertEqual(self.router.follower_ids(100), [])
+
+    def test_stream_shard_columns(self):
+        for follower in range(1, 21):
+            self.router.follow(follower, 100)
+
+        followers, followed = stream_shard_columns(
+            self.router,
+            (follows.c.user_following_id, follows.c.user_being_followed_id),
+            ('int32', 'int32'), chunk_size=3)
+
+        self.assertEqual(sorted(followers.tolist()), list(range(1, 21)))
+        self.assertEqual(set(followed.tolist()), {100})
+
+    def test_reshard(self):
+        for user in range(1, 31):
+            self.router.follow(user, user + 1)
+            self.router.like(user, 5000 + user)
+
+        new = ShardRouter.from_urls(self.urls)
+        reshard(self.router, new, log=lambda line: None)
+
+        for n, engine in enumerate(new.engines):
+            for row in rows_on(engine, follows):
+                self.assertEqual(shard_index(row.user_following_id, 3), n)
+
+        self.assertEqual(sum(len(rows_on(e, follows)) for e in new.engines), 30)
+        self.assertEqual(sum(len(rows_on(e, likes)) for e in new.engines), 30)
+        self.assertTrue(new.is_following(17, 18))
+        self.assertEqual(new.liker_ids(5017), [17])
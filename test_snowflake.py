@@ -0,0 +1,79 @@
+"""Snowflake id tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_snowflake.py
+
+
+from datetime import datetime
+from unittest import TestCase
+
+from snowflake import (BACKFILL_WORKER_ID, EPOCH_MS, MAX_SEQUENCE,
+                       SnowflakeGenerator, backfill_ids, id_floor, parse_id,
+                       timestamp_of)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class SnowflakeGeneratorTestCase(TestCase):
+    """Test id layout and ordering."""
+
+    def setUp(self):
+        self.clock = FakeClock(EPOCH_MS + 1000)
+        self.generator = SnowflakeGenerator(worker_id=7, clock=self.clock)
+
+    def test_layout(self):
+        id_ = self.generator.next_id()
+
+        self.assertEqual(parse_id(id_), (1000, 7, 0))
+        self.assertEqual(timestamp_of(id_),
+                         datetime.utcfromtimestamp((EPOCH_MS + 1000) / 1000))
+
+    def test_increasing_within_a_millisecond(self):
+        ids = [self.generator.next_id() for _ in range(10)]
+
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(parse_id(ids[-1]), (1000, 7, 9))
+
+    def test_later_ms_sorts_after(self):
+        first = self.generator.next_id()
+        self.clock.now += 1
+
+        self.assertGreater(self.generator.next_id(), first)
+
+    def test_backfill_worker_reserved(self):
+        with self.assertRaises(ValueError):
+            SnowflakeGenerator(worker_id=BACKFILL_WORKER_ID)
+
+    def test_id_floor(self):
+        id_ = self.generator.next_id()
+        created = timestamp_of(id_)
+
+        self.assertLessEqual(id_floor(created), id_)
+
+
+class BackfillTestCase(TestCase):
+    """Test numbering of rows that predate snowflake ids."""
+
+    def test_same_timestamp_spills_into_later_ms(self):
+        when = datetime(2018, 6, 1)
+        ids = list(backfill_ids([when] * (MAX_SEQUENCE + 3)))
+
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(parse_id(ids[0])[1:], (BACKFILL_WORKER_ID, 0))
+        self.assertEqual(parse_id(ids[-1])[0], parse_id(ids[0])[0] + 1)
+
+    def test_keeps_order_and_never_predates_row(self):
+        times = [datetime(2018, 6, 2), datetime(2018, 6, 1),
+                 datetime(2018, 6, 3)]
+        ids = list(backfill_ids(times))
+
+        self.assertEqual(ids, sorted(ids))
+        for when, id_ in zip(times, ids):
+            self.assertGreaterEqual(id_, id_floor(when))
@@ -0,0 +1,48 @@
+"""Follow suggestion scoring tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_suggestions.py
+
+
+from unittest import TestCase
+
+import numpy as np
+
+from suggestions import build_adjacency, score_suggestions
+
+
+class SuggestionScoringTestCase(TestCase):
+    """Test the sparse friends-of-friends scoring (no database needed)."""
+
+    def setUp(self):
+        # 1 follows 2 and 3; 2 and 3 both follow 4; 3 follows 5;
+        # 4 is also followed by 6, 7 and 8, so it's the "popular" account
+        edges = [(1, 2), (1, 3), (2, 4), (3, 4), (3, 5),
+                 (6, 4), (7, 4), (8, 4), (5, 1)]
+        followers, followed = (np.array(col, dtype=np.int32)
+                               for col in zip(*edges))
+        self.adjacency = build_adjacency(followers, followed)
+
+    def test_mutual_counts(self):
+        [(user_id, suggested)] = score_suggestions(self.adjacency, [1])
+
+        self.assertEqual(user_id, 1)
+        self.assertEqual({c: m for c, m, _ in suggested}, {4: 2, 5: 1})
+
+    def test_excludes_self_and_already_followed(self):
+        [(_, suggested)] = score_suggestions(self.adjacency, [3])
+
+        # 3 -> 5 -> 1 is a suggestion, 3 -> 4 already followed, never 3 itself
+        self.assertEqual([c for c, _, _ in suggested], [1])
+
+    def test_top_n(self):
+        [(_, suggested)] = score_suggestions(self.adjacency, [1], top_n=1)
+
+        self.assertEqual(len(suggested), 1)
+
+    def test_no_candidates(self):
+        [(user_id, suggested)] = score_suggestions(self.adjacency, [8])
+
+        self.assertEqual(user_id, 8)
+        self.assertEqual(suggested, [])
@@ -0,0 +1,120 @@
+"""Reply thread tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_threads.py
+#
+# Postgres only: the thread query is a recursive CTE with LATERAL joins.
+
+
+import os
+from unittest import TestCase
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import create_app  # noqa: E402
+from migrate import apply_migrations  # noqa: E402
+from models import db, Likes, Message, User  # noqa: E402
+from threads import load_thread  # noqa: E402
+
+app = create_app('testing')
+
+
+class LoadThreadTestCase(TestCase):
+    """Test the shape of a loaded page and its "more replies" flags."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = app.app_context()
+        cls.ctx.push()
+        apply_migrations()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ctx.pop()
+
+    def setUp(self):
+        Likes.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.user = User(username="replier", email="replier@test.com",
+                         password="x", location="test")
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.root = self.post("root")
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def post(self, text, parent=None):
+        msg = Message(text=text,
+                      original_message_id=parent.id if parent else None)
+        self.user.messages.append(msg)
+        db.session.commit()
+        return msg
+
+    def replies(self, parent, count):
+        return [self.post(f"{parent.text}.{n}", parent) for n in range(count)]
+
+    def test_tree_order(self):
+        first, second = self.replies(self.root, 2)
+        [nested] = self.replies(first, 1)
+
+        page = load_thread(self.root.id)
+
+        self.assertEqual([node.id for node in page.nodes],
+                         [first.id, nested.id, second.id])
+        self.assertEqual([node.depth for node in page.nodes], [1, 2, 1])
+        self.assertEqual(page.nodes[1].parent_id, first.id)
+        self.assertIsNone(page.next_after)
+
+    def test_exactly_fanout_children_loaded(self):
+        [reply] = self.replies(self.root, 1)
+        self.replies(reply, 3)
+
+        page = load_thread(self.root.id, fanout=3)
+
+        self.assertEqual(len(page.nodes), 4)
+        self.assertFalse(page.nodes[0].has_more)
+
+    def test_more_than_fanout(self):
+        [reply] = self.replies(self.root, 1)
+        children = self.replies(reply, 4)
+
+        page = load_thread(self.root.id, fanout=3)
+
+        self.assertTrue(page.nodes[0].has_more)
+        self.assertEqual([node.id for node in page.nodes[1:]],
+                         [child.id for child in children[:3]])
+
+    def test_deeper_than_max_depth(self):
+        [reply] = self.replies(self.root, 1)
+        [child] = self.replies(reply, 1)
+        [leaf] = self.replies(child, 1)
+
+        page = load_thread(self.root.id, max_depth=2)
+
+        self.assertEqual([node.id for node in page.nodes], [reply.id, child.id])
+        self.assertTrue(page.nodes[1].has_more)
+
+        # re-rooting there shows the rest
+        self.assertEqual([node.id for node in load_thread(child.id).nodes],
+                         [leaf.id])
+
+    def test_reposts_are_not_replies(self):
+        Message.repost(self.user, self.root)
+        db.session.commit()
+
+        self.assertEqual(load_thread(self.root.id).nodes, [])
+
+    def test_pages(self):
+        replies = self.replies(self.root, 3)
+
+        page = load_thread(self.root.id, per_page=2)
+        self.assertEqual(page.next_after, replies[1].id)
+
+        page = load_thread(self.root.id, after=page.next_after, per_page=2)
+        self.assertEqual([node.id for node in page.nodes], [replies[2].id])
+        self.assertIsNone(page.next_after)
@@ -20,7 +20,10 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
 
 # Now we can import app
 
-from app import app
+from app import create_app
+from sharding import get_router
+
+app = create_app('testing')
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -56,7 +59,8 @@ class UserModelTestCase(TestCase):
 
         # User should have no messages & no followers
         self.assertEqual(len(u.messages), 0)
-        self.assertEqual(len(u.followers), 0)
+        with app.app_context():
+            self.assertEqual(u.followers_count, 0)
 
 
     def test_repr(self):
@@ -67,25 +71,33 @@ class UserModelTestCase(TestCase):
         self.assertEqual(repr(user), expected_repr)
 
 
+    def make_users(self):
+        users = [User(username=f"user{n}", email=f"user{n}@test.com",
+                      password="HASHED_PASSWORD", location='testlocation')
+                 for n in (1, 2)]
+        db.session.add_all(users)
+        db.session.commit()
+        return users
+
     def test_is_following(self):
-        self.user1 = User()
-        self.user2 = User()
+        user1, user2 = self.make_users()
 
-        self.user2.followers.append(self.user1)
-        db.session.commit()
+        with app.app_context():
+            get_router().follow(user1.id, user2.id)
 
-        self.assertTrue(self.user1.is_following(self.user2))
+            self.assertTrue(user1.is_following(user2))
+            self.assertFalse(user2.is_following(user1))
 
-        
     def test_followed_by(self):
-        self.user1 = User()
-        self.user2 = User()
+        user1, user2 = self.make_users()
 
-        self.user1.following.append(self.user2)
-        self.user2.following.append(self.user1)
+        with app.app_context():
+            get_router().follow(user1.id, user2.id)
 
-        self.user1.following.append(self.user2)
-        self.user2.following.append(self.user1)
+            self.assertTrue(user2.is_followed_by(user1))
+            self.assertFalse(user1.is_followed_by(user2))
+            self.assertEqual(user2.followers_count, 1)
+            self.assertEqual(user1.following_count, 1)
 
     def test_user_signup(self):
         u = User.signup(
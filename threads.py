@@ -0,0 +1,104 @@
+"""Reply threads loaded with one recursive query.
+
+A thread page shows one message and a page of its direct replies, each with
+its own replies nested below, down to MAX_DEPTH levels and at most FANOUT
+children per message. Everything below the root comes back from a single
+recursive CTE (ordered by path, so it renders top to bottom), instead of
+walking `original_message_id` one lazy load at a time.
+
+Deeper or wider branches aren't loaded; those messages get a "more replies"
+link that re-roots the thread there. So the work per page is bounded by
+PER_PAGE * (1 + FANOUT + ... + FANOUT ** (MAX_DEPTH - 1)) rows, however
+viral the thread.
+"""
+
+from collections import namedtuple
+
+from models import db
+
+PER_PAGE = 20
+MAX_DEPTH = 3
+FANOUT = 5
+
+ThreadNode = namedtuple('ThreadNode', [
+    'id', 'parent_id', 'depth', 'text', 'timestamp',
+    'user_id', 'username', 'image_url', 'has_more',
+])
+
+ThreadPage = namedtuple('ThreadPage', ['nodes', 'next_after'])
+
+THREAD_SQL = db.text("""
+WITH RECURSIVE thread (id, parent_id, depth, path, extra) AS (
+    SELECT page.id, page.original_message_id, 1, ARRAY[page.id], false
+    FROM (
+        SELECT r.id, r.original_message_id
+        FROM messages r
+        WHERE r.original_message_id = :root_id
+          AND NOT r.is_repost
+          AND r.id > :after
+        ORDER BY r.id
+        LIMIT :per_page
+    ) page
+
+    UNION ALL
+
+    SELECT child.id, child.original_message_id, t.depth + 1, t.path || child.id,
+           child.n > :fanout
+    FROM thread t
+    CROSS JOIN LATERAL (
+        -- one past the fanout: if it exists, the parent has more replies
+        SELECT r.id, r.original_message_id, row_number() OVER (ORDER BY r.id) AS n
+        FROM messages r
+        WHERE r.original_message_id = t.id
+          AND NOT r.is_repost
+        ORDER BY r.id
+        LIMIT :fanout + 1
+    ) child
+    WHERE t.depth < :max_depth
+      AND NOT t.extra
+)
+SELECT t.id, t.parent_id, t.depth, t.extra, m.text, m.timestamp,
+       u.id AS user_id, u.username, u.image_url,
+       t.depth = :max_depth AND EXISTS (
+           SELECT 1 FROM messages r
+           WHERE r.original_message_id = t.id AND NOT r.is_repost
+       ) AS has_children
+FROM thread t
+JOIN messages m ON m.id = t.id
+JOIN users u ON u.id = m.user_id
+ORDER BY t.path
+""")
+
+
+def load_thread(root_id, after=0, per_page=PER_PAGE, max_depth=MAX_DEPTH,
+                fanout=FANOUT):
+    """Load one page of the reply tree under message `root_id`.
+
+    `after` is the id of the last direct reply on the previous page. A node's
+    `has_more` is set when it has replies this page didn't load.
+    """
+
+    # replies are newer than what they reply to, and ids are time-ordered:
+    # starting past root_id lets Postgres skip older partitions
+    after = max(after, root_id)
+
+    rows = db.session.execute(THREAD_SQL, dict(
+        root_id=root_id, after=after, per_page=per_page,
+        max_depth=max_depth, fanout=fanout)).fetchall()
+
+    # the extra (fanout + 1)th children only flag their parents
+    overflowing = {row.parent_id for row in rows if row.extra}
+
+    nodes = [
+        ThreadNode(id=row.id, parent_id=row.parent_id, depth=row.depth,
+                   text=row.text, timestamp=row.timestamp,
+                   user_id=row.user_id, username=row.username,
+                   image_url=row.image_url,
+                   has_more=row.has_children or row.id in overflowing)
+        for row in rows if not row.extra
+    ]
+
+    top_level = [node.id for node in nodes if node.depth == 1]
+    next_after = top_level[-1] if len(top_level) == per_page else None
+
+    return ThreadPage(nodes=nodes, next_after=next_after)
@@ -0,0 +1,12 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built and warmed at import. With gunicorn's preload_app that
+happens once in the master, and forked workers share the result.
+"""
+
+from app import create_app, warm_up
+
+app = create_app('production')
+warm_up(app)